@@ -1,18 +1,179 @@
 import hashlib
+import logging
+import os
+import pickle
+import threading
 import time
-from typing import Dict, List
+from typing import Any, Dict, List, Tuple
 
+from django.conf import settings
 from django.core.cache import caches
 from django.db.models import Model
 
+#: The Redis pub/sub channel namespace invalidations are broadcast on
+INVALIDATION_CHANNEL = 'pretix_cache_invalidate'
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """
+    A small, process-local key-value store with a per-entry time to live, used as a first
+    tier in front of the shared cache.
+
+    Just like the shared cache, it hands out a fresh copy of mutable values every time, so
+    callers can modify what they got without affecting other requests.
+    """
+    immutable_types = (type(None), bool, int, float, str, bytes)
+
+    def __init__(self, maxsize: int=10000):
+        self.maxsize = maxsize
+        self._data = {}
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            self._data.pop(key, None)
+            return False, None
+        return True, pickle.loads(entry[1]) if entry[2] else entry[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if len(self._data) >= self.maxsize:
+            self._evict()
+        pickled = not isinstance(value, self.immutable_types)
+        if pickled:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._data[key] = (time.monotonic() + ttl, value, pickled)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key, entry in list(self._data.items()):
+            if entry[0] < now:
+                self._data.pop(key, None)
+        if len(self._data) >= self.maxsize:
+            self._data.clear()
+
+
+class InvalidationListener:
+    """
+    Subscribes to the invalidation channel in a background thread and removes the namespace
+    generations that have been cleared in other processes from the local cache.
+    """
+
+    def __init__(self, local: LocalCache):
+        self.local = local
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self) -> None:
+        if not settings.HAS_REDIS or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads do not survive a fork, so every process starts its own listener
+            self._pid = os.getpid()
+            t = threading.Thread(target=self._run, name='pretix-cache-invalidation', daemon=True)
+            t.start()
+
+    def _run(self) -> None:
+        from django_redis import get_redis_connection
+
+        while True:
+            try:
+                pubsub = get_redis_connection("redis").pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything might have been cleared while we were not subscribed
+                self.local.clear()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.local.delete(message['data'].decode())
+            except Exception:
+                logger.exception('Cache invalidation listener failed, reconnecting.')
+                self.local.clear()
+                time.sleep(1)
+
+    @staticmethod
+    def publish(prefixkey: str) -> None:
+        if not settings.HAS_REDIS:
+            return
+        from django_redis import get_redis_connection
+
+        get_redis_connection("redis").publish(INVALIDATION_CHANNEL, prefixkey)
+
+
+class KeyEncoder:
+    """
+    Turns namespaced cache keys into keys that can be used with the cache backend. Keys that
+    exceed ``max_length`` are replaced by a hex digest of the key, as memcached has a length
+    limit. Subclasses implement ``digest``.
+    """
+    max_length = 200
+
+    def encode(self, key: str) -> str:
+        if len(key) > self.max_length:
+            return self.digest(key.encode('utf-8'))
+        return key
+
+    def digest(self, data: bytes) -> str:
+        raise NotImplementedError()  # NOQA
+
+
+class SHA256KeyEncoder(KeyEncoder):
+    def digest(self, data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+
+class Blake2KeyEncoder(KeyEncoder):
+    """
+    Uses BLAKE2b with a 16 byte digest, which is a lot cheaper to compute than SHA-256 and
+    still makes collisions practically impossible. Requires Python 3.6.
+    """
+
+    def digest(self, data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+default_key_encoder = Blake2KeyEncoder() if hasattr(hashlib, 'blake2b') else SHA256KeyEncoder()
+
+_local = LocalCache()
+_listener = InvalidationListener(_local)
+# The last namespace generation seen for each namespace. This is only used as a guess to fetch
+# the generation and the value in one round trip, so it does not need to be invalidated.
+_generation_hints = {}
+
 
 class NamespacedCache:
+    """
+    A cache that prefixes all keys with a namespace and a generation number stored in the
+    cache itself, so that all keys in the namespace can be invalidated at once by increasing
+    the generation.
+
+    If ``CACHE_LOCAL_TTL`` is set, generations and values are additionally kept in a
+    process-local cache for that many seconds. Calling ``clear()`` broadcasts the invalidation
+    to all processes through Redis, if Redis is configured, but other changes made by other
+    processes might only become visible after the local entries expired.
+    """
 
-    def __init__(self, prefixkey: str, cache: str='default'):
+    def __init__(self, prefixkey: str, cache: str='default', key_encoder: KeyEncoder=None):
         self.cache = caches[cache]
         self.prefixkey = prefixkey
+        self.local_ttl = settings.CACHE_LOCAL_TTL
+        self.key_encoder = key_encoder or default_key_encoder
 
-    def _prefix_key(self, original_key: str) -> str:
+    def _get_prefix(self) -> int:
+        if self.local_ttl:
+            hit, prefix = _local.get(self.prefixkey)
+            if hit:
+                return prefix
         # Race conditions can happen here, but should be very very rare.
         # We could only handle this by going _really_ lowlevel using
         # memcached's `add` keyword instead of `set`.
@@ -22,14 +183,24 @@ class NamespacedCache:
         if prefix is None:
             prefix = int(time.time())
             self.cache.set(self.prefixkey, prefix)
-        key = '%s:%d:%s' % (self.prefixkey, prefix, original_key)
-        if len(key) > 200:  # Hash long keys, as memcached has a length limit
-            # TODO: Use a more efficient, non-cryptographic hash algorithm
-            key = hashlib.sha256(key.encode("UTF-8")).hexdigest()
-        return key
+        self._remember_prefix(prefix)
+        return prefix
+
+    def _remember_prefix(self, prefix: int) -> None:
+        _generation_hints[self.prefixkey] = prefix
+        if self.local_ttl:
+            _local.set(self.prefixkey, prefix, self.local_ttl)
+            _listener.ensure_running()
 
-    def _strip_prefix(self, key: str) -> str:
-        return key.split(":", 2 + self.prefixkey.count(":"))[-1]
+    def _build_key(self, prefix: int, original_key: str) -> str:
+        return self.key_encoder.encode('%s:%d:%s' % (self.prefixkey, prefix, original_key))
+
+    def _prefix_key(self, original_key: str) -> str:
+        return self._build_key(self._get_prefix(), original_key)
+
+    def _set_local(self, key: str, value: Any, timeout: int=None) -> None:
+        if self.local_ttl:
+            _local.set(key, value, min(self.local_ttl, timeout) if timeout else self.local_ttl)
 
     def clear(self) -> None:
         try:
@@ -37,37 +208,104 @@ class NamespacedCache:
         except ValueError:
             prefix = int(time.time())
             self.cache.set(self.prefixkey, prefix)
+        _local.delete(self.prefixkey)
+        if self.local_ttl:
+            InvalidationListener.publish(self.prefixkey)
 
     def set(self, key: str, value: str, timeout: int=3600):
-        return self.cache.set(self._prefix_key(key), value, timeout)
+        key = self._prefix_key(key)
+        self._set_local(key, value, timeout)
+        return self.cache.set(key, value, timeout)
+
+    def add(self, key: str, value: str, timeout: int=3600) -> bool:
+        key = self._prefix_key(key)
+        _local.delete(key)
+        return self.cache.add(key, value, timeout)
 
     def get(self, key: str) -> str:
-        return self.cache.get(self._prefix_key(key))
+        if self.local_ttl:
+            hit, prefix = _local.get(self.prefixkey)
+            if hit:
+                key = self._build_key(prefix, key)
+                hit, value = _local.get(key)
+                if not hit:
+                    value = self.cache.get(key)
+                    self._set_local(key, value)
+                return value
+
+        hint = _generation_hints.get(self.prefixkey)
+        if hint is not None:
+            # Fetch the namespace generation and the value for the last known generation
+            # at once. This saves a round trip unless the namespace has been cleared.
+            hinted_key = self._build_key(hint, key)
+            values = self.cache.get_many([self.prefixkey, hinted_key])
+            prefix = values.get(self.prefixkey)
+            if prefix == hint:
+                self._remember_prefix(hint)
+                value = values.get(hinted_key)
+                self._set_local(hinted_key, value)
+                return value
+            elif prefix is not None:
+                self._remember_prefix(prefix)
+                key = self._build_key(prefix, key)
+                value = self.cache.get(key)
+                self._set_local(key, value)
+                return value
+
+        key = self._prefix_key(key)
+        value = self.cache.get(key)
+        self._set_local(key, value)
+        return value
 
     def get_many(self, keys: List[str]) -> Dict[str, str]:
-        values = self.cache.get_many([self._prefix_key(key) for key in keys])
+        prefix = self._get_prefix()
+        # Encoded keys cannot be turned back into the original keys, so we keep track of them
+        keymap = {self._build_key(prefix, key): key for key in keys}
         newvalues = {}
-        for k, v in values.items():
-            newvalues[self._strip_prefix(k)] = v
+        missing = []
+        for key, original_key in keymap.items():
+            hit, value = _local.get(key) if self.local_ttl else (False, None)
+            if hit:
+                if value is not None:
+                    newvalues[original_key] = value
+            else:
+                missing.append(key)
+        if missing:
+            values = self.cache.get_many(missing)
+            for key in missing:
+                self._set_local(key, values.get(key))
+            for k, v in values.items():
+                newvalues[keymap[k]] = v
         return newvalues
 
     def set_many(self, values: Dict[str, str], timeout=3600):
-        newvalues = {}
-        for k, v in values.items():
-            newvalues[self._prefix_key(k)] = v
+        prefix = self._get_prefix()
+        newvalues = {self._build_key(prefix, k): v for k, v in values.items()}
+        for k, v in newvalues.items():
+            self._set_local(k, v, timeout)
         return self.cache.set_many(newvalues, timeout)
 
     def delete(self, key: str):  # NOQA
-        return self.cache.delete(self._prefix_key(key))
+        key = self._prefix_key(key)
+        _local.delete(key)
+        return self.cache.delete(key)
 
     def delete_many(self, keys: List[str]):  # NOQA
-        return self.cache.delete_many([self._prefix_key(key) for key in keys])
+        prefix = self._get_prefix()
+        keys = [self._build_key(prefix, key) for key in keys]
+        for key in keys:
+            _local.delete(key)
+        return self.cache.delete_many(keys)
 
     def incr(self, key: str, by: int=1):  # NOQA
-        return self.cache.incr(self._prefix_key(key), by)
+        key = self._prefix_key(key)
+        _local.delete(key)
+        return self.cache.incr(key, by)
 
     def decr(self, key: str, by: int=1):  # NOQA
-        return self.cache.decr(self._prefix_key(key), by)
+        key = self._prefix_key(key)
+        _local.delete(key)
+        return self.cache.decr(key, by)
 
     def close(self):  # NOQA
         pass
@@ -1,4 +1,6 @@
-from typing import Tuple
+import csv
+import io
+from typing import Iterable, Iterator, Tuple
 
 
 class BaseExporter:
@@ -67,5 +69,42 @@ class BaseExporter:
         ``form_data`` will not contain the model instance but only it's primary key (or
         a list of primary keys) for reasons of internal serialization when using background
         tasks.
+
+        If your exporter implements :py:meth:`stream` instead, you do not need to implement
+        this method.
         """
-        raise NotImplementedError()  # NOQA
+        if type(self).stream is BaseExporter.stream:
+            raise NotImplementedError()  # NOQA
+        filename, filetype, chunks = self.stream(form_data)
+        return filename, filetype, b''.join(chunks)
+
+    def stream(self, form_data: dict) -> Tuple[str, str, Iterable[bytes]]:
+        """
+        Like :py:meth:`render`, but the file content is returned as an iterable of ``bytes``
+        chunks, e.g. a generator. The chunks are consumed one after another and written to the
+        file storage directly, so an exporter that builds its chunks from ``.iterator()``
+        querysets can export any amount of data with constant memory usage.
+
+        The default implementation returns the result of :py:meth:`render` as a single chunk.
+        """
+        filename, filetype, data = self.render(form_data)
+        return filename, filetype, [data]
+
+
+def csv_chunks(rows: Iterable[list], chunk_size: int=500, **fmtparams) -> Iterator[bytes]:
+    """
+    Encodes the given rows as CSV and yields the result as UTF-8 encoded chunks of
+    ``chunk_size`` rows each. Additional keyword arguments are passed on to ``csv.writer``.
+    """
+    fmtparams.setdefault('quoting', csv.QUOTE_NONNUMERIC)
+    fmtparams.setdefault('delimiter', ',')
+    output = io.StringIO()
+    writer = csv.writer(output, **fmtparams)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % chunk_size == 0:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+    if output.tell():
+        yield output.getvalue().encode('utf-8')
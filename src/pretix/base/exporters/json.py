@@ -2,6 +2,9 @@ import json
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.dispatch import receiver
+from django.utils.translation import ugettext_lazy as _
+
+from pretix.helpers.database import chunked_iterator
 
 from ..exporter import BaseExporter
 from ..signals import register_data_exporters
@@ -10,90 +13,146 @@ from ..signals import register_data_exporters
 class JSONExporter(BaseExporter):
     identifier = 'json'
     verbose_name = 'JSON'
+    #: Number of orders that are loaded from the database and written to the file at once
+    chunk_size = 500
+
+    def _dumps(self, data):
+        return json.dumps(data, cls=DjangoJSONEncoder)
+
+    def _event_data(self):
+        return {
+            'name': str(self.event.name),
+            'slug': self.event.slug,
+            'organizer': {
+                'name': str(self.event.organizer.name),
+                'slug': self.event.organizer.slug
+            },
+            'categories': [
+                {
+                    'id': category.id,
+                    'name': str(category.name)
+                } for category in self.event.categories.all()
+            ],
+            'items': [
+                {
+                    'id': item.id,
+                    'name': str(item.name),
+                    'category': item.category_id,
+                    'price': item.default_price,
+                    'tax_rate': item.tax_rate,
+                    'admission': item.admission,
+                    'active': item.active,
+                    'variations': [
+                        {
+                            'id': variation.id,
+                            'active': variation.active,
+                            'price': variation.default_price if variation.default_price is not None else
+                            item.default_price,
+                            'name': str(variation)
+                        } for variation in item.variations.all()
+                    ]
+                } for item in self.event.items.all().prefetch_related('variations')
+            ],
+            'questions': [
+                {
+                    'id': question.id,
+                    'question': str(question.question),
+                    'type': question.type
+                } for question in self.event.questions.all()
+            ],
+            'quotas': [
+                {
+                    'id': quota.id,
+                    'size': quota.size,
+                    'items': [item.id for item in quota.items.all()],
+                    'variations': [variation.id for variation in quota.variations.all()],
+                } for quota in self.event.quotas.all().prefetch_related('items', 'variations')
+            ]
+        }
 
-    def render(self, form_data):
-        jo = {
-            'event': {
-                'name': str(self.event.name),
-                'slug': self.event.slug,
-                'organizer': {
-                    'name': str(self.event.organizer.name),
-                    'slug': self.event.organizer.slug
-                },
-                'categories': [
-                    {
-                        'id': category.id,
-                        'name': str(category.name)
-                    } for category in self.event.categories.all()
-                ],
-                'items': [
-                    {
-                        'id': item.id,
-                        'name': str(item.name),
-                        'category': item.category_id,
-                        'price': item.default_price,
-                        'tax_rate': item.tax_rate,
-                        'admission': item.admission,
-                        'active': item.active,
-                        'variations': [
-                            {
-                                'id': variation.id,
-                                'active': variation.active,
-                                'price': variation.default_price if variation.default_price is not None else
-                                item.default_price,
-                                'name': str(variation)
-                            } for variation in item.variations.all()
-                        ]
-                    } for item in self.event.items.all().prefetch_related('variations')
-                ],
-                'questions': [
-                    {
-                        'id': question.id,
-                        'question': str(question.question),
-                        'type': question.type
-                    } for question in self.event.questions.all()
-                ],
-                'orders': [
-                    {
-                        'code': order.code,
-                        'status': order.status,
-                        'user': order.email,
-                        'datetime': order.datetime,
-                        'payment_fee': order.payment_fee,
-                        'total': order.total,
-                        'positions': [
-                            {
-                                'id': position.id,
-                                'item': position.item_id,
-                                'variation': position.variation_id,
-                                'price': position.price,
-                                'attendee_name': position.attendee_name,
-                                'secret': position.secret,
-                                'answers': [
-                                    {
-                                        'question': answer.question_id,
-                                        'answer': answer.answer
-                                    } for answer in position.answers.all()
-                                ]
-                            } for position in order.positions.all()
-                        ]
-                    } for order in
-                    self.event.orders.all().prefetch_related('positions', 'positions__answers')
-                ],
-                'quotas': [
-                    {
-                        'id': quota.id,
-                        'size': quota.size,
-                        'items': [item.id for item in quota.items.all()],
-                        'variations': [variation.id for variation in quota.variations.all()],
-                    } for quota in self.event.quotas.all().prefetch_related('items', 'variations')
-                ]
-            }
+    def _order_data(self, order):
+        return {
+            'code': order.code,
+            'status': order.status,
+            'user': order.email,
+            'datetime': order.datetime,
+            'payment_fee': order.payment_fee,
+            'total': order.total,
+            'positions': [
+                {
+                    'id': position.id,
+                    'item': position.item_id,
+                    'variation': position.variation_id,
+                    'price': position.price,
+                    'attendee_name': position.attendee_name,
+                    'secret': position.secret,
+                    'answers': [
+                        {
+                            'question': answer.question_id,
+                            'answer': answer.answer
+                        } for answer in position.answers.all()
+                    ]
+                } for position in order.positions.all()
+            ]
         }
 
-        return 'pretixdata.json', 'application/json', json.dumps(jo, cls=DjangoJSONEncoder)
+    def _orders(self):
+        """
+        Yields lists of serialized orders of at most ``chunk_size`` elements.
+        """
+        qs = self.event.orders.order_by('pk').prefetch_related('positions', 'positions__answers')
+        chunk = []
+        for order in chunked_iterator(qs, self.chunk_size):
+            chunk.append(self._dumps(self._order_data(order)))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _chunks(self):
+        # All event data apart from the orders is small, but the orders are written one chunk
+        # after another into the "orders" list, such that they never need to be in memory at once
+        yield '{"event": {'
+        for key, value in self._event_data().items():
+            yield '{}: {}, '.format(self._dumps(key), self._dumps(value))
+        yield '"orders": ['
+        first = True
+        for chunk in self._orders():
+            yield ('' if first else ', ') + ', '.join(chunk)
+            first = False
+        yield ']}}'
+
+    def stream(self, form_data):
+        return 'pretixdata.json', 'application/json', (c.encode('utf-8') for c in self._chunks())
+
+
+class NDJSONExporter(JSONExporter):
+    """
+    Writes one JSON object per line and order, suitable for line-based processing.
+    """
+    identifier = 'ndjson'
+    verbose_name = _('Orders (newline-delimited JSON)')
+
+    def _order_data(self, order):
+        data = super()._order_data(order)
+        data['event'] = self.event.slug
+        data['organizer'] = self.event.organizer.slug
+        return data
+
+    def _chunks(self):
+        for chunk in self._orders():
+            yield '\n'.join(chunk) + '\n'
+
+    def stream(self, form_data):
+        return 'pretixorders.ndjson', 'application/x-ndjson', (c.encode('utf-8') for c in self._chunks())
 
 
 @receiver(register_data_exporters, dispatch_uid="exporter_json")
 def register_json_export(sender, **kwargs):
     return JSONExporter
+
+
+@receiver(register_data_exporters, dispatch_uid="exporter_ndjson")
+def register_ndjson_export(sender, **kwargs):
+    return NDJSONExporter
@@ -1,5 +1,3 @@
-import csv
-import io
 from collections import OrderedDict
 from decimal import Decimal
 
@@ -11,7 +9,7 @@ from django.utils.translation import ugettext as _
 
 from pretix.base.models import InvoiceAddress, Order, OrderPosition
 
-from ..exporter import BaseExporter
+from ..exporter import BaseExporter, csv_chunks
 from ..signals import register_data_exporters, register_payment_providers
 
 
@@ -32,6 +30,9 @@ class OrderListExporter(BaseExporter):
             ]
         )
 
+    #: Number of orders that are loaded and aggregated at once
+    chunk_size = 1000
+
     def _get_all_tax_rates(self, qs):
         tax_rates = set(
             qs.exclude(payment_fee=0).values_list('payment_fee_tax_rate', flat=True)
@@ -39,18 +40,34 @@ class OrderListExporter(BaseExporter):
         )
         tax_rates |= set(
             a for a
-            in OrderPosition.objects.filter(order__event=self.event)
+            in OrderPosition.objects.filter(order__in=qs)
                                     .values_list('tax_rate', flat=True).distinct().order_by()
         )
         tax_rates = sorted(tax_rates)
         return tax_rates
 
-    def render(self, form_data: dict):
-        output = io.StringIO()
+    def _get_tax_sums(self, orders):
+        """
+        Returns the sums of prices and taxes of the given orders' positions, grouped by order
+        and tax rate. This is called for one chunk of orders at a time to keep both the
+        aggregate and its result bounded.
+        """
+        return {
+            (o['order_id'], o['tax_rate']): o for o in
+            OrderPosition.objects.filter(order_id__in=[o.pk for o in orders]).values(
+                'tax_rate', 'order_id'
+            ).order_by().annotate(
+                taxsum=Sum('tax_value'), grosssum=Sum('price')
+            )
+        }
+
+    def stream(self, form_data: dict):
+        return 'orders.csv', 'text/csv', csv_chunks(self._rows(form_data))
+
+    def _rows(self, form_data: dict):
         tz = pytz.timezone(self.event.settings.timezone)
-        writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, delimiter=",")
 
-        qs = self.event.orders.all().select_related('invoice_address')
+        qs = self.event.orders.all()
         if form_data['paid_only']:
             qs = qs.filter(status=Order.STATUS_PAID)
         tax_rates = self._get_all_tax_rates(qs)
@@ -68,7 +85,7 @@ class OrderListExporter(BaseExporter):
                 _('Tax value at {rate} % tax').format(rate=tr),
             ]
 
-        writer.writerow(headers)
+        yield headers
 
         provider_names = {}
         responses = register_payment_providers.send(self.event)
@@ -76,14 +93,19 @@ class OrderListExporter(BaseExporter):
             provider = response(self.event)
             provider_names[provider.identifier] = provider.verbose_name
 
-        sum_cache = {
-            (o['order__id'], o['tax_rate']): o for o in
-            OrderPosition.objects.values('tax_rate', 'order__id').order_by().annotate(
-                taxsum=Sum('tax_value'), grosssum=Sum('price')
-            )
-        }
+        chunk = []
+        for order in qs.select_related('invoice_address').order_by('datetime').iterator():
+            chunk.append(order)
+            if len(chunk) >= self.chunk_size:
+                yield from self._chunk_rows(chunk, tax_rates, provider_names, tz)
+                chunk = []
+        if chunk:
+            yield from self._chunk_rows(chunk, tax_rates, provider_names, tz)
 
-        for order in qs.order_by('datetime'):
+    def _chunk_rows(self, orders, tax_rates, provider_names, tz):
+        sum_cache = self._get_tax_sums(orders)
+
+        for order in orders:
             row = [
                 order.code,
                 str(order.total),
@@ -112,19 +134,18 @@ class OrderListExporter(BaseExporter):
 
             for tr in tax_rates:
                 taxrate_values = sum_cache.get((order.id, tr), {'grosssum': Decimal('0.00'), 'taxsum': Decimal('0.00')})
+                grosssum, taxsum = taxrate_values['grosssum'], taxrate_values['taxsum']
                 if tr == order.payment_fee_tax_rate and order.payment_fee_tax_value:
-                    taxrate_values['grosssum'] += order.payment_fee
-                    taxrate_values['taxsum'] += order.payment_fee_tax_value
+                    grosssum += order.payment_fee
+                    taxsum += order.payment_fee_tax_value
 
                 row += [
-                    str(taxrate_values['grosssum']),
-                    str(taxrate_values['grosssum'] - taxrate_values['taxsum']),
-                    str(taxrate_values['taxsum']),
+                    str(grosssum),
+                    str(grosssum - taxsum),
+                    str(taxsum),
                 ]
 
-            writer.writerow(row)
-
-        return 'orders.csv', 'text/csv', output.getvalue().encode("utf-8")
+            yield row
 
 
 @receiver(register_data_exporters, dispatch_uid="exporter_orderlist")
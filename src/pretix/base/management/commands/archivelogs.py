@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.timezone import now
+
+from ...models import LogEntry, LogEntryArchive
+
+
+class Command(BaseCommand):
+    help = "Move old log entries into compressed archive batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, dest='days', required=True,
+                            help='Archive all log entries older than this number of days')
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=5000,
+                            help='Number of log entries per archive batch')
+
+    def handle(self, *args, **options):
+        cutoff = now() - timedelta(days=options['days'])
+        qs = LogEntry.objects.filter(datetime__lt=cutoff)
+        event_ids = qs.order_by().values_list('event_id', flat=True).distinct()
+
+        entries = batches = 0
+        for event_id in event_ids:
+            last_pk = 0
+            while True:
+                with transaction.atomic():
+                    chunk = list(
+                        qs.filter(event_id=event_id, pk__gt=last_pk).order_by('pk')[:options['batch_size']]
+                    )
+                    if not chunk:
+                        break
+                    LogEntryArchive.from_entries(chunk).save()
+                    LogEntry.objects.filter(pk__in=[e.pk for e in chunk]).delete()
+                last_pk = chunk[-1].pk
+                entries += len(chunk)
+                batches += 1
+
+        self.stdout.write('Archived {} log entries in {} batches.'.format(entries, batches))
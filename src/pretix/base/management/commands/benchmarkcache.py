@@ -0,0 +1,45 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+
+from pretix.helpers.benchmark import measure
+
+from ...cache import (
+    Blake2KeyEncoder, NamespacedCache, SHA256KeyEncoder, default_key_encoder,
+)
+
+
+class Command(BaseCommand):
+    help = "Measure the cost of encoding keys and of typical operations of the namespaced cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, dest='iterations', default=10000,
+                            help='Number of repetitions')
+
+    def _keys(self):
+        # Mimics the keys used with event caches: a few short, fixed keys and some long keys
+        # built from request parameters, which have to be hashed
+        keys = ['vouchers_exist', 'domain', 'statistics_obd_data', 'statistics_obp_data', 'statistics_rev_data']
+        keys += ['widget_{}_{}'.format(i, 'x' * 220) for i in range(5)]
+        return keys
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        keys = ['Event:1:1480000000:' + k for k in self._keys()]
+
+        encoders = [('sha256', SHA256KeyEncoder())]
+        if hasattr(hashlib, 'blake2b'):
+            encoders.append(('blake2b', Blake2KeyEncoder()))
+        for name, encoder in encoders:
+            duration = measure(lambda: [encoder.encode(k) for k in keys], iterations)
+            self.stdout.write('encode ({}): {:.2f} µs per key'.format(name, duration / len(keys) * 1000000))
+
+        cache = NamespacedCache('benchmark', key_encoder=default_key_encoder)
+        values = {k: k for k in self._keys()}
+        duration = measure(lambda: cache.set_many(values), iterations // 10 or 1)
+        self.stdout.write('set_many: {:.2f} µs per key'.format(duration / len(values) * 1000000))
+        duration = measure(lambda: cache.get_many(values.keys()), iterations // 10 or 1)
+        self.stdout.write('get_many: {:.2f} µs per key'.format(duration / len(values) * 1000000))
+        duration = measure(lambda: cache.get('vouchers_exist'), iterations // 10 or 1)
+        self.stdout.write('get: {:.2f} µs'.format(duration * 1000000))
+        cache.clear()
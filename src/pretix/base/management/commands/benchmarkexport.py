@@ -0,0 +1,57 @@
+import tracemalloc
+
+from django import forms
+from django.core.management.base import BaseCommand, CommandError
+
+from pretix.helpers.benchmark import Stopwatch
+
+from ...i18n import language
+from ...models import Event
+from ...signals import register_data_exporters
+
+
+class Command(BaseCommand):
+    help = "Measure run time and memory usage of a data exporter for an event"
+
+    def add_arguments(self, parser):
+        parser.add_argument('organizer', type=str, help='Slug of the organizer')
+        parser.add_argument('event', type=str, help='Slug of the event')
+        parser.add_argument('--exporter', type=str, dest='exporter', default='orderlistcsv',
+                            help='Identifier of the exporter to run')
+        parser.add_argument('--iterations', type=int, dest='iterations', default=3,
+                            help='Number of export runs')
+
+    def _initial(self, field):
+        # Mirror the serialization of the export form's data in the control view
+        if isinstance(field, forms.ModelMultipleChoiceField):
+            return [o.pk for o in field.initial] if field.initial is not None else []
+        if isinstance(field, forms.MultipleChoiceField):
+            return field.initial or []
+        return field.initial
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(organizer__slug=options['organizer'], slug=options['event'])
+        except Event.DoesNotExist:
+            raise CommandError('Event not found.')
+
+        for receiver, response in register_data_exporters.send(event):
+            ex = response(event)
+            if ex.identifier == options['exporter']:
+                break
+        else:
+            raise CommandError('Exporter not found.')
+
+        form_data = {k: self._initial(f) for k, f in ex.export_form_fields.items()}
+        with language(event.settings.locale):
+            for i in range(options['iterations']):
+                tracemalloc.start()
+                with Stopwatch() as sw:
+                    filename, filetype, chunks = ex.stream(form_data)
+                    size = sum(len(c) for c in chunks)
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                self.stdout.write('{}: {} orders, {} bytes in {:.2f} s, peak memory {:.1f} MB'.format(
+                    filename, event.orders.count(), size, sw.duration, peak / 1024 / 1024
+                ))
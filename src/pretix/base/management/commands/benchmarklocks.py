@@ -0,0 +1,75 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from pretix.helpers.benchmark import Stopwatch
+
+from ...services import locking
+
+
+class Command(BaseCommand):
+    help = "Measure lock and unlock latency of the available locking backends"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, dest='iterations', default=500,
+                            help='Number of lock/unlock cycles per thread')
+        parser.add_argument('--threads', type=int, dest='threads', default=1,
+                            help='Number of threads competing for the same lock')
+
+    def _backends(self):
+        backends = [('db', locking._acquire_db, locking._release_db)]
+        if connection.vendor == 'postgresql':
+            backends.append(('postgresql', locking._acquire_pg, locking._release_pg))
+        if settings.HAS_REDIS:
+            backends.append(('redis', locking._acquire_redis, locking._release_redis))
+        return backends
+
+    def _run(self, acquire, release, key, iterations, durations, failures):
+        for i in range(iterations):
+            with Stopwatch() as sw:
+                try:
+                    lock = acquire(key)
+                except locking.LockTimeoutException:
+                    failures.append(1)
+                    continue
+                release(lock)
+            durations.append(sw.duration)
+
+    def _run_thread(self, *args):
+        try:
+            self._run(*args)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        for name, acquire, release in self._backends():
+            key = 'benchmark-%s' % uuid.uuid4().hex[:8]
+            durations = []
+            failures = []
+            args = (acquire, release, key, options['iterations'], durations, failures)
+            with Stopwatch() as total:
+                if options['threads'] > 1:
+                    threads = [threading.Thread(target=self._run_thread, args=args) for i in range(options['threads'])]
+                    for t in threads:
+                        t.start()
+                    for t in threads:
+                        t.join()
+                else:
+                    self._run(*args)
+
+            if not durations:
+                self.stdout.write('{}: all {} attempts timed out'.format(name, len(failures)))
+                continue
+            durations.sort()
+            self.stdout.write(
+                '{}: {:.0f} cycles/s, mean {:.2f} ms, median {:.2f} ms, p99 {:.2f} ms, {} timeouts'.format(
+                    name, len(durations) / total.duration,
+                    sum(durations) / len(durations) * 1000,
+                    durations[len(durations) // 2] * 1000,
+                    durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000,
+                    len(failures)
+                )
+            )
@@ -0,0 +1,50 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from pretix.helpers.benchmark import measure
+
+from ...models import Event
+from ...settings import DEFAULTS
+
+
+def _get_unresolved(proxy, key, as_type=None):
+    # The lookup as it happened before settings snapshots were introduced: walk up the
+    # parents for every key and unserialize the value again on every call.
+    if as_type is None and key in DEFAULTS:
+        as_type = DEFAULTS[key]['type']
+    if key in proxy._cache():
+        value = proxy._cache()[key]
+    else:
+        value = None
+        if proxy._parent:
+            value = _get_unresolved(proxy._parent.settings, key, as_type=str)
+        if value is None and key in DEFAULTS:
+            value = DEFAULTS[key]['default']
+    return proxy._unserialize(value, as_type)
+
+
+class Command(BaseCommand):
+    help = "Measure the cost of reading event settings with and without the resolved settings snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('organizer', type=str, help='Slug of the organizer')
+        parser.add_argument('event', type=str, help='Slug of the event')
+        parser.add_argument('--iterations', type=int, dest='iterations', default=100,
+                            help='Number of reads of every setting')
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(organizer__slug=options['organizer'], slug=options['event'])
+        except Event.DoesNotExist:
+            raise CommandError('Event not found.')
+
+        # File settings are excluded, as opening the files would dominate the measurement
+        keys = [k for k, v in DEFAULTS.items() if v['type'] is not File]
+        proxy = event.settings
+        proxy.get(keys[0])  # Load the settings of all objects into memory
+
+        before = measure(lambda: [_get_unresolved(proxy, k) for k in keys], options['iterations']) / len(keys)
+        after = measure(lambda: [proxy.get(k) for k in keys], options['iterations']) / len(keys)
+        self.stdout.write('{} settings, per get: {:.2f} µs without snapshot, {:.2f} µs with snapshot'.format(
+            len(keys), before * 1000000, after * 1000000
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import Event, QuotaCounter
+from ...services.quotas import recompute_counter
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored quota counters from scratch and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, dest='event',
+                            help='Only recompute the quotas of the event with this ID')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Only report drift, do not store the recomputed values')
+
+    def handle(self, *args, **options):
+        events = Event.objects.all()
+        if options['event']:
+            events = events.filter(pk=options['event'])
+
+        drifted = 0
+        for event in events:
+            with transaction.atomic(), event.lock():
+                for quota in event.quotas.all():
+                    if options['dry_run']:
+                        try:
+                            counter = quota.counter
+                        except QuotaCounter.DoesNotExist:
+                            counter = QuotaCounter(quota=quota)
+                        drift = (counter.paid - quota.count_paid_orders(),
+                                 counter.pending - quota.count_pending_orders())
+                    else:
+                        drift = recompute_counter(quota)
+                    if any(drift):
+                        drifted += 1
+                        self.stdout.write(
+                            'Quota {} ({}) of event {}: paid drift {:+d}, pending drift {:+d}'.format(
+                                quota.pk, quota.name, event.slug, *drift
+                            )
+                        )
+
+        self.stdout.write('{} quota counters drifted.'.format(drifted))
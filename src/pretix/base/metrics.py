@@ -1,12 +1,111 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
 from django.conf import settings
 
 if settings.HAS_REDIS:
     import django_redis
     redis = django_redis.get_redis_connection("redis")
 
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = "pretix_metrics"
 REDIS_KEY_PREFIX = "pretix_metrics_"
 
 
+class MetricsBuffer(object):
+    """
+    Collects metric updates in the current process and writes them to Redis in a single
+    pipelined batch once ``METRICS_FLUSH_INTERVAL`` seconds have passed since the last
+    write, so that recording a metric does not cost a Redis round-trip. A background thread
+    flushes the buffer in the same interval, so updates of idle processes are not held back.
+
+    All series are stored as fields of one Redis hash.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._flusher_pid = None
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.increments = defaultdict(float)
+        self.values = {}
+        self.last_flush = time.time()
+
+    def _check_pid(self):
+        if self.pid != os.getpid():
+            # We have been forked, the pending updates belong to our parent
+            self._reset()
+
+    def inc(self, key, amount):
+        with self.lock:
+            self._check_pid()
+            if key in self.values:
+                self.values[key] += amount
+            else:
+                self.increments[key] += amount
+        self._ensure_flusher()
+        self.flush_if_due()
+
+    def set(self, key, value):
+        with self.lock:
+            self._check_pid()
+            self.increments.pop(key, None)
+            self.values[key] = value
+        self._ensure_flusher()
+        self.flush_if_due()
+
+    def _ensure_flusher(self):
+        if not settings.HAS_REDIS or not settings.METRICS_FLUSH_INTERVAL or self._flusher_pid == os.getpid():
+            return
+        with self.lock:
+            if self._flusher_pid == os.getpid():
+                return
+            # Threads do not survive a fork, so every process starts its own flusher
+            self._flusher_pid = os.getpid()
+            t = threading.Thread(target=self._run_flusher, name='pretix-metrics-flush', daemon=True)
+            t.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush_if_due()
+            except Exception:
+                logger.exception('Flushing metrics failed.')
+
+    def flush_if_due(self):
+        if time.time() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self._check_pid()
+            increments, values = self.increments, self.values
+            self.increments, self.values = defaultdict(float), {}
+            self.last_flush = time.time()
+
+        if not settings.HAS_REDIS or not (increments or values):
+            return
+
+        pipe = redis.pipeline(transaction=False)
+        for key, amount in increments.items():
+            pipe.hincrbyfloat(REDIS_KEY, key, amount)
+        if values:
+            pipe.hmset(REDIS_KEY, values)
+        pipe.execute()
+
+
+buffer = MetricsBuffer()
+atexit.register(buffer.flush)
+
+
 class Metric(object):
     """
     Base Metrics Object
@@ -34,7 +133,7 @@ class Metric(object):
         if len(labels) != len(self.labelnames):
             raise ValueError("Unknown labels used: {}".format(", ".join(set(labels) - set(self.labelnames))))
 
-    def _construct_metric_identifier(self, metricname, labels=None):
+    def _construct_metric_identifier(self, metricname, labels=None, labelnames=None):
         """
         Constructs the scrapable metricname usable in the output format.
         """
@@ -42,7 +141,7 @@ class Metric(object):
             return metricname
         else:
             named_labels = []
-            for labelname in self.labelnames:
+            for labelname in (labelnames or self.labelnames):
                 named_labels.append('{}="{}",'.format(labelname, labels[labelname]))
 
             return metricname + "{" + ",".join(named_labels) + "}"
@@ -53,7 +152,7 @@ class Metric(object):
         """
         rkey = REDIS_KEY_PREFIX + key
         if settings.HAS_REDIS:
-            redis.incrbyfloat(rkey, amount)
+            buffer.inc(rkey, amount)
 
     def _set_in_redis(self, key, value):
         """
@@ -61,7 +160,7 @@ class Metric(object):
         """
         rkey = REDIS_KEY_PREFIX + key
         if settings.HAS_REDIS:
-            redis.set(rkey, value)
+            buffer.set(rkey, value)
 
 
 class Counter(Metric):
@@ -124,21 +223,61 @@ class Gauge(Metric):
         self._inc_in_redis(fullmetric, amount * -1)
 
 
+class Histogram(Metric):
+    """
+    Histogram Metric Object
+    Histograms count observations in buckets of configurable size and keep track of the
+    number and the sum of all observations.
+    """
+
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+    def __init__(self, name, helpstring, labelnames=None, buckets=DEFAULT_BUCKETS):
+        if "le" in (labelnames or []):
+            raise ValueError("Histograms cannot have a label named 'le'.")
+        buckets = [float(b) for b in buckets]
+        if buckets != sorted(buckets):
+            raise ValueError("Buckets need to be in increasing order.")
+        if not buckets or buckets[-1] != float("inf"):
+            buckets.append(float("inf"))
+
+        super().__init__(name, helpstring, labelnames)
+        self.buckets = buckets
+
+    def observe(self, amount, **kwargs):
+        """
+        Stores an observation of the given amount for the labels specified in kwargs.
+        """
+        if amount < 0:
+            raise ValueError("Amount must be greater than zero.")
+
+        self._check_label_consistency(kwargs)
+
+        for bucket in self.buckets:
+            if amount <= bucket:
+                labels = dict(kwargs, le="+Inf" if bucket == float("inf") else str(bucket))
+                fullmetric = self._construct_metric_identifier(self.name + "_bucket", labels, self.labelnames + ["le"])
+                self._inc_in_redis(fullmetric, 1)
+
+        self._inc_in_redis(self._construct_metric_identifier(self.name + "_count", kwargs), 1)
+        self._inc_in_redis(self._construct_metric_identifier(self.name + "_sum", kwargs), amount)
+
+
 def metric_values():
     """
     Produces the scrapable textformat to be presented to the monitoring system
     """
     if not settings.HAS_REDIS:
-        return ""
+        return {}
+
+    buffer.flush()
 
     metrics = {}
 
-    for key in redis.scan_iter(match=REDIS_KEY_PREFIX + "*"):
+    for key, value in redis.hgetall(REDIS_KEY).items():
         dkey = key.decode("utf-8")
         _, _, output_key = dkey.split("_", 2)
-        value = float(redis.get(dkey).decode("utf-8"))
-
-        metrics[output_key] = value
+        metrics[output_key] = float(value.decode("utf-8"))
 
     return metrics
 
@@ -148,3 +287,21 @@ Provided metrics
 """
 http_requests_total = Counter("http_requests_total", "Total number of HTTP requests made.", ["code", "handler", "method"])
 # usage: http_requests_total.inc(code="200", handler="/foo", method="GET")
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "Duration of sampled HTTP requests.", ["handler"])
+http_request_db_queries = Histogram("http_request_db_queries", "Number of database queries of sampled HTTP requests.", ["handler"],
+                                    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+http_request_db_seconds = Histogram("http_request_db_seconds", "Time spent in the database during sampled HTTP requests.",
+                                    ["handler"])
+
+lock_wait_seconds = Histogram("lock_wait_seconds", "Time spent waiting for event or quota locks.", ["caller"])
+lock_hold_seconds = Histogram("lock_hold_seconds", "Time event or quota locks have been held.", ["caller"])
+lock_retries_total = Counter("lock_retries_total", "Total number of failed attempts to acquire a lock that have been retried.",
+                             ["event"])
+lock_timeouts_total = Counter("lock_timeouts_total", "Total number of times a lock could not be acquired.", ["event"])
+
+celery_task_duration_seconds = Histogram("celery_task_duration_seconds", "Execution time of background tasks.", ["task"])
+celery_task_queue_seconds = Histogram("celery_task_queue_seconds", "Time background tasks have been waiting in the queue.",
+                                      ["task"])
+celery_tasks_retried_total = Counter("celery_tasks_retried_total", "Total number of background task retries.", ["task"])
+celery_tasks_failed_total = Counter("celery_tasks_failed_total", "Total number of failed background task executions.",
+                                    ["task"])
@@ -1,8 +1,13 @@
-from collections import OrderedDict
+import logging
+import random
+import re
+import time
+from collections import OrderedDict, defaultdict
 
 import pytz
 from django.conf import settings
 from django.core.urlresolvers import get_script_prefix
+from django.db import connection
 from django.http import HttpRequest, HttpResponse
 from django.utils import timezone, translation
 from django.utils.cache import patch_vary_headers
@@ -13,6 +18,10 @@ from django.utils.translation.trans_real import (
     parse_accept_lang_header,
 )
 
+from pretix.base import metrics
+
+logger = logging.getLogger('pretix.base.middleware')
+
 _supported = None
 
 
@@ -186,3 +195,55 @@ class SecurityMiddleware(MiddlewareMixin):
                 dynamicdomain += " " + settings.SITE_URL
         resp['Content-Security-Policy'] = self._render_csp(h).format(static=staticdomain, dynamic=dynamicdomain)
         return resp
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the duration, the number of database queries and the time spent in the database
+    for a random sample of ``METRICS_REQUEST_SAMPLING`` percent of all requests, labelled
+    with the name of the URL pattern the request resolved to. Sampled requests taking
+    longer than ``SLOW_REQUEST_THRESHOLD`` seconds are logged together with the database
+    queries that have been executed most often.
+    """
+    _sql_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_REQUEST_SAMPLING / 100:
+            return self.get_response(request)
+
+        force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        connection.queries_log.clear()
+        starttime = time.time()
+        try:
+            response = self.get_response(request)
+        finally:
+            connection.force_debug_cursor = force_debug_cursor
+        duration = time.time() - starttime
+        queries = list(connection.queries_log)
+
+        match = getattr(request, 'resolver_match', None)
+        handler = match.view_name if match else 'unresolved'
+        db_time = sum(float(q['time']) for q in queries)
+        metrics.http_request_duration_seconds.observe(duration, handler=handler)
+        metrics.http_request_db_queries.observe(len(queries), handler=handler)
+        metrics.http_request_db_seconds.observe(db_time, handler=handler)
+
+        if settings.SLOW_REQUEST_THRESHOLD and duration > settings.SLOW_REQUEST_THRESHOLD:
+            logger.warning('Slow request to %s (%s): %.3fs, %d queries taking %.3fs. Most repeated queries:\n%s',
+                           request.path, handler, duration, len(queries), db_time, self._top_queries(queries))
+        return response
+
+    def _top_queries(self, queries, n=5):
+        grouped = defaultdict(lambda: [0, 0.0])
+        for q in queries:
+            g = grouped[self._sql_literals.sub('?', q['sql'])]
+            g[0] += 1
+            g[1] += float(q['time'])
+        return "\n".join(
+            '{}x, {:.3f}s: {}'.format(count, t, sql)
+            for sql, (count, t) in sorted(grouped.items(), key=lambda i: -i[1][0])[:n]
+        )
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def create_counters(apps, schema_editor):
+    Quota = apps.get_model('pretixbase', 'Quota')
+    QuotaCounter = apps.get_model('pretixbase', 'QuotaCounter')
+    OrderPosition = apps.get_model('pretixbase', 'OrderPosition')
+
+    for quota in Quota.objects.all():
+        lookup = (
+            Q(variation__isnull=True) & Q(item__quotas__in=[quota])
+        ) | Q(variation__quotas__in=[quota])
+        QuotaCounter.objects.create(
+            quota=quota,
+            paid=OrderPosition.objects.filter(lookup, order__status='p').values('id').distinct().count(),
+            pending=OrderPosition.objects.filter(lookup, order__status='n').values('id').distinct().count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0046_order_meta_info'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaCounter',
+            fields=[
+                ('quota', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                               related_name='counter', serialize=False, to='pretixbase.Quota')),
+                ('paid', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('pretixbase', '0047_quotacounter'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='logentry',
+            options={'ordering': ('-datetime', '-id')},
+        ),
+        migrations.AlterIndexTogether(
+            name='logentry',
+            index_together=set([('event', 'datetime'), ('content_type', 'object_id', 'datetime')]),
+        ),
+        migrations.CreateModel(
+            name='LogEntryArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField(db_index=True)),
+                ('count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                            to='pretixbase.Event')),
+            ],
+            options={
+                'ordering': ('-end',),
+            },
+        ),
+    ]
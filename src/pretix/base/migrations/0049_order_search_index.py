@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import DatabaseError, migrations, models, transaction
+
+
+def build_search_index(apps, schema_editor):
+    Order = apps.get_model('pretixbase', 'Order')
+    OrderPosition = apps.get_model('pretixbase', 'OrderPosition')
+
+    last_pk = 0
+    while True:
+        orders = list(Order.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'code', 'email')[:1000])
+        if not orders:
+            break
+        last_pk = orders[-1][0]
+
+        names = defaultdict(list)
+        positions = OrderPosition.objects.filter(
+            order_id__in=[o[0] for o in orders], attendee_name__isnull=False
+        ).exclude(attendee_name='').order_by('order_id', 'pk').values_list('order_id', 'attendee_name')
+        for order_id, name in positions:
+            names[order_id].append(name)
+
+        for pk, code, email in orders:
+            Order.objects.filter(pk=pk).update(
+                search_index='\n'.join([code or '', email or ''] + names[pk]).lower()
+            )
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            schema_editor.execute(
+                'CREATE INDEX pretixbase_order_search_index_trgm ON pretixbase_order '
+                'USING gin (search_index gin_trgm_ops)'
+            )
+    except DatabaseError:
+        # The extension is not available or we lack the permission to create it. Searching
+        # still works, it just has to scan the event's orders.
+        pass
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS pretixbase_order_search_index_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0048_logentry_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='search_index',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='order',
+            index_together=set([('event', 'datetime'), ('event', 'code')]),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -4,9 +4,9 @@ from .event import Event, EventLock, EventPermission, EventSetting
 from .invoices import Invoice, InvoiceLine, invoice_filename
 from .items import (
     Item, ItemCategory, ItemVariation, Question, QuestionOption, Quota,
-    itempicture_upload_to,
+    QuotaCounter, itempicture_upload_to,
 )
-from .log import LogEntry
+from .log import LogEntry, LogEntryArchive
 from .orders import (
     AbstractPosition, CachedTicket, CartPosition, InvoiceAddress, Order,
     OrderPosition, QuestionAnswer, generate_position_secret, generate_secret,
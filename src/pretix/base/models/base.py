@@ -1,8 +1,10 @@
 import json
+import threading
 import uuid
+from contextlib import contextmanager
 
 from django.contrib.contenttypes.fields import GenericRelation
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.utils.crypto import get_random_string
@@ -34,8 +36,55 @@ def cached_file_delete(sender, instance, **kwargs):
         instance.file.delete(False)
 
 
+_log_buffer = threading.local()
+
+
+@contextmanager
+def buffered_logging():
+    """
+    Within this context manager, log entries created by :py:meth:`LoggingMixin.log_action`
+    are not saved one by one, but collected and written with a single query when the block
+    is left. Blocks can be nested, the entries are written at the end of the outermost one.
+    Use this around code that logs many actions, e.g. within a transaction.
+    """
+    depth = getattr(_log_buffer, 'depth', 0)
+    if not depth:
+        _log_buffer.entries = []
+    _log_buffer.depth = depth + 1
+    try:
+        yield
+    except BaseException:
+        # The logged actions failed, so their entries are discarded, and we must not touch the
+        # database, since the exception might stem from an aborted transaction.
+        _log_buffer.depth = depth
+        if not depth:
+            _log_buffer.entries = []
+        raise
+    _log_buffer.depth = depth
+    if not depth:
+        entries, _log_buffer.entries = _log_buffer.entries, []
+        if entries and not transaction.get_connection().needs_rollback:
+            from .log import LogEntry
+
+            LogEntry.objects.bulk_create(entries)
+
+
 class LoggingMixin:
 
+    def _log_entry(self, action, data=None, user=None):
+        from .log import LogEntry
+        from .event import Event
+
+        event_id = None
+        if isinstance(self, Event):
+            event_id = self.pk
+        elif hasattr(self, 'event_id'):
+            event_id = self.event_id
+        l = LogEntry(content_object=self, user=user, action_type=action, event_id=event_id)
+        if data:
+            l.data = json.dumps(data, cls=I18nJSONEncoder)
+        return l
+
     def log_action(self, action, data=None, user=None):
         """
         Create a LogEntry object that is related to this object.
@@ -45,18 +94,23 @@ class LoggingMixin:
         :param data: Any JSON-serializable object
         :param user: The user performing the action (optional)
         """
+        l = self._log_entry(action, data, user)
+        if getattr(_log_buffer, 'depth', 0):
+            _log_buffer.entries.append(l)
+        else:
+            l.save()
+
+    @staticmethod
+    def bulk_log_action(objects, action, data=None, user=None):
+        """
+        Create the same kind of LogEntry for many objects at once, using a single query.
+        The parameters are the same as for :py:meth:`log_action`.
+
+        :param objects: An iterable of objects to attach the log entries to
+        """
         from .log import LogEntry
-        from .event import Event
 
-        event = None
-        if isinstance(self, Event):
-            event = self
-        elif hasattr(self, 'event'):
-            event = self.event
-        l = LogEntry(content_object=self, user=user, action_type=action, event=event)
-        if data:
-            l.data = json.dumps(data, cls=I18nJSONEncoder)
-        l.save()
+        LogEntry.objects.bulk_create([o._log_entry(action, data, user) for o in objects])
 
 
 class LoggedModel(models.Model, LoggingMixin):
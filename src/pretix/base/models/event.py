@@ -106,8 +106,18 @@ class Event(LoggedModel):
         return str(self.name)
 
     def save(self, *args, **kwargs):
+        from pretix.multidomain.routing import invalidate_event
+
         obj = super().save(*args, **kwargs)
         self.get_cache().clear()
+        invalidate_event(self)
+        return obj
+
+    def delete(self, *args, **kwargs):
+        from pretix.multidomain.routing import invalidate_event
+
+        obj = super().delete(*args, **kwargs)
+        invalidate_event(self)
         return obj
 
     def clean(self):
@@ -186,13 +196,17 @@ class Event(LoggedModel):
             return False
         return True
 
-    def lock(self):
+    def lock(self, quotas=None):
         """
         Returns a contextmanager that can be used to lock an event for bookings.
+
+        :param quotas: If the operation only affects a known set of quotas, you can pass
+                       the quotas (or their IDs) here. If quota-level locking is enabled,
+                       only these quotas will be locked instead of the whole event.
         """
         from pretix.base.services import locking
 
-        return locking.LockManager(self)
+        return locking.LockManager(self, quotas)
 
     def get_mail_backend(self, force_custom=False):
         if self.settings.smtp_use_custom or force_custom:
@@ -1,11 +1,12 @@
 import sys
 import uuid
+from collections import Counter, defaultdict
 from datetime import datetime
 from decimal import Decimal
-from typing import Tuple
+from typing import Dict, Tuple
 
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.utils.functional import cached_property
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
@@ -16,6 +17,20 @@ from pretix.base.models.base import LoggedModel
 from .event import Event
 
 
+def _min_availability(quotas, _cache=None) -> Tuple[int, int]:
+    """
+    Returns the most restrictive availability of the given quotas, computing all
+    availabilities not yet contained in ``_cache`` in one batch.
+    """
+    if _cache is None:
+        _cache = {}
+    missing = [q for q in quotas if q.pk not in _cache]
+    if missing:
+        _cache.update(Quota.objects.bulk_availability(missing))
+    return min([_cache[q.pk] for q in quotas],
+               key=lambda s: (s[0], s[1] if s[1] is not None else sys.maxsize))
+
+
 class ItemCategory(LoggedModel):
     """
     Items can be sorted into these categories.
@@ -249,11 +264,10 @@ class Item(LoggedModel):
             check_quotas -= set(ignored_quotas)
         if not check_quotas:
             return Quota.AVAILABILITY_OK, sys.maxsize
-        if self.variations.count() > 0:  # NOQA
+        if self.has_variations:
             raise ValueError('Do not call this directly on items which have variations '
                              'but call this on their ItemVariation objects')
-        return min([q.availability(_cache=_cache) for q in check_quotas],
-                   key=lambda s: (s[0], s[1] if s[1] is not None else sys.maxsize))
+        return _min_availability(check_quotas, _cache)
 
     @cached_property
     def has_variations(self):
@@ -330,8 +344,7 @@ class ItemVariation(models.Model):
             check_quotas -= set(ignored_quotas)
         if not check_quotas:
             return Quota.AVAILABILITY_OK, sys.maxsize
-        return min([q.availability(_cache=_cache) for q in check_quotas],
-                   key=lambda s: (s[0], s[1] if s[1] is not None else sys.maxsize))
+        return _min_availability(check_quotas, _cache)
 
     def __lt__(self, other):
         if self.position == other.position:
@@ -437,6 +450,90 @@ class QuestionOption(models.Model):
         return str(self.answer)
 
 
+class QuotaManager(models.Manager):
+
+    def bulk_availability(self, quotas, now_dt: datetime=None) -> Dict[int, Tuple[int, int]]:
+        """
+        Computes the availability of many quotas at once. In contrast to calling
+        :py:meth:`Quota.availability` for every quota, this uses a constant number of
+        grouped aggregate queries, regardless of the number of quotas.
+
+        :param quotas: An iterable of :py:class:`Quota` objects
+        :param now_dt: The point in time to compute the availability for (default: now)
+        :returns: a dictionary mapping quota IDs to the return values of :py:meth:`Quota.availability`
+        """
+        from pretix.base.models import CartPosition, Order, OrderPosition, Voucher
+
+        now_dt = now_dt or now()
+        quotas = {q.pk: q for q in quotas}
+        result = {
+            pk: (Quota.AVAILABILITY_OK, None) for pk, q in quotas.items() if q.size is None
+        }
+        limited = [pk for pk in quotas if pk not in result]
+        if not limited:
+            return result
+
+        item_quotas = defaultdict(set)
+        for quota_id, item_id in Quota.items.through.objects.filter(quota_id__in=limited).values_list(
+                'quota_id', 'item_id'):
+            item_quotas[item_id].add(quota_id)
+        var_quotas = defaultdict(set)
+        for quota_id, var_id in Quota.variations.through.objects.filter(quota_id__in=limited).values_list(
+                'quota_id', 'itemvariation_id'):
+            var_quotas[var_id].add(quota_id)
+        product_lookup = (
+            Q(variation__isnull=True) & Q(item_id__in=list(item_quotas.keys()))
+        ) | Q(variation_id__in=list(var_quotas.keys()))
+
+        def quotas_for(item_id, variation_id):
+            return var_quotas[variation_id] if variation_id else item_quotas[item_id]
+
+        counts = {pk: Counter() for pk in limited}
+
+        stored = QuotaCounter.objects.filter(quota_id__in=limited).values_list('quota_id', 'paid', 'pending')
+        for quota_id, paid, pending in stored:
+            counts[quota_id]['paid'] = paid
+            counts[quota_id]['pending'] = pending
+        uncounted = set(limited) - {c[0] for c in stored}
+        if uncounted:
+            positions = OrderPosition.objects.filter(
+                product_lookup, order__status__in=(Order.STATUS_PAID, Order.STATUS_PENDING)
+            ).order_by().values('item_id', 'variation_id', 'order__status').annotate(c=Count('id'))
+            for row in positions:
+                key = 'paid' if row['order__status'] == Order.STATUS_PAID else 'pending'
+                for quota_id in quotas_for(row['item_id'], row['variation_id']) & uncounted:
+                    counts[quota_id][key] += row['c']
+
+        vouchers = Voucher.objects.filter(
+            Q(block_quota=True) &
+            Q(redeemed=False) &
+            Q(Q(valid_until__isnull=True) | Q(valid_until__gte=now_dt)) &
+            Q(product_lookup | Q(quota_id__in=limited))
+        ).order_by().values('item_id', 'variation_id', 'quota_id').annotate(c=Count('id'))
+        for row in vouchers:
+            affected = set(quotas_for(row['item_id'], row['variation_id']))
+            if row['quota_id'] in counts:
+                affected.add(row['quota_id'])
+            for quota_id in affected:
+                counts[quota_id]['vouchers'] += row['c']
+
+        carts = CartPosition.objects.filter(
+            Q(expires__gte=now_dt) &
+            ~Q(
+                Q(voucher__isnull=False) & Q(voucher__block_quota=True)
+                & Q(Q(voucher__valid_until__isnull=True) | Q(voucher__valid_until__gte=now_dt))
+            ) &
+            product_lookup
+        ).order_by().values('item_id', 'variation_id').annotate(c=Count('id'))
+        for row in carts:
+            for quota_id in quotas_for(row['item_id'], row['variation_id']):
+                counts[quota_id]['cart'] += row['c']
+
+        for pk in limited:
+            result[pk] = Quota._availability_from_counts(quotas[pk].size, **counts[pk])
+        return result
+
+
 class Quota(LoggedModel):
     """
     A quota is a "pool of tickets". It is there to limit the number of items
@@ -516,6 +613,8 @@ class Quota(LoggedModel):
         verbose_name=_("Variations")
     )
 
+    objects = QuotaManager()
+
     class Meta:
         verbose_name = _("Quota")
         verbose_name_plural = _("Quotas")
@@ -554,12 +653,14 @@ class Quota(LoggedModel):
         if size_left is None:
             return Quota.AVAILABILITY_OK, None
 
+        paid, pending = self.count_ordered()
+
         # TODO: Test for interference with old versions of Item-Quota-relations, etc.
-        size_left -= self.count_paid_orders()
+        size_left -= paid
         if size_left <= 0:
             return Quota.AVAILABILITY_GONE, 0
 
-        size_left -= self.count_pending_orders()
+        size_left -= pending
         if size_left <= 0:
             return Quota.AVAILABILITY_ORDERED, 0
 
@@ -573,6 +674,34 @@ class Quota(LoggedModel):
 
         return Quota.AVAILABILITY_OK, size_left
 
+    @staticmethod
+    def _availability_from_counts(size: int, paid: int=0, pending: int=0, vouchers: int=0,
+                                  cart: int=0) -> Tuple[int, int]:
+        size_left = size - paid
+        if size_left <= 0:
+            return Quota.AVAILABILITY_GONE, 0
+
+        size_left -= pending + vouchers
+        if size_left <= 0:
+            return Quota.AVAILABILITY_ORDERED, 0
+
+        size_left -= cart
+        if size_left <= 0:
+            return Quota.AVAILABILITY_RESERVED, 0
+
+        return Quota.AVAILABILITY_OK, size_left
+
+    def count_ordered(self) -> Tuple[int, int]:
+        """
+        Returns a tuple of the number of paid and pending order positions in this quota.
+        The values are read from the quota's :py:class:`QuotaCounter` if there is one and
+        are counted from the database otherwise.
+        """
+        counter = QuotaCounter.objects.filter(quota=self).values_list('paid', 'pending').first()
+        if counter is None:
+            return self.count_paid_orders(), self.count_pending_orders()
+        return counter
+
     def count_blocking_vouchers(self, now_dt: datetime=None) -> int:
         from pretix.base.models import Voucher
 
@@ -625,3 +754,44 @@ class Quota(LoggedModel):
 
     class QuotaExceededException(Exception):
         pass
+
+
+class QuotaCounter(models.Model):
+    """
+    Stores the number of paid and pending order positions within a quota, so
+    that :py:meth:`Quota.availability` does not need to count them on every call.
+    The counters are maintained by the signal handlers in
+    :py:mod:`pretix.base.services.quotas` whenever an order changes its status or
+    an order position is created, changed or deleted. Cart positions and vouchers
+    are still counted live, as their contribution depends on the current time.
+
+    The ``recomputequotas`` management command can be used to recompute all
+    counters from scratch.
+
+    :param quota: The quota these counters belong to
+    :type quota: Quota
+    :param paid: The number of positions in paid orders
+    :type paid: int
+    :param pending: The number of positions in pending orders
+    :type pending: int
+    """
+    quota = models.OneToOneField(
+        Quota,
+        on_delete=models.CASCADE,
+        related_name='counter',
+        primary_key=True
+    )
+    paid = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+
+    def recompute(self) -> Tuple[int, int]:
+        """
+        Recounts the number of paid and pending positions from the database and stores
+        the result. Returns the difference between the stored and the recounted values
+        as a tuple of ``(paid, pending)``.
+        """
+        paid, pending = self.quota.count_paid_orders(), self.quota.count_pending_orders()
+        drift = (self.paid - paid, self.pending - pending)
+        self.paid, self.pending = paid, pending
+        self.save()
+        return drift
@@ -1,6 +1,39 @@
+import json
+import zlib
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class LogEntryQuerySet(models.QuerySet):
+
+    def page(self, cursor: str=None, size: int=50):
+        """
+        Returns a list of at most ``size`` log entries, newest first, that are older than
+        the entry the given cursor points to, together with the cursor of the next page or
+        ``None`` if there are no more entries.
+
+        In contrast to offset-based pagination, every page is a simple range scan over the
+        ``(datetime, id)`` ordering, no matter how old the entries are.
+        """
+        qs = self.order_by('-datetime', '-id')
+        if cursor:
+            try:
+                dt, pk = cursor.rsplit('_', 1)
+                dt, pk = parse_datetime(dt), int(pk)
+            except ValueError:
+                dt = None
+            if dt:
+                qs = qs.filter(Q(datetime__lt=dt) | Q(datetime=dt, pk__lt=pk))
+
+        entries = list(qs[:size + 1])
+        if len(entries) <= size:
+            return entries, None
+        entries = entries[:size]
+        return entries, '{}_{}'.format(entries[-1].datetime.isoformat(), entries[-1].pk)
 
 
 class LogEntry(models.Model):
@@ -31,8 +64,14 @@ class LogEntry(models.Model):
     action_type = models.CharField(max_length=255)
     data = models.TextField(default='{}')
 
+    objects = LogEntryQuerySet.as_manager()
+
     class Meta:
-        ordering = ('-datetime', )
+        ordering = ('-datetime', '-id')
+        index_together = (
+            ('event', 'datetime'),
+            ('content_type', 'object_id', 'datetime'),
+        )
 
     def display(self):
         from ..signals import logentry_display
@@ -41,3 +80,58 @@ class LogEntry(models.Model):
             if response:
                 return response
         return self.action_type
+
+
+class LogEntryArchive(models.Model):
+    """
+    A compressed batch of old log entries of one event that have been moved out of the
+    ``LogEntry`` table by the ``archivelogs`` management command.
+
+    :param event: The event the log entries belong to, if any
+    :type event: Event
+    :param start: The timestamp of the oldest entry in this batch
+    :type start: datetime
+    :param end: The timestamp of the newest entry in this batch
+    :type end: datetime
+    :param count: The number of entries in this batch
+    :type count: int
+    :param data: The zlib-compressed JSON representation of the entries
+    :type data: bytes
+    """
+    event = models.ForeignKey('Event', null=True, blank=True, on_delete=models.CASCADE)
+    start = models.DateTimeField()
+    end = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    FIELDS = ('id', 'content_type_id', 'object_id', 'datetime', 'user_id', 'event_id', 'action_type', 'data')
+
+    class Meta:
+        ordering = ('-end',)
+
+    @classmethod
+    def from_entries(cls, entries: list):
+        """
+        Creates (but does not save) an archive object for the given list of log entries.
+        """
+        rows = [[getattr(e, f) for f in cls.FIELDS] for e in entries]
+        for row in rows:
+            row[3] = row[3].isoformat()
+        return cls(
+            event_id=entries[0].event_id,
+            start=min(e.datetime for e in entries),
+            end=max(e.datetime for e in entries),
+            count=len(entries),
+            data=zlib.compress(json.dumps(rows).encode()),
+        )
+
+    def entries(self):
+        """
+        Returns the archived entries as a list of unsaved ``LogEntry`` objects.
+        """
+        entries = []
+        for row in json.loads(zlib.decompress(bytes(self.data)).decode()):
+            values = dict(zip(self.FIELDS, row))
+            values['datetime'] = parse_datetime(values['datetime'])
+            entries.append(LogEntry(**values))
+        return entries
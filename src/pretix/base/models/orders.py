@@ -79,6 +79,9 @@ class Order(LoggedModel):
     :type comment: str
     :param meta_info: Additional meta information on the order, JSON-encoded.
     :type meta_info: str
+    :param search_index: The lowercased order code, email address and attendee names, kept
+                         in sync automatically to allow searching orders without joins.
+    :type search_index: str
     """
 
     STATUS_PENDING = "n"
@@ -170,11 +173,18 @@ class Order(LoggedModel):
         verbose_name=_("Meta information"),
         null=True, blank=True
     )
+    search_index = models.TextField(
+        default='', editable=False
+    )
 
     class Meta:
         verbose_name = _("Order")
         verbose_name_plural = _("Orders")
         ordering = ("-datetime",)
+        index_together = (
+            ('event', 'datetime'),
+            ('event', 'code'),
+        )
 
     def __str__(self):
         return self.full_code
@@ -187,6 +197,20 @@ class Order(LoggedModel):
         """
         return '{event}-{code}'.format(event=self.event.slug.upper(), code=self.code)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status, the quota counters need to know whether it changed on save.
+        # If the status is deferred, it is looked up before saving instead.
+        if 'status' in instance.__dict__:
+            instance._quota_counter_status = instance.status
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or 'status' in fields:
+            self._quota_counter_status = self.status
+
     def save(self, *args, **kwargs):
         if not self.code:
             self.assign_code()
@@ -194,8 +218,27 @@ class Order(LoggedModel):
             self.datetime = now()
         if self.payment_fee_tax_rate is None:
             self._calculate_tax()
+        self._build_search_index()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ('code' in update_fields or 'email' in update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'search_index'}
         super().save(*args, **kwargs)
 
+    def _build_search_index(self, names: List[str]=None):
+        if names is None:
+            # The attendee names are kept from the current index and only updated by the positions
+            names = self.search_index.split('\n')[2:]
+        self.search_index = '\n'.join([self.code or '', self.email or ''] + [n for n in names if n]).lower()
+
+    def update_search_index(self):
+        """
+        Rebuilds the denormalised ``search_index`` column that the backend's order search
+        runs on from the order's code, email address and the attendee names of its
+        positions and stores it in the database.
+        """
+        self._build_search_index(list(self.positions.values_list('attendee_name', flat=True)))
+        Order.objects.filter(pk=self.pk).update(search_index=self.search_index)
+
     def _calculate_tax(self):
         """
         Calculates the taxes on the payment fees and sets the parameters payment_fee_tax_rate
@@ -465,6 +508,8 @@ class OrderPosition(AbstractPosition):
             for f in AbstractPosition._meta.fields:
                 setattr(op, f.name, getattr(cartpos, f.name))
             op._calculate_tax()
+            # The search index is rebuilt once for the whole order below
+            op._loaded_attendee_name = op.attendee_name
             op.save()
             for answ in cartpos.answers.all():
                 answ.orderposition = op
@@ -474,6 +519,8 @@ class OrderPosition(AbstractPosition):
                 cartpos.voucher.redeemed = True
                 cartpos.voucher.save()
             cartpos.delete()
+        if any(c.attendee_name for c in cp):
+            order.update_search_index()
         return ops
 
     def __repr__(self):
@@ -488,10 +535,36 @@ class OrderPosition(AbstractPosition):
         else:
             self.tax_value = Decimal('0.00')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored attendee name to only rebuild the order's search index if it changed
+        instance._loaded_attendee_name = instance.__dict__.get('attendee_name')
+        # Remember the stored product, the quota counters need to know whether it changed on save
+        if 'item_id' in instance.__dict__ and 'variation_id' in instance.__dict__:
+            instance._quota_counter_product = (instance.item_id, instance.variation_id)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None:
+            self._loaded_attendee_name = self.attendee_name
+            self._quota_counter_product = (self.item_id, self.variation_id)
+
     def save(self, *args, **kwargs):
         if self.tax_rate is None:
             self._calculate_tax()
-        return super().save(*args, **kwargs)
+        r = super().save(*args, **kwargs)
+        if 'attendee_name' in self.__dict__ and self.attendee_name != getattr(self, '_loaded_attendee_name', None):
+            self.order.update_search_index()
+            self._loaded_attendee_name = self.attendee_name
+        return r
+
+    def delete(self, *args, **kwargs):
+        r = super().delete(*args, **kwargs)
+        if getattr(self, '_loaded_attendee_name', None):
+            self.order.update_search_index()
+        return r
 
 
 class CartPosition(AbstractPosition):
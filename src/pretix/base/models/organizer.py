@@ -50,10 +50,20 @@ class Organizer(LoggedModel):
         return self.name
 
     def save(self, *args, **kwargs):
+        from pretix.multidomain.routing import invalidate_organizer
+
         obj = super().save(*args, **kwargs)
         self.get_cache().clear()
+        invalidate_organizer(self)
         return obj
 
+    def delete(self, *args, **kwargs):
+        from pretix.multidomain.routing import invalidate_organizer
+
+        # The custom domains are deleted together with the organizer, so we need to look them up before
+        invalidate_organizer(self)
+        return super().delete(*args, **kwargs)
+
     @cached_property
     def settings(self) -> SettingsProxy:
         """
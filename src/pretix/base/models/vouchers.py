@@ -186,11 +186,11 @@ class Voucher(LoggedModel):
         Returns whether this voucher applies to a given item (and optionally
         a variation).
         """
-        if self.quota:
-            return item.quotas.filter(pk=self.quota.pk).exists()
-        if self.item and not self.variation:
-            return self.item == item
-        return (self.item == item) and (self.variation == variation)
+        if self.quota_id:
+            return any(q.pk == self.quota_id for q in item.quotas.all())
+        if self.item_id and not self.variation_id:
+            return self.item_id == item.pk
+        return (self.item_id == item.pk) and (self.variation_id == (variation.pk if variation else None))
 
     def is_active(self):
         """
@@ -12,17 +12,60 @@ import os
 import random
 import time
 
+from celery.exceptions import Retry
 from django.conf import settings
 from django.db import transaction
+from django.utils.timezone import is_naive, make_aware, utc
 
+from pretix.base import metrics
 from pretix.celery import app
 
 
 class ProfiledTask(app.Task):
+    """
+    Task class that records the execution time, the time spent waiting in the queue,
+    retries and failures of every task in the metrics system and profiles a random sample
+    of ``PROFILING_RATE`` percent of all task executions.
+    """
     abstract = True
 
+    def apply_async(self, args=None, kwargs=None, **options):
+        # Remember when the task is supposed to start, so the worker can tell how long it has
+        # been waiting in the queue. Delays requested through countdown or eta do not count.
+        due = time.time()
+        if options.get('countdown'):
+            due += options['countdown']
+        elif options.get('eta'):
+            # Celery interprets naive datetimes as UTC, not as local time
+            eta = options['eta']
+            due = (make_aware(eta, utc) if is_naive(eta) else eta).timestamp()
+        headers = dict(options.pop('headers', None) or {}, pretix_due=due)
+        return super().apply_async(args, kwargs, headers=headers, **options)
+
+    def _header(self, name):
+        value = getattr(self.request, name, None)
+        if value is None:
+            value = (getattr(self.request, 'headers', None) or {}).get(name)
+        return value
+
     def __call__(self, *args, **kwargs):
+        starttime = time.time()
+        due = self._header('pretix_due')
+        if due:
+            metrics.celery_task_queue_seconds.observe(max(0, starttime - due), task=self.name)
+
+        try:
+            return self._run_profiled(*args, **kwargs)
+        except Retry:
+            metrics.celery_tasks_retried_total.inc(task=self.name)
+            raise
+        except Exception:
+            metrics.celery_tasks_failed_total.inc(task=self.name)
+            raise
+        finally:
+            metrics.celery_task_duration_seconds.observe(time.time() - starttime, task=self.name)
 
+    def _run_profiled(self, *args, **kwargs):
         if settings.PROFILING_RATE > 0 and random.random() < settings.PROFILING_RATE / 100:
             profiler = cProfile.Profile()
             profiler.enable()
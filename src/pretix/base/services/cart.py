@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import List, Optional
@@ -12,6 +13,7 @@ from pretix.base.models import (
 )
 from pretix.base.services.async import ProfiledTask
 from pretix.base.services.locking import LockTimeoutException
+from pretix.base.services.quotas import quotas_for_products
 from pretix.celery import app
 
 
@@ -72,9 +74,7 @@ def _re_add_expired_positions(items: List[dict], event: Event, cart_id: str, now
 
 
 def _delete_expired(expired: List[CartPosition], now_dt: datetime) -> None:
-    for cp in expired:
-        if cp.expires <= now_dt:
-            cp.delete()
+    CartPosition.objects.filter(pk__in=[cp.pk for cp in expired if cp.expires <= now_dt]).delete()
 
 
 def _check_date(event: Event, now_dt: datetime) -> None:
@@ -98,6 +98,29 @@ def _add_new_items(event: Event, items: List[dict],
     ).select_related("item", "item__event").prefetch_related("quotas")
     variations_cache = {v.id: v for v in variations_query}
 
+    # Compute the availability of all affected quotas at once. Inside the loop, this is
+    # kept up to date by hand for every cart position we create.
+    quotas = set()
+    for item in items_cache.values():
+        quotas.update(item.quotas.all())
+    for variation in variations_cache.values():
+        quotas.update(variation.quotas.all())
+    quota_cache = Quota.objects.bulk_availability(quotas, now_dt)
+
+    # Fetch all vouchers at once, together with the positions in this cart that already use
+    # them. New positions are only written after the loop, so we track their vouchers here.
+    vouchers_cache = {
+        v.code: v for v in Voucher.objects.filter(
+            event=event, code__in={i['voucher'].strip() for i in items if i.get('voucher')}
+        )
+    }
+    voucher_use = defaultdict(set)
+    for pk, voucher_id in CartPosition.objects.filter(
+            voucher__in=vouchers_cache.values(), cart_id=cart_id, event=event
+    ).values_list('pk', 'voucher_id'):
+        voucher_use[voucher_id].add(pk)
+    new_positions = []
+
     for i in items:
         # Check whether the specified items are part of what we just fetched from the database
         # If they are not, the user supplied item IDs which either do not exist or belong to
@@ -112,33 +135,38 @@ def _add_new_items(event: Event, items: List[dict],
         # Check whether a voucher has been provided
         voucher = None
         if i.get('voucher'):
-            try:
-                voucher = Voucher.objects.get(code=i.get('voucher').strip(), event=event)
-                if voucher.redeemed:
-                    return error_messages['voucher_redeemed']
-                if voucher.valid_until is not None and voucher.valid_until < now_dt:
-                    return error_messages['voucher_expired']
-                if not voucher.applies_to(item, variation):
-                    return error_messages['voucher_invalid_item']
-                doubleuse = CartPosition.objects.filter(voucher=voucher, cart_id=cart_id, event=event)
-                if 'cp' in i:
-                    doubleuse = doubleuse.exclude(pk=i['cp'].pk)
-                if doubleuse.exists():
-                    return error_messages['voucher_double']
-            except Voucher.DoesNotExist:
-                return error_messages['voucher_invalid']
+            voucher = vouchers_cache.get(i.get('voucher').strip())
+            if voucher is None:
+                err = error_messages['voucher_invalid']
+                break
+            if voucher.redeemed:
+                err = error_messages['voucher_redeemed']
+                break
+            if voucher.valid_until is not None and voucher.valid_until < now_dt:
+                err = error_messages['voucher_expired']
+                break
+            if not voucher.applies_to(item, variation):
+                err = error_messages['voucher_invalid_item']
+                break
+            doubleuse = voucher_use[voucher.pk] - ({i['cp'].pk} if 'cp' in i else set())
+            if doubleuse:
+                err = error_messages['voucher_double']
+                break
 
         # Fetch all quotas. If there are no quotas, this item is not allowed to be sold.
         quotas = list(item.quotas.all()) if variation is None else list(variation.quotas.all())
 
-        if voucher and voucher.quota and voucher.quota.pk not in [q.pk for q in quotas]:
-            return error_messages['voucher_invalid_item']
+        if voucher and voucher.quota_id and voucher.quota_id not in [q.pk for q in quotas]:
+            err = error_messages['voucher_invalid_item']
+            break
 
         if item.require_voucher and voucher is None:
-            return error_messages['voucher_required']
+            err = error_messages['voucher_required']
+            break
 
-        if item.hide_without_voucher and (voucher is None or voucher.item is None or voucher.item.pk != item.pk):
-            return error_messages['voucher_required']
+        if item.hide_without_voucher and (voucher is None or voucher.item_id != item.pk):
+            err = error_messages['voucher_required']
+            break
 
         if len(quotas) == 0 or not item.is_available() or (variation and not variation.active):
             err = err or error_messages['unavailable']
@@ -148,7 +176,7 @@ def _add_new_items(event: Event, items: List[dict],
         quota_ok = i['count']
         if not voucher or (not voucher.allow_ignore_quota and not voucher.block_quota):
             for quota in quotas:
-                avail = quota.availability()
+                avail = quota_cache[quota.pk]
                 if avail[1] is not None and avail[1] < i['count']:
                     # This quota is not available or less than i['count'] items are left, so we have to
                     # reduce the number of bought items
@@ -169,29 +197,52 @@ def _add_new_items(event: Event, items: List[dict],
             if not isinstance(custom_price, Decimal):
                 custom_price = Decimal(custom_price.replace(",", "."))
             if custom_price > 100000000:
-                return error_messages['price_too_high']
+                err = error_messages['price_too_high']
+                break
             price = max(custom_price, price)
 
         # Create a CartPosition for as much items as we can
-        for k in range(quota_ok):
-            if 'cp' in i and i['count'] == 1:
-                # Recreating
-                cp = i['cp']
-                cp.expires = expiry
-                cp.price = price
-                cp.save()
-            else:
-                CartPosition.objects.create(
+        if 'cp' in i and i['count'] == 1 and quota_ok:
+            # Recreating
+            cp = i['cp']
+            cp.expires = expiry
+            cp.price = price
+            cp.save()
+        else:
+            new_positions += [
+                CartPosition(
                     event=event, item=item, variation=variation,
                     price=price,
                     expires=expiry,
                     cart_id=cart_id, voucher=voucher
                 )
+                for k in range(quota_ok)
+            ]
+            if voucher and quota_ok:
+                voucher_use[voucher.pk].add(None)
+        if not voucher or not voucher.block_quota:
+            _reduce_availability(quota_cache, quotas, quota_ok)
+
+    # Positions validated before an error occurred stay in the cart
+    CartPosition.objects.bulk_create(new_positions)
     return err
 
 
+def _reduce_availability(quota_cache: dict, quotas: List[Quota], count: int) -> None:
+    for quota in quotas:
+        state, left = quota_cache[quota.pk]
+        if left is None or count <= 0:
+            continue
+        left = max(left - count, 0)
+        quota_cache[quota.pk] = (state if left > 0 else Quota.AVAILABILITY_RESERVED, left)
+
+
 def _add_items_to_cart(event: Event, items: List[dict], cart_id: str=None) -> None:
-    with event.lock() as now_dt:
+    quotas = quotas_for_products(
+        [(i['item'], i['variation']) for i in items]
+        + list(CartPosition.objects.filter(cart_id=cart_id, event=event).values_list('item_id', 'variation_id'))
+    )
+    with event.lock(quotas) as now_dt:
         _check_date(event, now_dt)
         existing = CartPosition.objects.filter(Q(cart_id=cart_id) & Q(event=event)).count()
         if sum(i['count'] for i in items) + existing > int(event.settings.max_items_per_order):
@@ -230,24 +281,25 @@ def add_items_to_cart(self, event: int, items: List[dict], cart_id: str=None) ->
 
 
 def _remove_items_from_cart(event: Event, items: List[dict], cart_id: str) -> None:
-    with event.lock():
+    with event.lock(quotas_for_products([(i['item'], i['variation']) for i in items])):
+        to_delete = set()
         for i in items:
             cw = Q(cart_id=cart_id) & Q(item_id=i['item']) & Q(event=event)
             if i['variation']:
                 cw &= Q(variation_id=i['variation'])
             else:
                 cw &= Q(variation__isnull=True)
+            qs = CartPosition.objects.filter(cw).exclude(pk__in=to_delete)
             # Prefer to delete positions that have the same price as the one the user clicked on, after thet
             # prefer the most expensive ones.
             cnt = i['count']
             if i['price']:
-                correctprice = CartPosition.objects.filter(cw).filter(price=Decimal(i['price'].replace(",", ".")))[:cnt]
-                for cp in correctprice:
-                    cp.delete()
+                correctprice = list(qs.filter(price=Decimal(i['price'].replace(",", "."))).values_list('pk', flat=True)[:cnt])
+                to_delete.update(correctprice)
                 cnt -= len(correctprice)
             if cnt > 0:
-                for cp in CartPosition.objects.filter(cw).order_by("-price")[:cnt]:
-                    cp.delete()
+                to_delete.update(qs.exclude(pk__in=to_delete).order_by("-price").values_list('pk', flat=True)[:cnt])
+        CartPosition.objects.filter(pk__in=to_delete).delete()
 
 
 @app.task(base=ProfiledTask, bind=True, max_retries=5, default_retry_delay=1)
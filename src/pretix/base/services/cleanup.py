@@ -7,15 +7,25 @@ from ..models import CachedFile, CartPosition, InvoiceAddress
 from ..signals import periodic_task
 
 
+def delete_in_chunks(qs, chunk_size=1000):
+    """
+    Deletes all objects matched by a queryset with one set-based delete per chunk of
+    objects. Deletion signals are still sent for every object, but we never need to hold
+    all of the objects in memory at once.
+    """
+    while True:
+        ids = list(qs.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        qs.model.objects.filter(pk__in=ids).delete()
+
+
 @receiver(signal=periodic_task)
 def clean_cart_positions(sender, **kwargs):
-    for cp in CartPosition.objects.filter(expires__lt=now() - timedelta(days=14)):
-        cp.delete()
-    for ia in InvoiceAddress.objects.filter(order__isnull=True, last_modified__lt=now() - timedelta(days=14)):
-        ia.delete()
+    delete_in_chunks(CartPosition.objects.filter(expires__lt=now() - timedelta(days=14)))
+    delete_in_chunks(InvoiceAddress.objects.filter(order__isnull=True, last_modified__lt=now() - timedelta(days=14)))
 
 
 @receiver(signal=periodic_task)
 def clean_cached_files(sender, **kwargs):
-    for cf in CachedFile.objects.filter(expires__isnull=False, expires__lt=now()):
-        cf.delete()
+    delete_in_chunks(CachedFile.objects.filter(expires__isnull=False, expires__lt=now()))
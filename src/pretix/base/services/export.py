@@ -1,6 +1,7 @@
+import tempfile
 from typing import Any, Dict
 
-from django.core.files.base import ContentFile
+from django.core.files import File
 
 from pretix.base.i18n import language
 from pretix.base.models import CachedFile, Event, cachedfile_name
@@ -18,6 +19,10 @@ def export(event: str, fileid: str, provider: str, form_data: Dict[str, Any]) ->
         for receiver, response in responses:
             ex = response(event)
             if ex.identifier == provider:
-                file.filename, file.type, data = ex.render(form_data)
-                file.file.save(cachedfile_name(file, file.filename), ContentFile(data))
+                file.filename, file.type, chunks = ex.stream(form_data)
+                with tempfile.TemporaryFile() as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+                    f.seek(0)
+                    file.file.save(cachedfile_name(file, file.filename), File(f))
                 file.save()
@@ -1,31 +1,91 @@
 import logging
+import os
+import sys
+import threading
 import time
 import uuid
 from datetime import timedelta
 
+from celery.signals import task_postrun
 from django.conf import settings
-from django.db import transaction
+from django.core.signals import request_finished
+from django.db import connection, transaction
 from django.utils.timezone import now
 
+from pretix.base import metrics
 from pretix.base.models import EventLock
 
 logger = logging.getLogger('pretix.base.locking')
 LOCK_TIMEOUT = 120
+LOCK_WAIT_TIMEOUT = 5
+WAITER_TIMEOUT = 4
+PG_LOCK_NAMESPACE = 0x707478  # first key of all advisory locks taken by pretix
+SLOW_LOCK_THRESHOLD = 1  # seconds spent waiting for and holding a lock until it is logged
+
+_stats = threading.local()
 
 
 class LockManager:
-    def __init__(self, event):
+    """
+    A context manager that locks an event for bookings. If a set of quotas is given and
+    quota-level locking is enabled (``LOCK_QUOTAS``), only the locks of these quotas are
+    acquired, so that operations on independent quotas of the same event can run in
+    parallel. Otherwise, or if the set of quotas is empty, the whole event is locked.
+
+    The time spent waiting for and holding the lock is recorded in the metrics system
+    together with the name of the function that requested the lock. Locks that have been
+    waited for or held for longer than ``SLOW_LOCK_THRESHOLD`` seconds are logged.
+    """
+
+    def __init__(self, event, quotas=None):
         self.event = event
+        self.quotas = None
+        self.keys = None
+        if quotas is not None and settings.LOCK_QUOTAS:
+            self.quotas = sorted({getattr(q, 'pk', q) for q in quotas}) or None
+        self.caller = _caller()
 
     def __enter__(self):
-        lock_event(self.event)
+        _stats.retries = 0
+        starttime = time.time()
+        try:
+            if self.quotas is not None:
+                self.keys = lock_quotas(self.event, self.quotas)
+            else:
+                lock_event(self.event)
+        except LockTimeoutException:
+            self.wait_time = time.time() - starttime
+            metrics.lock_wait_seconds.observe(self.wait_time, caller=self.caller)
+            metrics.lock_timeouts_total.inc(event=self.event.pk)
+            self._record_retries()
+            logger.warning('Timeout after waiting %.3fs for lock on event %s in %s (%d retries)',
+                           self.wait_time, self.event.pk, self.caller, self.retries)
+            raise
+        self.acquired_time = time.time()
+        self.wait_time = self.acquired_time - starttime
+        metrics.lock_wait_seconds.observe(self.wait_time, caller=self.caller)
+        self._record_retries()
         return now()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        release_event(self.event)
+        if self.quotas is not None:
+            release_quotas(self.event, self.keys)
+        else:
+            release_event(self.event)
+
+        hold_time = time.time() - self.acquired_time
+        metrics.lock_hold_seconds.observe(hold_time, caller=self.caller)
+        if self.wait_time + hold_time > SLOW_LOCK_THRESHOLD:
+            logger.warning('Slow lock on event %s in %s: waited %.3fs (%d retries), held %.3fs',
+                           self.event.pk, self.caller, self.wait_time, self.retries, hold_time)
         if exc_type is not None:
             return False
 
+    def _record_retries(self):
+        self.retries = _stats.retries
+        if self.retries:
+            metrics.lock_retries_total.inc(self.retries, event=self.event.pk)
+
 
 class LockTimeoutException(Exception):
     pass
@@ -40,16 +100,31 @@ def lock_event(event):
     Issue a lock on this event so nobody can book tickets for this event until
     you release the lock. Will retry 5 times on failure.
 
+    If quota-level locking is enabled, this also acquires the locks of all quotas of
+    the event, so that nobody holding only a quota lock can interfere.
+
     :raises LockTimeoutException: if the event is locked every time we try
                                   to obtain the lock
     """
     if hasattr(event, '_lock') and event._lock:
         return True
 
-    if settings.HAS_REDIS:
-        return lock_event_redis(event)
+    deadline = time.time() + LOCK_WAIT_TIMEOUT
+    backend = _backend()
+    if backend == 'redis':
+        lock_event_redis(event, deadline)
+    elif backend == 'postgresql':
+        lock_event_pg(event, deadline)
     else:
-        return lock_event_db(event)
+        lock_event_db(event, deadline)
+
+    if settings.LOCK_QUOTAS:
+        try:
+            event._event_quota_keys = _acquire_quotas(event, event.quotas.values_list('id', flat=True), deadline)
+        except LockTimeoutException:
+            release_event(event)
+            raise
+    return True
 
 
 def release_event(event):
@@ -62,77 +137,406 @@ def release_event(event):
     """
     if not hasattr(event, '_lock') or not event._lock:
         raise LockReleaseException('Lock is not owned by this thread')
-    if settings.HAS_REDIS:
+    if getattr(event, '_event_quota_keys', None):
+        _release_quotas(event, event._event_quota_keys)
+        event._event_quota_keys = None
+    backend = _backend()
+    if backend == 'redis':
         return release_event_redis(event)
+    elif backend == 'postgresql':
+        return release_event_pg(event)
     else:
         return release_event_db(event)
 
 
-def lock_event_db(event):
+def lock_quotas(event, quotas):
+    """
+    Issue locks on the given quotas of this event, in ascending order of their IDs to
+    avoid deadlocks. Does nothing if the event itself is already locked by this
+    Python object. Quotas that are already locked by this Python object are skipped, so
+    the locks can be nested.
+
+    :param quotas: An iterable of quota IDs
+    :returns: The keys of the locks acquired by this call, to be passed to
+              :py:meth:`release_quotas()`
+    :raises LockTimeoutException: if one of the quotas is locked every time we try
+                                  to obtain its lock. All locks acquired by this call
+                                  are released in this case.
+    """
+    if getattr(event, '_lock', None):
+        return []
+    return _acquire_quotas(event, quotas)
+
+
+def release_quotas(event, keys=None):
+    """
+    Release the locks placed by :py:meth:`lock_quotas()`.
+
+    :param keys: The keys returned by :py:meth:`lock_quotas()`. If this is not given,
+                 all quota locks held by this Python object are released.
+    :raises LockReleaseException: if we do not own the locks
+    """
+    if getattr(event, '_lock', None):
+        # The quota locks have been covered by an event lock, which is released separately
+        return
+    if keys is not None and not keys:
+        # Everything was already locked by an outer lock, which releases it
+        return
+    if not getattr(event, '_quota_locks', None):
+        raise LockReleaseException('Lock is not owned by this thread')
+    _release_quotas(event, keys)
+
+
+def _acquire_quotas(event, quotas, deadline=None):
+    held = {key for key, lock in getattr(event, '_quota_locks', None) or []}
+    keys = [k for k in (_quota_key(q) for q in sorted(quotas)) if k not in held]
+    if keys:
+        event._quota_locks = (getattr(event, '_quota_locks', None) or []) + _acquire_all(keys, deadline)
+    return keys
+
+
+def _release_quotas(event, keys=None):
+    locks = [(k, l) for k, l in event._quota_locks if keys is None or k in keys]
+    event._quota_locks = [(k, l) for k, l in event._quota_locks if keys is not None and k not in keys] or None
+    _release_all(locks)
+
+
+def _backend():
+    """
+    Returns the lock backend to use: Redis if available, PostgreSQL advisory locks if we
+    run on PostgreSQL and lock rows in the database otherwise.
+    """
+    if settings.HAS_REDIS:
+        return 'redis'
+    elif connection.vendor == 'postgresql':
+        return 'postgresql'
+    return 'db'
+
+
+def _caller():
+    """
+    Returns the qualified name of the first function on the stack that is neither part of
+    this module nor ``Event.lock()``, i.e. the service function that requested the lock.
+    """
+    frame = sys._getframe(1)
+    while frame and frame.f_globals.get('__name__') in (__name__, 'pretix.base.models.event'):
+        frame = frame.f_back
+    if not frame:
+        return 'unknown'
+    return '{}.{}'.format(frame.f_globals.get('__name__'), frame.f_code.co_name)
+
+
+def _record_retry():
+    _stats.retries = getattr(_stats, 'retries', 0) + 1
+
+
+def _quota_key(quota_id):
+    return 'quota-%d' % quota_id
+
+
+def _acquire_all(keys, deadline=None):
+    """
+    Acquires the locks for all given keys in order. ``LOCK_WAIT_TIMEOUT`` bounds the time
+    spent waiting for all of them together, not for every single one.
+    """
+    deadline = deadline or time.time() + LOCK_WAIT_TIMEOUT
+    acquired = []
+    try:
+        for key in keys:
+            acquired.append((key, _acquire(key, deadline)))
+    except LockTimeoutException:
+        _release_all(acquired)
+        raise
+    return acquired
+
+
+def _release_all(locks):
+    for key, lock in reversed(locks):
+        try:
+            _release(lock)
+        except (LockReleaseException, LockTimeoutException):
+            logger.exception('Error releasing lock %s' % key)
+
+
+def _acquire(key, deadline=None):
+    backend = _backend()
+    if backend == 'redis':
+        return _acquire_redis(key, deadline=deadline)
+    elif backend == 'postgresql':
+        return _acquire_pg(key, deadline)
+    return _acquire_db(key, deadline)
+
+
+def _release(lock):
+    backend = _backend()
+    if backend == 'redis':
+        return _release_redis(lock)
+    elif backend == 'postgresql':
+        return _release_pg(lock)
+    return _release_db(lock)
+
+
+def _acquire_db(key, deadline=None):
     retries = 5
     for i in range(retries):
+        if deadline and i and time.time() > deadline:
+            break
         with transaction.atomic():
             dt = now()
-            l, created = EventLock.objects.get_or_create(event=event.id)
+            l, created = EventLock.objects.get_or_create(event=key)
             if created:
-                event._lock = l
-                return True
+                return l
             elif l.date < now() - timedelta(seconds=LOCK_TIMEOUT):
                 newtoken = str(uuid.uuid4())
-                updated = EventLock.objects.filter(event=event.id, token=l.token).update(date=dt, token=newtoken)
+                updated = EventLock.objects.filter(event=key, token=l.token).update(date=dt, token=newtoken)
                 if updated:
                     l.token = newtoken
-                    event._lock = l
-                    return True
+                    return l
+        _record_retry()
         time.sleep(2 ** i / 100)
     raise LockTimeoutException()
 
 
 @transaction.atomic
+def _release_db(lock):
+    try:
+        EventLock.objects.get(event=lock.event, token=lock.token).delete()
+    except EventLock.DoesNotExist:
+        raise LockReleaseException('Lock is no longer owned by this thread')
+
+
+def lock_event_db(event, deadline=None):
+    event._lock = _acquire_db(event.id, deadline)
+    return True
+
+
 def release_event_db(event):
     if not hasattr(event, '_lock') or not event._lock:
         raise LockReleaseException('Lock is not owned by this thread')
+    _release_db(event._lock)
+    event._lock = None
+
+
+_pg_local = threading.local()
+
+
+def _pg_connection():
+    """
+    Advisory locks are held on a separate database connection per thread that is never
+    part of a transaction, so they are not affected by the transaction state of the
+    operation they protect. If the process dies, the connection and therefore all of its
+    locks go away immediately. The connection is closed at the end of every request and
+    task, just like Django's own connections, see :py:func:`close_pg_connection`.
+    """
+    conn = getattr(_pg_local, 'connection', None)
+    if conn is not None and _pg_local.pid != os.getpid():
+        # We have been forked and the connection belongs to our parent. Closing it would
+        # also close it for the parent, so we just forget about it.
+        conn = None
+    if conn is None or conn.closed:
+        conn = connection.get_new_connection(connection.get_connection_params())
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("SET lock_timeout = %s", ['%ds' % LOCK_WAIT_TIMEOUT])
+        _pg_local.connection = conn
+        _pg_local.pid = os.getpid()
+        _pg_local.held = set()
+    return conn
+
+
+def _discard_pg_connection():
+    conn, _pg_local.connection = getattr(_pg_local, 'connection', None), None
+    _pg_local.held = set()
+    if conn is not None and _pg_local.pid == os.getpid():
+        try:
+            conn.close()
+        except connection.Database.Error:
+            pass
+
+
+def close_pg_connection(**kwargs):
+    """
+    Closes the advisory lock connection of the current thread, unless it still holds locks.
+    This is called at the end of every request and every task.
+    """
+    if getattr(_pg_local, 'connection', None) is None or _pg_local.held:
+        return
+    _discard_pg_connection()
+
+
+request_finished.connect(close_pg_connection, dispatch_uid='pretix_locking_close_pg_connection')
+task_postrun.connect(close_pg_connection, dispatch_uid='pretix_locking_close_pg_connection')
+
+
+def _acquire_pg(key, deadline=None):
+    """
+    Waits for a session-level advisory lock. PostgreSQL grants the lock to its waiters in
+    order and gives up once the deadline, by default ``LOCK_WAIT_TIMEOUT`` seconds from
+    now, has passed.
+    """
+    key = 'pretix_%s' % key
+    conn = _pg_connection()
+    if key in _pg_local.held:
+        # Advisory locks are reentrant within a session, but we want them to be exclusive
+        # to one holder, just like the other backends.
+        raise LockTimeoutException()
+
+    remaining = (deadline or time.time() + LOCK_WAIT_TIMEOUT) - time.time()
+    if remaining <= 0:
+        raise LockTimeoutException()
     try:
-        lock = EventLock.objects.get(event=event.id, token=event._lock.token)
-        lock.delete()
-        event._lock = None
-    except EventLock.DoesNotExist:
+        with conn.cursor() as cursor:
+            # Both statements are sent in a single round trip
+            cursor.execute("SET lock_timeout = %s; SELECT pg_advisory_lock(%s, hashtext(%s))",
+                           ['%dms' % max(1, remaining * 1000), PG_LOCK_NAMESPACE, key])
+    except connection.Database.Error as e:
+        if getattr(e, 'pgcode', None) != '55P03':  # lock_not_available is a regular timeout
+            logger.exception('Error locking an event')
+            _discard_pg_connection()
+        raise LockTimeoutException()
+    _pg_local.held.add(key)
+    return key
+
+
+def _release_pg(key):
+    if key not in getattr(_pg_local, 'held', set()):
+        raise LockReleaseException('Lock is no longer owned by this thread')
+    _pg_local.held.discard(key)
+    try:
+        with _pg_connection().cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", [PG_LOCK_NAMESPACE, key])
+            released = cursor.fetchone()[0]
+    except connection.Database.Error:
+        # The locks of a broken connection are gone anyway, start over with a new one
+        _discard_pg_connection()
+        raise LockReleaseException('Error releasing lock')
+    if not released:
         raise LockReleaseException('Lock is no longer owned by this thread')
 
 
-def redis_lock_from_event(event):
+def lock_event_pg(event, deadline=None):
+    event._lock = _acquire_pg('event_%s' % event.id, deadline)
+    return True
+
+
+def release_event_pg(event):
+    if not hasattr(event, '_lock') or not event._lock:
+        raise LockReleaseException('Lock is not owned by this thread')
+    _release_pg(event._lock)
+    event._lock = None
+
+
+def _redis_lock(name):
     from django_redis import get_redis_connection
     from redis.lock import Lock
 
+    rc = get_redis_connection("redis")
+    return Lock(redis=rc, name=name, timeout=LOCK_TIMEOUT)
+
+
+def redis_lock_from_event(event):
     if not hasattr(event, '_lock') or not event._lock:
-        rc = get_redis_connection("redis")
-        event._lock = Lock(redis=rc, name='pretix_event_%s' % event.id, timeout=LOCK_TIMEOUT)
+        event._lock = _redis_lock('pretix_event_%s' % event.id)
     return event._lock
 
 
-def lock_event_redis(event):
+def _acquire_redis(key, lock=None, deadline=None):
+    """
+    Waits for the Redis lock in a fair way: every waiter enqueues itself in a list next to
+    the lock and only the first waiter in line tries to acquire it. The others block on a
+    personal wakeup list that is pushed to when the lock is released, instead of polling.
+    Waiters that disappear without leaving the queue are detected by their heartbeat key
+    expiring and removed, so they cannot stall the queue.
+
+    Enqueuing, the heartbeat and looking at the head of the queue are pipelined, so an
+    uncontended lock costs three round trips to Redis.
+    """
     from redis.exceptions import RedisError
 
-    lock = redis_lock_from_event(event)
-    retries = 5
-    for i in range(retries):
-        try:
-            if lock.acquire(False):
-                return True
-        except RedisError:
-            logger.exception('Error locking an event')
-            raise LockTimeoutException()
-        time.sleep(2 ** i / 100)
+    lock = lock or _redis_lock('pretix_%s' % key)
+    rc = lock.redis
+    token = uuid.uuid4().hex
+    queue = '%s_queue' % lock.name
+    waiter = '%s_waiter_%s' % (lock.name, token)
+    deadline = deadline or time.time() + LOCK_WAIT_TIMEOUT
+    enqueue = True
+    try:
+        while True:
+            pipe = rc.pipeline(transaction=False)
+            if enqueue:
+                pipe.rpush(queue, token)
+            pipe.expire(queue, LOCK_TIMEOUT)
+            pipe.set(waiter, '1', ex=WAITER_TIMEOUT)
+            pipe.lindex(queue, 0)
+            head = pipe.execute()[-1]
+            head = head.decode() if head is not None else None
+            enqueue = False
+            if head == token:
+                if lock.acquire(False):
+                    _leave_queue(rc, queue, waiter, token)
+                    return lock
+            elif head is None:
+                # Our queue entry has been removed in the meantime, line up again
+                enqueue = True
+                continue
+            elif not rc.exists('%s_waiter_%s' % (lock.name, head)):
+                # The first waiter in line has gone away without leaving the queue
+                rc.lrem(queue, 1, head)
+                continue
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            _record_retry()
+            rc.blpop('%s_wake_%s' % (lock.name, token), timeout=max(1, min(int(remaining), WAITER_TIMEOUT // 2)))
+
+        _leave_queue(rc, queue, waiter, token)
+        _wake_next(lock)
+    except RedisError:
+        logger.exception('Error locking an event')
+        raise LockTimeoutException()
     raise LockTimeoutException()
 
 
-def release_event_redis(event):
+def _leave_queue(rc, queue, waiter, token):
+    pipe = rc.pipeline(transaction=False)
+    pipe.lrem(queue, 1, token)
+    pipe.delete(waiter)
+    pipe.execute()
+
+
+def _wake_next(lock):
+    head = lock.redis.lindex('%s_queue' % lock.name, 0)
+    if head is not None:
+        wakekey = '%s_wake_%s' % (lock.name, head.decode())
+        pipe = lock.redis.pipeline(transaction=False)
+        pipe.rpush(wakekey, '1')
+        pipe.expire(wakekey, WAITER_TIMEOUT)
+        pipe.execute()
+
+
+def _release_redis(lock):
     from redis import RedisError
 
-    lock = redis_lock_from_event(event)
     try:
         lock.release()
+        _wake_next(lock)
     except RedisError:
         logger.exception('Error releasing an event lock')
         raise LockTimeoutException()
+
+
+def lock_event_redis(event, deadline=None):
+    lock = redis_lock_from_event(event)
+    try:
+        _acquire_redis('event_%s' % event.id, lock, deadline)
+    except LockTimeoutException:
+        event._lock = None
+        raise
+    return True
+
+
+def release_event_redis(event):
+    lock = redis_lock_from_event(event)
+    _release_redis(lock)
     event._lock = None
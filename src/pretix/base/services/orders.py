@@ -1,3 +1,4 @@
+import contextlib
 import json
 import logging
 from collections import Counter, namedtuple
@@ -6,7 +7,9 @@ from decimal import Decimal
 from typing import List, Optional
 
 import pytz
+from celery import group
 from celery.exceptions import MaxRetriesExceededError
+from django.conf import settings
 from django.db import transaction
 from django.dispatch import receiver
 from django.utils.formats import date_format
@@ -20,6 +23,7 @@ from pretix.base.models import (
     CartPosition, Event, Item, ItemVariation, Order, OrderPosition, Quota,
     User,
 )
+from pretix.base.models.base import buffered_logging
 from pretix.base.models.orders import InvoiceAddress
 from pretix.base.payment import BasePaymentProvider
 from pretix.base.services.async import ProfiledTask
@@ -28,6 +32,9 @@ from pretix.base.services.invoices import (
 )
 from pretix.base.services.locking import LockTimeoutException
 from pretix.base.services.mail import SendMailException, mail
+from pretix.base.services.quotas import (
+    buffered_counters, quotas_for_orders, quotas_for_products, update_counters,
+)
 from pretix.base.signals import (
     order_paid, order_placed, periodic_task, register_payment_providers,
 )
@@ -56,6 +63,32 @@ error_messages = {
 logger = logging.getLogger(__name__)
 
 
+def _order_quotas(order: Order) -> set:
+    return quotas_for_products(order.positions.values_list('item_id', 'variation_id'))
+
+
+@contextlib.contextmanager
+def _lock_order(order: Order, extra_quotas: set=frozenset()):
+    """
+    Locks the quotas the order's positions count against, plus ``extra_quotas``. The set of
+    quotas has to be read before the locks are held, so it is checked again afterwards. If
+    a concurrent change moved one of the positions to another quota in the meantime, the
+    whole event is locked instead.
+
+    The order's status is read again once the lock is held, as the order might have been
+    expired in the meantime and the quota counters depend on the previous status.
+    """
+    quotas = _order_quotas(order) | set(extra_quotas)
+    with order.event.lock(quotas) as now_dt:
+        if not settings.LOCK_QUOTAS or not quotas or _order_quotas(order) <= quotas:
+            order.refresh_from_db(fields=['status'])
+            yield now_dt
+            return
+    with order.event.lock() as now_dt:
+        order.refresh_from_db(fields=['status'])
+        yield now_dt
+
+
 def mark_order_paid(order: Order, provider: str=None, info: str=None, date: datetime=None, manual: bool=None,
                     force: bool=False, send_mail: bool=True, user: User=None) -> Order:
     """
@@ -77,7 +110,7 @@ def mark_order_paid(order: Order, provider: str=None, info: str=None, date: date
     :param user: The user that performed the change
     :raises Quota.QuotaExceededException: if the quota is exceeded and ``force`` is ``False``
     """
-    with order.event.lock() as now_dt:
+    with _lock_order(order) as now_dt:
         can_be_paid = order._can_be_paid()
         if not force and can_be_paid is not True:
             raise Quota.QuotaExceededException(can_be_paid)
@@ -127,7 +160,7 @@ def mark_order_refunded(order, user=None):
         order = Order.objects.get(pk=order)
     if isinstance(user, int):
         user = User.objects.get(pk=user)
-    with order.event.lock():
+    with _lock_order(order):
         order.status = Order.STATUS_REFUNDED
         order.save()
 
@@ -150,7 +183,7 @@ def _cancel_order(order, user=None):
         order = Order.objects.get(pk=order)
     if isinstance(user, int):
         user = User.objects.get(pk=user)
-    with order.event.lock():
+    with _lock_order(order):
         if order.status != Order.STATUS_PENDING:
             raise OrderError(_('You cannot cancel this order.'))
         order.status = Order.STATUS_CANCELED
@@ -304,7 +337,8 @@ def _create_order(event: Event, email: str, positions: List[CartPosition], now_d
         payment_provider=payment_provider.identifier,
         meta_info=json.dumps(meta_info or {}),
     )
-    OrderPosition.transform_cart_positions(positions, order)
+    with buffered_counters():
+        OrderPosition.transform_cart_positions(positions, order)
 
     if address is not None:
         try:
@@ -336,7 +370,8 @@ def _perform_order(event: str, payment_provider: str, position_ids: List[str],
     if not pprov:
         raise OrderError(error_messages['internal'])
 
-    with event.lock() as now_dt:
+    quotas = quotas_for_products(CartPosition.objects.filter(id__in=position_ids).values_list('item_id', 'variation_id'))
+    with event.lock(quotas) as now_dt:
         positions = list(CartPosition.objects.filter(
             id__in=position_ids).select_related('item', 'variation'))
         if len(position_ids) != len(positions):
@@ -374,54 +409,119 @@ def _perform_order(event: str, payment_provider: str, position_ids: List[str],
     return order.id
 
 
+#: Number of orders that are expired or reminded within one database transaction
+EXPIRY_CHUNK_SIZE = 500
+
+
 @receiver(signal=periodic_task)
 def expire_orders(sender, **kwargs):
-    eventcache = {}
-
-    for o in Order.objects.filter(expires__lt=now(), status=Order.STATUS_PENDING).select_related('event'):
-        expire = eventcache.get(o.event.pk, None)
-        if expire is None:
-            expire = o.event.settings.get('payment_term_expire_automatically', as_type=bool)
-            eventcache[o.event.pk] = expire
-        if expire:
-            o.status = Order.STATUS_EXPIRED
-            o.log_action('pretix.event.order.expired')
-            o.save()
+    """
+    Dispatches one task per event with pending orders past their expiry date. Every task
+    expires the orders in chunks that are committed independently, so an interrupted run
+    is simply continued by the next one.
+    """
+    event_ids = Order.objects.filter(
+        expires__lt=now(), status=Order.STATUS_PENDING
+    ).order_by().values_list('event_id', flat=True).distinct()
+    for event_id in event_ids:
+        expire_event_orders.apply_async(args=(event_id,))
+
+
+@app.task(base=ProfiledTask)
+def expire_event_orders(event: int):
+    event = Event.objects.get(pk=event)
+    if not event.settings.get('payment_term_expire_automatically', as_type=bool):
+        return
+    now_dt = now()
+    while _expire_orders_chunk(event, now_dt):
+        pass
+
+
+def _expire_orders_chunk(event: Event, now_dt: datetime) -> int:
+    candidates = list(Order.objects.filter(
+        event=event, expires__lt=now_dt, status=Order.STATUS_PENDING
+    ).order_by('pk').values_list('pk', flat=True)[:EXPIRY_CHUNK_SIZE])
+    if not candidates:
+        return 0
+
+    # The quotas stay locked until the chunk is committed, so an order that is paid or
+    # cancelled at the same time is seen either as pending or as expired, but its counters
+    # are never updated twice.
+    quotas = {q for q in quotas_for_orders(candidates) if q}
+    with event.lock(quotas), transaction.atomic():
+        orders = list(Order.objects.select_for_update().filter(
+            pk__in=candidates, status=Order.STATUS_PENDING
+        ).order_by('pk').only('pk', 'event'))
+        if orders:
+            ids = [o.pk for o in orders]
+            # A queryset update does not send the signals that keep the quota counters up
+            # to date, so we take care of this ourselves.
+            update_counters(quotas_for_orders(ids), Order.STATUS_PENDING, -1)
+            Order.objects.filter(pk__in=ids).update(status=Order.STATUS_EXPIRED)
+            Order.bulk_log_action(orders, 'pretix.event.order.expired')
+    return len(candidates)
 
 
 @receiver(signal=periodic_task)
 def send_expiry_warnings(sender, **kwargs):
-    eventcache = {}
+    """
+    Dispatches one task per event with pending orders that have not yet been reminded of
+    their expiry.
+    """
     today = now().replace(hour=0, minute=0, second=0)
+    event_ids = Order.objects.filter(
+        expires__gte=today, expiry_reminder_sent=False, status=Order.STATUS_PENDING
+    ).order_by().values_list('event_id', flat=True).distinct()
+    for event_id in event_ids:
+        send_event_expiry_warnings.apply_async(args=(event_id,))
+
+
+@app.task(base=ProfiledTask)
+def send_event_expiry_warnings(event: int):
+    event = Event.objects.get(pk=event)
+    days = event.settings.get('mail_days_order_expire_warning', as_type=int)
+    if not days:
+        return
+    today = now().replace(hour=0, minute=0, second=0)
+    while _send_expiry_warnings_chunk(event, today, today + timedelta(days=days + 1)):
+        pass
 
-    for o in Order.objects.filter(expires__gte=today, expiry_reminder_sent=False, status=Order.STATUS_PENDING).select_related('event'):
-        settings = eventcache.get(o.event.pk, None)
-        if settings is None:
-            settings = o.event.settings
-            eventcache[o.event.pk] = settings
 
-        days = settings.get('mail_days_order_expire_warning', as_type=int)
-        if days and (o.expires - today).days <= days:
-            o.expiry_reminder_sent = True
-            o.save()
-            try:
-                mail(
-                    o.email, _('Your order is about to expire: %(code)s') % {'code': o.code},
-                    settings.mail_text_order_expire_warning,
-                    {
-                        'event': o.event.name,
-                        'url': build_absolute_uri(o.event, 'presale:event.order', kwargs={
-                            'order': o.code,
-                            'secret': o.secret
-                        }),
-                        'expire_date': date_format(o.expires, 'SHORT_DATE_FORMAT')
-                    },
-                    o.event, locale=o.locale
-                )
-            except SendMailException:
-                logger.exception('Reminder email could not be sent')
-            else:
-                o.log_action('pretix.event.order.expire_warning_sent')
+@transaction.atomic
+def _send_expiry_warnings_chunk(event: Event, today: datetime, until: datetime) -> int:
+    ids = list(Order.objects.select_for_update().filter(
+        event=event, expires__gte=today, expires__lt=until, expiry_reminder_sent=False,
+        status=Order.STATUS_PENDING
+    ).order_by('pk').values_list('pk', flat=True)[:EXPIRY_CHUNK_SIZE])
+    if not ids:
+        return 0
+
+    Order.objects.filter(pk__in=ids).update(expiry_reminder_sent=True)
+    transaction.on_commit(lambda: group([send_expiry_warning.s(pk) for pk in ids]).apply_async())
+    return len(ids)
+
+
+@app.task(base=ProfiledTask)
+def send_expiry_warning(order: int):
+    o = Order.objects.select_related('event').get(pk=order)
+    try:
+        mail(
+            o.email, _('Your order is about to expire: %(code)s') % {'code': o.code},
+            o.event.settings.mail_text_order_expire_warning,
+            {
+                'event': o.event.name,
+                'url': build_absolute_uri(o.event, 'presale:event.order', kwargs={
+                    'order': o.code,
+                    'secret': o.secret
+                }),
+                'expire_date': date_format(o.expires, 'SHORT_DATE_FORMAT')
+            },
+            o.event, locale=o.locale
+        )
+    except SendMailException:
+        logger.exception('Reminder email could not be sent')
+    else:
+        o.log_action('pretix.event.order.expire_warning_sent')
 
 
 class OrderChangeManager:
@@ -562,8 +662,8 @@ class OrderChangeManager:
         if not self._operations:
             # Do nothing
             return
-        with transaction.atomic():
-            with self.order.event.lock():
+        with transaction.atomic(), buffered_logging(), buffered_counters():
+            with _lock_order(self.order, {q.pk for q in self._quotadiff}):
                 if self.order.status != Order.STATUS_PENDING:
                     raise OrderError(self.error_messages['not_pending'])
                 self._check_free_to_paid()
@@ -0,0 +1,224 @@
+import contextlib
+import threading
+from collections import Counter, defaultdict
+from typing import Iterable, Optional, Set, Tuple
+
+from django.db.models import Count, F
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_save,
+)
+from django.dispatch import receiver
+
+from pretix.base.models import Order, OrderPosition, Quota, QuotaCounter
+
+#: Maps the order states that are counted against a quota to the name of the
+#: respective field on :py:class:`QuotaCounter`.
+COUNTED_STATES = {
+    Order.STATUS_PAID: 'paid',
+    Order.STATUS_PENDING: 'pending',
+}
+
+_counter_buffer = threading.local()
+
+
+def _position_quotas(item_id: int, variation_id: Optional[int]) -> Counter:
+    if variation_id:
+        qs = Quota.variations.through.objects.filter(itemvariation_id=variation_id)
+    else:
+        qs = Quota.items.through.objects.filter(item_id=item_id)
+    return Counter(qs.values_list('quota_id', flat=True))
+
+
+def _order_quotas(order_id: int) -> Counter:
+    return quotas_for_orders([order_id])
+
+
+def quotas_for_orders(order_ids: Iterable[int]) -> Counter:
+    """
+    Returns a ``Counter`` mapping the IDs of quotas to the number of positions of the
+    given orders that count against them.
+    """
+    quotas = Counter()
+    qs = OrderPosition.objects.filter(order_id__in=order_ids).order_by()
+    for q, cnt in qs.filter(variation__isnull=True).values('item__quotas').annotate(
+            cnt=Count('id')).values_list('item__quotas', 'cnt'):
+        quotas[q] += cnt
+    for q, cnt in qs.filter(variation__isnull=False).values('variation__quotas').annotate(
+            cnt=Count('id')).values_list('variation__quotas', 'cnt'):
+        quotas[q] += cnt
+    return quotas
+
+
+def quotas_for_products(products: Iterable[Tuple[int, Optional[int]]]) -> Set[int]:
+    """
+    Returns the IDs of all quotas that apply to the given products.
+
+    :param products: An iterable of ``(item_id, variation_id)`` tuples, with ``variation_id``
+                     being ``None`` for products without variations
+    """
+    items, variations = set(), set()
+    for item_id, variation_id in products:
+        if variation_id:
+            variations.add(variation_id)
+        else:
+            items.add(item_id)
+    quotas = set()
+    if items:
+        quotas |= set(Quota.items.through.objects.filter(item_id__in=items).values_list('quota_id', flat=True))
+    if variations:
+        quotas |= set(Quota.variations.through.objects.filter(itemvariation_id__in=variations).values_list(
+            'quota_id', flat=True))
+    return quotas
+
+
+def update_counters(quotas: Counter, status: str, sign: int=1) -> None:
+    """
+    Adds the given number of positions to the counters of the given quotas.
+
+    :param quotas: A ``Counter`` mapping quota IDs to numbers of positions
+    :param status: The order status the positions are in. Nothing happens if the
+                   status is not counted against quotas.
+    :param sign: ``1`` to add the positions, ``-1`` to remove them
+    """
+    field = COUNTED_STATES.get(status)
+    if not field:
+        return
+    deltas = defaultdict(Counter)
+    for quota_id, cnt in quotas.items():
+        if quota_id is None or not cnt:
+            continue
+        deltas[quota_id][field] += sign * cnt
+    if getattr(_counter_buffer, 'depth', 0):
+        for quota_id, d in deltas.items():
+            _counter_buffer.deltas[quota_id].update(d)
+    else:
+        _write_counters(deltas)
+
+
+def _write_counters(deltas: dict) -> None:
+    for quota_id, d in sorted(deltas.items()):
+        d = {field: F(field) + cnt for field, cnt in d.items() if cnt}
+        if d:
+            QuotaCounter.objects.filter(quota_id=quota_id).update(**d)
+
+
+@contextlib.contextmanager
+def buffered_counters():
+    """
+    Within this context manager, changes to the quota counters are not written one by one,
+    but summed up and written with a single query per quota when the block is left. Blocks
+    can be nested, the changes are written at the end of the outermost one. If the block is
+    left with an exception, the changes are discarded, so this should only be used within a
+    transaction that is rolled back in this case as well.
+    """
+    depth = getattr(_counter_buffer, 'depth', 0)
+    if not depth:
+        _counter_buffer.deltas = defaultdict(Counter)
+    _counter_buffer.depth = depth + 1
+    try:
+        yield
+    except BaseException:
+        _counter_buffer.depth = depth
+        if not depth:
+            _counter_buffer.deltas = defaultdict(Counter)
+        raise
+    _counter_buffer.depth = depth
+    if not depth:
+        deltas, _counter_buffer.deltas = _counter_buffer.deltas, defaultdict(Counter)
+        _write_counters(deltas)
+
+
+def recompute_counter(quota: Quota) -> Tuple[int, int]:
+    """
+    Recounts the paid and pending positions of a quota and stores the result, creating the
+    counter if it does not yet exist. Returns the drift as returned by
+    :py:meth:`QuotaCounter.recompute`.
+    """
+    counter, created = QuotaCounter.objects.get_or_create(quota=quota)
+    return counter.recompute()
+
+
+def recompute_counters(quota_ids: Iterable[int]) -> None:
+    for quota in Quota.objects.filter(pk__in=quota_ids):
+        recompute_counter(quota)
+
+
+@receiver(post_save, sender=Quota, dispatch_uid="quota_counter_create")
+def quota_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        QuotaCounter.objects.get_or_create(quota=instance)
+
+
+@receiver(pre_save, sender=Order, dispatch_uid="quota_counter_order_pre_save")
+def order_pre_save(sender, instance, raw=False, **kwargs):
+    # Orders loaded from the database already know their stored status, see Order.from_db
+    if instance.pk and not raw and not hasattr(instance, '_quota_counter_status'):
+        instance._quota_counter_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order, dispatch_uid="quota_counter_order_post_save")
+def order_post_save(sender, instance, created, raw=False, **kwargs):
+    old_status = getattr(instance, '_quota_counter_status', None)
+    instance._quota_counter_status = instance.status
+    if created or raw or COUNTED_STATES.get(old_status) == COUNTED_STATES.get(instance.status):
+        return
+    quotas = _order_quotas(instance.pk)
+    update_counters(quotas, old_status, -1)
+    update_counters(quotas, instance.status, 1)
+
+
+@receiver(pre_save, sender=OrderPosition, dispatch_uid="quota_counter_position_pre_save")
+def position_pre_save(sender, instance, raw=False, **kwargs):
+    # Positions loaded from the database already know their stored product, see OrderPosition.from_db
+    if instance.pk and not raw and not hasattr(instance, '_quota_counter_product'):
+        instance._quota_counter_product = OrderPosition.objects.filter(pk=instance.pk).values_list(
+            'item_id', 'variation_id'
+        ).first()
+
+
+@receiver(post_save, sender=OrderPosition, dispatch_uid="quota_counter_position_post_save")
+def position_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_product = None if created else getattr(instance, '_quota_counter_product', None)
+    new_product = (instance.item_id, instance.variation_id)
+    instance._quota_counter_product = new_product
+    if old_product == new_product:
+        return
+    status = instance.order.status
+    if status not in COUNTED_STATES:
+        return
+    if old_product is not None:
+        update_counters(_position_quotas(*old_product), status, -1)
+    update_counters(_position_quotas(*new_product), status, 1)
+
+
+@receiver(post_delete, sender=OrderPosition, dispatch_uid="quota_counter_position_post_delete")
+def position_post_delete(sender, instance, **kwargs):
+    try:
+        status = instance.order.status
+    except Order.DoesNotExist:
+        return
+    update_counters(_position_quotas(instance.item_id, instance.variation_id), status, -1)
+
+
+def _quota_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # The set of affected quotas is not passed to the post_clear signal
+        instance._quota_counter_cleared = list(instance.quotas.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        if reverse:
+            recompute_counters(pk_set)
+        else:
+            recompute_counter(instance)
+    elif action == 'post_clear':
+        if reverse:
+            recompute_counters(getattr(instance, '_quota_counter_cleared', []))
+        else:
+            recompute_counter(instance)
+
+
+m2m_changed.connect(_quota_products_changed, sender=Quota.items.through,
+                    dispatch_uid="quota_counter_items_changed")
+m2m_changed.connect(_quota_products_changed, sender=Quota.variations.through,
+                    dispatch_uid="quota_counter_variations_changed")
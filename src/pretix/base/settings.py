@@ -128,6 +128,10 @@ DEFAULTS = {
         'default': 'False',
         'type': bool
     },
+    'presale_availability_cache_ttl': {
+        'default': '0',
+        'type': int
+    },
     'ticket_download': {
         'default': 'False',
         'type': bool
@@ -306,6 +310,57 @@ Your {event} team"""))
 }
 
 
+class LazyStorageFile(File):
+    """
+    A file in the default storage that is referenced by a setting. The name and URL of the
+    file are available without any I/O, the underlying storage object is only opened once
+    the content of the file is accessed, e.g. through ``read()``.
+    """
+
+    def __init__(self, name: str, mode: str='r'):
+        self.name = name
+        self.mode = mode
+        self._file = None
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = default_storage.open(self.name, self.mode)
+        return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
+
+    @property
+    def url(self) -> str:
+        return default_storage.url(self.name)
+
+    @property
+    def size(self) -> int:
+        if self._file is not None:
+            return self._file.size
+        return default_storage.size(self.name)
+
+    @property
+    def closed(self) -> bool:
+        return self._file is None or self._file.closed
+
+    def open(self, mode: str=None):
+        if self._file is not None and not self._file.closed and (mode is None or mode == self.mode):
+            self.seek(0)
+        else:
+            self.close()
+            self.mode = mode or self.mode
+            self._file = default_storage.open(self.name, self.mode)
+        return self
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 class SettingsProxy:
     """
     This object allows convenient access to settings stored in the
@@ -320,6 +375,49 @@ class SettingsProxy:
         self._cached_obj = None
         self._write_cached_obj = None
         self._type = type
+        self._generation = 0
+        self._clear_snapshot()
+
+    def _chain_generation(self) -> tuple:
+        """
+        Returns a value that changes whenever the settings of this object or one of its
+        parents are changed or flushed through this process' proxies.
+        """
+        if self._parent:
+            return (self._generation,) + self._parent.settings._chain_generation()
+        return (self._generation,)
+
+    def _clear_snapshot(self) -> None:
+        self._snapshot_generation = None
+        self._resolved_raw = None
+        self._resolved = {}
+
+    def _snapshot(self) -> Dict[tuple, Any]:
+        """
+        Returns a dictionary of already unserialized values, keyed by ``(key, as_type)``, that is
+        valid as long as neither this object's nor any parent's settings have been changed.
+        As settings proxies live on model instances, the snapshot is usually built once per
+        request or task.
+        """
+        generation = self._chain_generation()
+        if generation != self._snapshot_generation:
+            self._clear_snapshot()
+            self._snapshot_generation = generation
+        return self._resolved
+
+    def _raw(self) -> Dict[str, str]:
+        """
+        Returns the serialized values of all keys set on this object, its parents or in the
+        hardcoded defaults, with the inheritance already applied.
+        """
+        self._snapshot()
+        if self._resolved_raw is None:
+            raw = {k: v['default'] for k, v in DEFAULTS.items()}
+            if self._parent:
+                raw.update(self._parent.settings._raw())
+            raw.update(self._cache())
+            self._resolved_raw = raw
+        return self._resolved_raw
 
     def _cache(self) -> Dict[str, Any]:
         if self._cached_obj is None:
@@ -343,6 +441,7 @@ class SettingsProxy:
         self._flush_external_cache()
 
     def _flush_external_cache(self):
+        self._generation += 1
         cache.delete('settings_{}_{}'.format(self._obj.settings_namespace, self._obj.pk))
 
     def freeze(self) -> dict:
@@ -374,12 +473,7 @@ class SettingsProxy:
         elif as_type == bool or value in ('True', 'False'):
             return value == 'True'
         elif as_type == File:
-            try:
-                fi = default_storage.open(value[7:], 'r')
-                fi.url = default_storage.url(value[7:])
-                return fi
-            except OSError:
-                return False
+            return LazyStorageFile(value[7:])
         elif as_type == datetime:
             return dateutil.parser.parse(value)
         elif as_type == date:
@@ -429,18 +523,18 @@ class SettingsProxy:
         if as_type is None and key in DEFAULTS:
             as_type = DEFAULTS[key]['type']
 
-        if key in self._cache():
-            value = self._cache()[key]
-        else:
-            value = None
-            if self._parent:
-                value = self._parent.settings.get(key, as_type=str)
-            if value is None and key in DEFAULTS:
-                value = DEFAULTS[key]['default']
-            if value is None and default is not None:
-                value = default
-
-        return self._unserialize(value, as_type)
+        snapshot = self._snapshot()
+        try:
+            value = snapshot[key, as_type]
+        except KeyError:
+            value = self._unserialize(self._raw().get(key), as_type)
+            # Mutable values and open files are not shared between callers
+            if not isinstance(value, (dict, list, File, Model)):
+                snapshot[key, as_type] = value
+
+        if value is None and default is not None:
+            return self._unserialize(default, as_type)
+        return value
 
     def __getitem__(self, key: str) -> Any:
         return self.get(key)
@@ -1,3 +1,5 @@
+import base64
+
 from django.conf import settings
 from django.http import HttpResponse
 
@@ -24,7 +26,7 @@ def serve_metrics(request):
     if method.lower() != "basic":
         return unauthed_response()
 
-    user, passphrase = credentials.strip().decode("base64").split(":", 1)
+    user, passphrase = base64.b64decode(credentials.strip()).decode("utf-8").split(":", 1)
 
     if user != settings.METRICS_USER:
         return unauthed_response()
@@ -35,7 +37,7 @@ def serve_metrics(request):
     m = metrics.metric_values()
 
     output = []
-    for metric, value in m:
+    for metric, value in sorted(m.items()):
         output.append("{} {}".format(metric, str(value)))
 
     content = "\n".join(output)
@@ -145,6 +145,13 @@ class EventSettingsForm(SettingsForm):
         help_text=_("Publicly show how many tickets of a certain type are still available."),
         required=False
     )
+    presale_availability_cache_ttl = forms.IntegerField(
+        min_value=0, max_value=60,
+        label=_("Cache product availability"),
+        help_text=_("If set to a number of seconds, the availability of the products shown on the front page will "
+                    "only be recomputed that often. This can greatly reduce load on a sale launch, but the front page "
+                    "might show products as available that were sold out a few seconds ago. Leave at 0 to disable."),
+    )
     attendee_names_asked = forms.BooleanField(
         label=_("Ask for attendee names"),
         help_text=_("Ask for a name for all tickets which include admission to the event."),
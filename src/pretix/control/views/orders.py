@@ -3,7 +3,8 @@ from itertools import groupby
 
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.db.models import Q
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
 from django.http import FileResponse, Http404, HttpResponseNotAllowed
 from django.shortcuts import redirect, render
 from django.utils.functional import cached_property
@@ -13,7 +14,7 @@ from django.views.generic import DetailView, ListView, TemplateView, View
 
 from pretix.base.i18n import language
 from pretix.base.models import (
-    CachedFile, Invoice, Item, ItemVariation, Order, Quota,
+    CachedFile, Invoice, Item, ItemVariation, Order, OrderPosition, Quota,
 )
 from pretix.base.services.export import export
 from pretix.base.services.invoices import (
@@ -40,9 +41,10 @@ from pretix.multidomain.urlreverse import build_absolute_uri
 class OrderList(EventPermissionRequiredMixin, ListView):
     model = Order
     context_object_name = 'orders'
-    paginate_by = 30
+    page_size = 30
     template_name = 'pretixcontrol/orders/index.html'
     permission = 'can_view_orders'
+    orderings = ('-code', 'code', '-email', 'email', '-total', 'total', '-datetime', 'datetime', '-status', 'status')
 
     def get_queryset(self):
         qs = Order.objects.filter(
@@ -50,9 +52,7 @@ class OrderList(EventPermissionRequiredMixin, ListView):
         )
         if self.request.GET.get("user", "") != "":
             u = self.request.GET.get("user", "")
-            qs = qs.filter(
-                Q(email__icontains=u) | Q(positions__attendee_name__icontains=u)
-            )
+            qs = qs.filter(search_index__contains=u.lower())
         if self.request.GET.get("status", "") != "":
             s = self.request.GET.get("status", "")
             if s == 'o':
@@ -63,17 +63,61 @@ class OrderList(EventPermissionRequiredMixin, ListView):
                 qs = qs.filter(status=s)
         if self.request.GET.get("item", "") != "":
             i = self.request.GET.get("item", "")
-            qs = qs.filter(positions__item_id__in=(i,))
+            qs = qs.filter(pk__in=OrderPosition.objects.filter(item_id__in=(i,)).values('order_id'))
         if self.request.GET.get("provider", "") != "":
             p = self.request.GET.get("provider", "")
             qs = qs.filter(payment_provider=p)
-        if self.request.GET.get("ordering", "") != "":
-            p = self.request.GET.get("ordering", "")
-            p_admissable = ('-code', 'code', '-email', 'email', '-total', 'total', '-datetime', 'datetime', '-status', 'status')
-            if p in p_admissable:
-                qs = qs.order_by(p)
-
-        return qs.distinct()
+        return qs
+
+    def get_ordering(self):
+        ordering = self.request.GET.get("ordering", "")
+        return ordering if ordering in self.orderings else '-datetime'
+
+    def paginate_keyset(self, qs):
+        """
+        Returns one page of orders as well as whether there are previous and following pages.
+        Instead of an offset, the ``after`` and ``before`` parameters contain the ID of the last
+        or first order of the adjacent page, such that deep pages are as cheap as the first one.
+        """
+        ordering = self.get_ordering()
+        field = ordering.lstrip('-')
+        if field == 'email':
+            # NULL values would not be comparable in the range condition below
+            field = 'email_sort'
+            qs = qs.annotate(email_sort=Coalesce('email', Value('')))
+
+        backwards = 'before' in self.request.GET
+        descending = ordering.startswith('-') != backwards
+        op = 'lt' if descending else 'gt'
+
+        cursor = self.request.GET.get('before' if backwards else 'after')
+        if cursor:
+            try:
+                last = Order.objects.filter(event=self.request.event, pk=int(cursor))
+                if field == 'email_sort':
+                    last = last.annotate(email_sort=Coalesce('email', Value('')))
+                value = last.values_list(field, flat=True).get()
+            except (ValueError, Order.DoesNotExist):
+                cursor = None
+            else:
+                qs = qs.filter(Q(**{field + '__' + op: value}) | Q(**{field: value, 'pk__' + op: int(cursor)}))
+
+        qs = qs.order_by(*(('-' + field, '-pk') if descending else (field, 'pk')))
+        orders = list(qs[:self.page_size + 1])
+        has_more = len(orders) > self.page_size
+        orders = orders[:self.page_size]
+        has_cursor = bool(cursor) and bool(orders)
+        if backwards:
+            orders.reverse()
+            return orders, has_more, has_cursor
+        return orders, has_cursor, has_more
+
+    def _page_url(self, param, order):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[param] = order.pk
+        return '?' + params.urlencode()
 
     def get_payment_providers(self):
         providers = []
@@ -88,6 +132,11 @@ class OrderList(EventPermissionRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
+        ctx['orders'], has_previous, has_next = self.paginate_keyset(self.object_list)
+        if has_previous:
+            ctx['previous_url'] = self._page_url('before', ctx['orders'][0])
+        if has_next:
+            ctx['next_url'] = self._page_url('after', ctx['orders'][-1])
         ctx['items'] = Item.objects.filter(event=self.request.event)
         ctx['filtered'] = ("status" in self.request.GET or "item" in self.request.GET or "user" in self.request.GET or "provider" in self.request.GET)
         ctx['providers'] = self.get_payment_providers()
@@ -149,6 +198,7 @@ class OrderDetail(OrderView):
         ctx['payment'] = self.payment_provider.order_control_render(self.request, self.object)
         ctx['invoices'] = list(self.order.invoices.all().select_related('event'))
         ctx['comment_form'] = CommentForm(initial={'comment': self.order.comment})
+        ctx['logs'], ctx['logs_next'] = self.order.all_logentries().page(self.request.GET.get('logs'))
         return ctx
 
     def get_items(self):
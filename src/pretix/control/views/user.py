@@ -109,6 +109,9 @@ class UserHistoryView(TemplateView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx['user'] = self.request.user
+        ctx['logs'], ctx['logs_next'] = self.request.user.all_logentries.select_related('user').page(
+            self.request.GET.get('logs')
+        )
         return ctx
 
 
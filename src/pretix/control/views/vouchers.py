@@ -1,21 +1,20 @@
-import csv
-import io
-
 from django.conf import settings
 from django.contrib import messages
 from django.core.urlresolvers import resolve, reverse
 from django.db import transaction
 from django.db.models import Case, Count, IntegerField, Q, Sum, When
 from django.http import (
-    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect,
-    JsonResponse,
+    Http404, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse,
+    StreamingHttpResponse,
 )
 from django.utils.timezone import now
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import get_language, ugettext_lazy as _
 from django.views.generic import (
     CreateView, DeleteView, ListView, TemplateView, UpdateView, View,
 )
 
+from pretix.base.exporter import csv_chunks
+from pretix.base.i18n import language
 from pretix.base.models import Voucher
 from pretix.base.models.vouchers import _generate_random_code
 from pretix.control.forms.vouchers import VoucherBulkForm, VoucherForm
@@ -54,16 +53,24 @@ class VoucherList(EventPermissionRequiredMixin, ListView):
         return super().get(request, *args, **kwargs)
 
     def _download_csv(self):
-        output = io.StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, delimiter=",")
+        # The rows are only rendered after the view returned, when the request's language
+        # is no longer active
+        r = StreamingHttpResponse(csv_chunks(self._csv_rows(get_language())), content_type='text/csv')
+        r['Content-Disposition'] = 'attachment; filename="vouchers.csv"'
+        return r
+
+    def _csv_rows(self, lng):
+        with language(lng):
+            yield from self._csv_rows_translated()
 
+    def _csv_rows_translated(self):
         headers = [
             _('Voucher code'), _('Valid until'), _('Product'), _('Reserve quota'), _('Bypass quota'),
             _('Price'), _('Tag'), _('Redeemed')
         ]
-        writer.writerow(headers)
+        yield headers
 
-        for v in self.get_queryset():
+        for v in self.get_queryset().iterator():
             if v.item:
                 if v.variation:
                     prod = '%s – %s' % (str(v.item.name), str(v.variation.name))
@@ -81,11 +88,7 @@ class VoucherList(EventPermissionRequiredMixin, ListView):
                 v.tag,
                 _("Yes") if v.redeemed else _("No"),
             ]
-            writer.writerow(row)
-
-        r = HttpResponse(output.getvalue().encode("utf-8"), content_type='text/csv')
-        r['Content-Disposition'] = 'attachment; filename="vouchers.csv"'
-        return r
+            yield row
 
 
 class VoucherTags(EventPermissionRequiredMixin, TemplateView):
@@ -0,0 +1,28 @@
+import time
+from typing import Callable
+
+
+class Stopwatch:
+    """
+    A context manager that measures the time spent in its block with the highest available
+    resolution. The result is available as ``duration`` (in seconds) after the block.
+    """
+
+    def __enter__(self):
+        self.duration = None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.perf_counter() - self._start
+
+
+def measure(func: Callable, iterations: int=1) -> float:
+    """
+    Calls ``func`` without arguments ``iterations`` times and returns the mean duration of
+    a call in seconds.
+    """
+    with Stopwatch() as sw:
+        for i in range(iterations):
+            func()
+    return sw.duration / iterations
@@ -1,6 +1,7 @@
 import contextlib
 
 from django.db import transaction
+from django.db.models import prefetch_related_objects
 
 
 class DummyRollbackException(Exception):
@@ -26,3 +27,24 @@ def rolledback_transaction():
         pass
     else:
         raise Exception('Invalid state, should have rolled back.')
+
+
+def chunked_iterator(qs, chunk_size: int=1000):
+    """
+    Iterates over a queryset like ``.iterator()`` does, i.e. without filling the queryset's
+    result cache, but still performs the ``prefetch_related`` lookups of the queryset. They are
+    executed for chunks of ``chunk_size`` objects at a time, such that only one chunk of objects
+    and related objects is kept in memory.
+    """
+    lookups = qs._prefetch_related_lookups
+    qs = qs.prefetch_related(None)
+    chunk = []
+    for obj in qs.iterator():
+        chunk.append(obj)
+        if len(chunk) >= chunk_size:
+            prefetch_related_objects(chunk, *lookups)
+            yield from chunk
+            chunk = []
+    if chunk:
+        prefetch_related_objects(chunk, *lookups)
+        yield from chunk
@@ -4,7 +4,6 @@ from urllib.parse import urlparse
 from django.conf import settings
 from django.contrib.sessions.middleware import \
     SessionMiddleware as BaseSessionMiddleware
-from django.core.cache import cache
 from django.core.exceptions import DisallowedHost
 from django.core.urlresolvers import set_urlconf
 from django.http.request import split_domain_port
@@ -13,8 +12,7 @@ from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
 from django.utils.http import cookie_date
 
-from pretix.base.models import Organizer
-from pretix.multidomain.models import KnownDomain
+from pretix.multidomain.routing import get_route
 
 LOCAL_HOST_NAMES = ('testserver', 'localhost')
 
@@ -39,17 +37,10 @@ class MultiDomainMiddleware(MiddlewareMixin):
             request.host = domain
             request.port = int(port) if port else None
 
-            orga = cache.get('pretix_multidomain_organizer_{}'.format(domain))
-            if orga is None:
-                try:
-                    kd = KnownDomain.objects.select_related('organizer').get(domainname=domain)  # noqa
-                    orga = kd.organizer
-                except KnownDomain.DoesNotExist:
-                    orga = False
-                cache.set('pretix_multidomain_organizer_{}'.format(domain), orga.pk if orga else False, 3600)
-
-            if orga:
-                request.organizer = orga if isinstance(orga, Organizer) else Organizer.objects.get(pk=orga)
+            route = get_route(domain=domain)
+            if route:
+                request.organizer = route.organizer
+                request.route = route
                 request.urlconf = "pretix.multidomain.subdomain_urlconf"
             else:
                 if settings.DEBUG or domain in LOCAL_HOST_NAMES or domain == default_domain:
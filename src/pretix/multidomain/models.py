@@ -1,4 +1,3 @@
-from django.core.cache import cache
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
@@ -16,14 +15,29 @@ class KnownDomain(models.Model):
     def __str__(self):
         return self.domainname
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored name, the routing cache needs to forget it if it is changed
+        instance._loaded_domainname = instance.__dict__.get('domainname')
+        return instance
+
     def save(self, *args, **kwargs):
+        from pretix.multidomain.routing import invalidate_domain
+
+        domainnames = [self.domainname, getattr(self, '_loaded_domainname', None)]
+        previous = KnownDomain.objects.filter(pk__in=[d for d in domainnames if d]).select_related('organizer')
+        organizers = [self.organizer] + [p.organizer for p in previous]
         super().save(*args, **kwargs)
         if self.organizer:
             self.organizer.get_cache().clear()
-        cache.delete('pretix_multidomain_organizer_{}'.format(self.domainname))
+        invalidate_domain(domainnames, organizers)
+        self._loaded_domainname = self.domainname
 
     def delete(self, *args, **kwargs):
+        from pretix.multidomain.routing import invalidate_domain
+
         if self.organizer:
             self.organizer.get_cache().clear()
-        cache.delete('pretix_multidomain_organizer_{}'.format(self.domainname))
         super().delete(*args, **kwargs)
+        invalidate_domain([self.domainname], [self.organizer])
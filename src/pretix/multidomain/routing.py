@@ -0,0 +1,111 @@
+from typing import Iterable, Optional
+
+from django.db import DEFAULT_DB_ALIAS
+
+from pretix.base.cache import NamespacedCache
+from pretix.base.models import Event, Organizer
+from pretix.multidomain.models import KnownDomain
+
+ROUTE_TIMEOUT = 3600
+
+
+class Route:
+    """
+    Everything needed to route a storefront request to an organizer and its events, as
+    retrieved from the routing cache. Model instances are built freshly from the cached
+    field values for every request, so they can be used and modified like instances loaded
+    from the database.
+    """
+
+    def __init__(self, data: dict):
+        self.organizer = _from_values(Organizer, data['organizer'])
+        #: The custom domain of this organizer or ``None``
+        self.domain = data['domain']
+
+    def get_event(self, slug: str) -> Event:
+        """
+        Returns the organizer's event with the given slug or raises ``Event.DoesNotExist``.
+        """
+        c = _routing_cache()
+        key = _event_key(self.organizer.pk, slug)
+        values = c.get(key)
+        if values is None:
+            event = self.organizer.events.filter(slug=slug).first()
+            values = _values(event) if event else False
+            c.set(key, values, ROUTE_TIMEOUT)
+        if not values:
+            raise Event.DoesNotExist()
+        event = _from_values(Event, values)
+        event.organizer = self.organizer
+        return event
+
+
+def _routing_cache() -> NamespacedCache:
+    return NamespacedCache('pretix_multidomain_routing')
+
+
+def _event_key(organizer_id: int, slug: str) -> str:
+    return 'event:{}:{}'.format(organizer_id, slug)
+
+
+def _values(obj) -> list:
+    return [getattr(obj, f.attname) for f in obj._meta.concrete_fields]
+
+
+def _from_values(model, values: list):
+    return model.from_db(DEFAULT_DB_ALIAS, [f.attname for f in model._meta.concrete_fields], values)
+
+
+def get_route(domain: str=None, organizer: str=None) -> Optional[Route]:
+    """
+    Returns the :py:class:`Route` for the organizer that either owns the custom domain
+    ``domain`` or has the slug ``organizer``, or ``None`` if there is no such organizer.
+
+    The organizer and each of its events are cached separately. The entries are
+    invalidated when the respective known domain, organizer or event is saved or deleted,
+    such that routing a request usually does not need a single database query.
+    """
+    c = _routing_cache()
+    key = 'domain:{}'.format(domain) if domain else 'organizer:{}'.format(organizer)
+    data = c.get(key)
+    if data is None:
+        if domain:
+            kd = KnownDomain.objects.select_related('organizer').filter(domainname=domain).first()
+            orga = kd.organizer if kd else None
+        else:
+            orga = Organizer.objects.filter(slug=organizer).first()
+            kd = orga.domains.first() if orga else None
+        data = {
+            'organizer': _values(orga),
+            'domain': kd.domainname if kd else None,
+        } if orga else False
+        c.set(key, data, ROUTE_TIMEOUT)
+    return Route(data) if data else None
+
+
+def invalidate_domain(domainnames: Iterable[str], organizers: Iterable[Organizer]) -> None:
+    """
+    Invalidates the cached routes of a custom domain and of the given organizers, i.e. the
+    names and the organizers the domain had before and after the change.
+    """
+    keys = ['domain:{}'.format(d) for d in set(domainnames) if d]
+    keys += ['organizer:{}'.format(o.slug) for o in organizers if o]
+    _routing_cache().delete_many(keys)
+
+
+def invalidate_organizer(organizer: Organizer) -> None:
+    """
+    Invalidates the cached routes of an organizer. This needs to be called whenever the
+    organizer is saved or deleted.
+    """
+    keys = ['organizer:{}'.format(organizer.slug)]
+    keys += ['domain:{}'.format(d) for d in organizer.domains.values_list('domainname', flat=True)]
+    _routing_cache().delete_many(keys)
+
+
+def invalidate_event(event: Event) -> None:
+    """
+    Invalidates the cached route of an event. This needs to be called whenever the event
+    is saved or deleted.
+    """
+    _routing_cache().delete(_event_key(event.organizer_id, event.slug))
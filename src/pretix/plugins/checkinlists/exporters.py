@@ -1,12 +1,11 @@
-import csv
-import io
 from collections import OrderedDict
 
 from django import forms
 from django.utils.translation import ugettext as _
 
-from pretix.base.exporter import BaseExporter
+from pretix.base.exporter import BaseExporter, csv_chunks
 from pretix.base.models import Order, OrderPosition, Question
+from pretix.helpers.database import chunked_iterator
 
 
 class BaseCheckinList(BaseExporter):
@@ -61,10 +60,10 @@ class CSVCheckinList(BaseCheckinList):
             ]
         )
 
-    def render(self, form_data: dict):
-        output = io.StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, delimiter=",")
+    def stream(self, form_data: dict):
+        return 'checkin.csv', 'text/csv', csv_chunks(self._rows(form_data))
 
+    def _rows(self, form_data: dict):
         questions = list(Question.objects.filter(event=self.event, id__in=form_data['questions']))
         qs = OrderPosition.objects.filter(
             order__event=self.event, item_id__in=form_data['items']
@@ -92,9 +91,9 @@ class CSVCheckinList(BaseCheckinList):
         for q in questions:
             headers.append(str(q.question))
 
-        writer.writerow(headers)
+        yield headers
 
-        for op in qs:
+        for op in chunked_iterator(qs):
             row = [
                 op.order.code,
                 op.attendee_name,
@@ -111,6 +110,4 @@ class CSVCheckinList(BaseCheckinList):
             for q in questions:
                 row.append(acache.get(q.pk, ''))
 
-            writer.writerow(row)
-
-        return 'checkin.csv', 'text/csv', output.getvalue().encode("utf-8")
+            yield row
@@ -0,0 +1,32 @@
+from django.apps import AppConfig
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext_lazy as _
+
+from pretix import __version__ as version
+
+
+class ParquetExportApp(AppConfig):
+    name = 'pretix.plugins.parquetexport'
+    verbose_name = _("Parquet export")
+
+    class PretixPluginMeta:
+        name = _("Parquet exporter")
+        author = _("the pretix team")
+        version = version
+        description = _("This plugin allows you to export orders in the columnar Apache Parquet format for "
+                        "data analysis.")
+
+    def ready(self):
+        from . import signals  # NOQA
+
+    @cached_property
+    def compatibility_errors(self):
+        errs = []
+        try:
+            import pyarrow  # NOQA
+        except ImportError:
+            errs.append("Python package 'pyarrow' is not installed.")
+        return errs
+
+
+default_app_config = 'pretix.plugins.parquetexport.ParquetExportApp'
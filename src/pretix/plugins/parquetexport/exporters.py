@@ -0,0 +1,131 @@
+import os
+import tempfile
+from collections import OrderedDict
+from zipfile import ZipFile
+
+from django import forms
+from django.utils.translation import ugettext as _
+
+from pretix.base.exporter import BaseExporter
+from pretix.base.models import (
+    InvoiceAddress, Order, OrderPosition, QuestionAnswer,
+)
+
+
+class ParquetExporter(BaseExporter):
+    identifier = 'parquet'
+    verbose_name = _('Orders, positions and answers (Apache Parquet)')
+    #: Number of rows that are loaded from the database and written as one row group at once
+    chunk_size = 10000
+
+    @property
+    def export_form_fields(self):
+        return OrderedDict(
+            [
+                ('paid_only',
+                 forms.BooleanField(
+                     label=_('Only paid orders'),
+                     initial=True,
+                     required=False
+                 )),
+            ]
+        )
+
+    def _tables(self, form_data: dict):
+        """
+        Returns a list of ``(name, queryset, columns)`` tuples, one for each file in the export.
+        ``columns`` is a list of ``(column name, lookup, arrow type)`` tuples.
+        """
+        import pyarrow as pa
+
+        money = pa.decimal128(10, 2)
+        rate = pa.decimal128(7, 2)
+        timestamp = pa.timestamp('us', tz='UTC')
+
+        orders = self.event.orders.all()
+        if form_data['paid_only']:
+            orders = orders.filter(status=Order.STATUS_PAID)
+
+        return [
+            ('orders', orders, [
+                ('code', 'code', pa.string()),
+                ('status', 'status', pa.string()),
+                ('email', 'email', pa.string()),
+                ('locale', 'locale', pa.string()),
+                ('datetime', 'datetime', timestamp),
+                ('expires', 'expires', timestamp),
+                ('payment_date', 'payment_date', timestamp),
+                ('payment_provider', 'payment_provider', pa.string()),
+                ('payment_fee', 'payment_fee', money),
+                ('payment_fee_tax_rate', 'payment_fee_tax_rate', rate),
+                ('payment_fee_tax_value', 'payment_fee_tax_value', money),
+                ('total', 'total', money),
+            ]),
+            ('positions', OrderPosition.objects.filter(order__in=orders), [
+                ('id', 'id', pa.int64()),
+                ('order', 'order__code', pa.string()),
+                ('item', 'item_id', pa.int64()),
+                ('variation', 'variation_id', pa.int64()),
+                ('price', 'price', money),
+                ('tax_rate', 'tax_rate', rate),
+                ('tax_value', 'tax_value', money),
+                ('attendee_name', 'attendee_name', pa.string()),
+                ('secret', 'secret', pa.string()),
+            ]),
+            ('answers', QuestionAnswer.objects.filter(orderposition__order__in=orders), [
+                ('position', 'orderposition_id', pa.int64()),
+                ('question', 'question_id', pa.int64()),
+                ('answer', 'answer', pa.string()),
+            ]),
+            ('invoice_addresses', InvoiceAddress.objects.filter(order__in=orders), [
+                ('order', 'order__code', pa.string()),
+                ('company', 'company', pa.string()),
+                ('name', 'name', pa.string()),
+                ('street', 'street', pa.string()),
+                ('zipcode', 'zipcode', pa.string()),
+                ('city', 'city', pa.string()),
+                ('country', 'country', pa.string()),
+                ('vat_id', 'vat_id', pa.string()),
+            ]),
+        ]
+
+    def _write_table(self, path: str, qs, columns: list):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([pa.field(name, arrow_type) for name, lookup, arrow_type in columns])
+
+        def batch(rows):
+            return pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                schema=schema
+            )
+
+        writer = pq.ParquetWriter(path, schema)
+        try:
+            rows = []
+            for row in qs.order_by('pk').values_list(*[lookup for name, lookup, arrow_type in columns]).iterator():
+                rows.append(row)
+                if len(rows) >= self.chunk_size:
+                    writer.write_table(batch(rows))
+                    rows = []
+            if rows:
+                writer.write_table(batch(rows))
+        finally:
+            writer.close()
+
+    def _chunks(self, form_data: dict):
+        with tempfile.TemporaryDirectory() as d:
+            with ZipFile(os.path.join(d, 'tmp.zip'), 'w') as zipf:
+                for name, qs, columns in self._tables(form_data):
+                    path = os.path.join(d, '{}.parquet'.format(name))
+                    self._write_table(path, qs, columns)
+                    zipf.write(path, '{}.parquet'.format(name))
+                    os.unlink(path)
+
+            with open(os.path.join(d, 'tmp.zip'), 'rb') as zipf:
+                for chunk in iter(lambda: zipf.read(1024 * 1024), b''):
+                    yield chunk
+
+    def stream(self, form_data: dict):
+        return 'orders-parquet.zip', 'application/zip', self._chunks(form_data)
@@ -0,0 +1,9 @@
+from django.dispatch import receiver
+
+from pretix.base.signals import register_data_exporters
+
+
+@receiver(register_data_exporters, dispatch_uid="export_parquet")
+def register_parquet(sender, **kwargs):
+    from .exporters import ParquetExporter
+    return ParquetExporter
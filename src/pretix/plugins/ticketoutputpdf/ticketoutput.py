@@ -6,7 +6,6 @@ from io import BytesIO
 from django import forms
 from django.contrib.staticfiles import finders
 from django.core.files import File
-from django.core.files.storage import default_storage
 from django.utils.translation import ugettext_lazy as _
 
 from pretix.base.ticketoutput import BaseTicketOutput
@@ -108,9 +107,11 @@ class PdfTicketOutput(BaseTicketOutput):
         new_pdf = PdfFileReader(buffer)
         output = PdfFileWriter()
         bg_file = self.settings.get('background', as_type=File)
-        if isinstance(bg_file, File):
-            bgf = default_storage.open(bg_file.name, "rb")
-        else:
+        try:
+            bgf = bg_file.open("rb") if bg_file else None
+        except OSError:
+            bgf = None
+        if bgf is None:
             bgf = open(finders.find('pretixpresale/pdf/ticket_default_a4.pdf'), "rb")
         bg_pdf = PdfFileReader(bgf)
         for page in new_pdf.pages:
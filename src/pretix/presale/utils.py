@@ -8,7 +8,7 @@ from django.utils.translation import ugettext_lazy as _
 
 from pretix.base.middleware import LocaleMiddleware
 from pretix.base.models import Event, EventPermission, Organizer
-from pretix.multidomain.urlreverse import get_domain
+from pretix.multidomain.routing import get_route
 from pretix.presale.signals import process_request, process_response
 
 
@@ -23,31 +23,20 @@ def _detect_event(request):
                 path = "/" + request.get_full_path().split("/", 2)[-1]
                 return redirect(path)
 
-            request.event = request.organizer.events\
-                .get(
-                    slug=url.kwargs['event'],
-                    organizer=request.organizer,
-                )
-            request.organizer = request.organizer
+            request.event = request.route.get_event(url.kwargs['event'])
         else:
             # We are on our main domain
-            if 'event' in url.kwargs and 'organizer' in url.kwargs:
-                request.event = Event.objects\
-                    .select_related('organizer')\
-                    .get(
-                        slug=url.kwargs['event'],
-                        organizer__slug=url.kwargs['organizer']
-                    )
-                request.organizer = request.event.organizer
-            elif 'organizer' in url.kwargs:
-                request.organizer = Organizer.objects.get(
-                    slug=url.kwargs['organizer']
-                )
-            else:
+            if 'organizer' not in url.kwargs:
                 raise Http404()
+            route = get_route(organizer=url.kwargs['organizer'])
+            if not route:
+                raise Organizer.DoesNotExist()
+            request.organizer = route.organizer
+            if 'event' in url.kwargs:
+                request.event = route.get_event(url.kwargs['event'])
 
             # If this organizer has a custom domain, send the user there
-            domain = get_domain(request.organizer)
+            domain = route.domain
             if domain:
                 if request.port and request.port not in (80, 443):
                     domain = '%s:%d' % (domain, request.port)
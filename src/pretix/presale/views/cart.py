@@ -183,6 +183,7 @@ class RedeemView(EventViewMixin, TemplateView):
             quotac__gt=0
         ).distinct().order_by('category__position', 'category_id', 'position', 'name')
 
+        quota_cache = {}
         for item in items:
             item.available_variations = list(item.variations.filter(active=True, quotas__isnull=False).distinct())
             if self.voucher.item_id and self.voucher.variation_id:
@@ -193,7 +194,7 @@ class RedeemView(EventViewMixin, TemplateView):
                 if self.voucher.allow_ignore_quota or self.voucher.block_quota:
                     item.cached_availability = (Quota.AVAILABILITY_OK, 1)
                 else:
-                    item.cached_availability = item.check_quotas()
+                    item.cached_availability = item.check_quotas(_cache=quota_cache)
                 if self.voucher.price is not None:
                     item.price = self.voucher.price
                 else:
@@ -203,7 +204,7 @@ class RedeemView(EventViewMixin, TemplateView):
                     if self.voucher.allow_ignore_quota or self.voucher.block_quota:
                         var.cached_availability = (Quota.AVAILABILITY_OK, 1)
                     else:
-                        var.cached_availability = list(var.check_quotas())
+                        var.cached_availability = list(var.check_quotas(_cache=quota_cache))
                     if self.voucher.price is not None:
                         var.price = self.voucher.price
                     else:
@@ -1,10 +1,11 @@
 import sys
+import time
 
 from django.db.models import Count, Prefetch, Q
 from django.utils.timezone import now
 from django.views.generic import TemplateView
 
-from pretix.base.models import ItemVariation
+from pretix.base.models import ItemVariation, Quota
 
 from . import CartMixin, EventViewMixin
 
@@ -23,6 +24,66 @@ def item_group_by_category(items):
     )
 
 
+def _compute_availabilities(items) -> dict:
+    # Compute the availability of all relevant quotas at once
+    quotas = set()
+    for item in items:
+        if not item.has_variations:
+            quotas.update(item.quotas.all())
+        for var in item.available_variations:
+            quotas.update(var.quotas.all())
+    quota_cache = Quota.objects.bulk_availability(quotas)
+
+    availabilities = {}
+    for item in items:
+        if not item.has_variations:
+            availabilities['item:%d' % item.pk] = tuple(item.check_quotas(_cache=quota_cache))
+        for var in item.available_variations:
+            availabilities['variation:%d' % var.pk] = tuple(var.check_quotas(_cache=quota_cache))
+    return availabilities
+
+
+def get_availabilities(event, items) -> dict:
+    """
+    Returns a dictionary of the availability tuples of the given items and their variations,
+    keyed by ``item:<id>`` and ``variation:<id>``.
+
+    If the ``presale_availability_cache_ttl`` setting is set, the result is shared between
+    requests through the event cache for that number of seconds. Only one worker recomputes
+    an outdated entry, all others keep serving the old values in the meantime. This is only
+    used for display purposes, cart and checkout always check the live availability.
+    """
+    ttl = event.settings.get('presale_availability_cache_ttl', as_type=int)
+    if not ttl:
+        return _compute_availabilities(items)
+
+    cache = event.get_cache()
+    cached = cache.get('item_availability')
+    availabilities = None
+    if cached is not None:
+        keys = ['item:%d' % item.pk for item in items if not item.has_variations]
+        keys += ['variation:%d' % var.pk for item in items for var in item.available_variations]
+        if all(k in cached[1] for k in keys):
+            if time.time() - cached[0] < ttl:
+                return cached[1]
+            availabilities = cached[1]
+
+    locked = cache.add('item_availability_lock', True, ttl)
+    if not locked and availabilities is not None:
+        # Someone else is already refreshing the entry, serve the outdated values in the meantime
+        return availabilities
+
+    try:
+        availabilities = _compute_availabilities(items)
+        if locked:
+            # Keep outdated values around a little longer, so they can be served while being refreshed
+            cache.set('item_availability', (time.time(), availabilities), ttl * 10)
+    finally:
+        if locked:
+            cache.delete('item_availability_lock')
+    return availabilities
+
+
 def get_grouped_items(event):
     items = event.items.all().filter(
         Q(active=True)
@@ -36,7 +97,9 @@ def get_grouped_items(event):
         Prefetch('quotas',
                  queryset=event.quotas.all()),
         Prefetch('variations', to_attr='available_variations',
-                 queryset=ItemVariation.objects.filter(active=True, quotas__isnull=False).distinct()),
+                 queryset=ItemVariation.objects.filter(active=True, quotas__isnull=False).prefetch_related(
+                     Prefetch('quotas', queryset=event.quotas.all())
+                 ).distinct()),
     ).annotate(
         quotac=Count('quotas'),
         has_variations=Count('variations')
@@ -44,10 +107,11 @@ def get_grouped_items(event):
         quotac__gt=0
     ).order_by('category__position', 'category_id', 'position', 'name')
     display_add_to_cart = False
-    quota_cache = {}
+    availabilities = get_availabilities(event, items)
+
     for item in items:
         if not item.has_variations:
-            item.cached_availability = list(item.check_quotas(_cache=quota_cache))
+            item.cached_availability = list(availabilities['item:%d' % item.pk])
             item.order_max = min(item.cached_availability[1]
                                  if item.cached_availability[1] is not None else sys.maxsize,
                                  int(event.settings.max_items_per_order))
@@ -55,7 +119,7 @@ def get_grouped_items(event):
             display_add_to_cart = display_add_to_cart or item.order_max > 0
         else:
             for var in item.available_variations:
-                var.cached_availability = list(var.check_quotas(_cache=quota_cache))
+                var.cached_availability = list(availabilities['variation:%d' % var.pk])
                 var.order_max = min(var.cached_availability[1]
                                     if var.cached_availability[1] is not None else sys.maxsize,
                                     int(event.settings.max_items_per_order))
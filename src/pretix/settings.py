@@ -93,6 +93,9 @@ ADMINS = [('Admin', n) for n in config.get('mail', 'admins', fallback='').split(
 METRICS_ENABLED = config.get('metrics', 'enabled', fallback=False)
 METRICS_USER = config.get('metrics', 'user', fallback="metrics")
 METRICS_PASSPHRASE = config.get('metrics', 'passphrase', fallback="")
+METRICS_FLUSH_INTERVAL = config.getfloat('metrics', 'flush_interval', fallback=5)
+METRICS_REQUEST_SAMPLING = config.getfloat('metrics', 'request_sampling', fallback=0)  # Percentage of requests to measure
+SLOW_REQUEST_THRESHOLD = config.getfloat('metrics', 'slow_request_threshold', fallback=0)
 
 CACHES = {
     'default': {
@@ -102,6 +105,7 @@ CACHES = {
 }
 REAL_CACHE_USED = False
 SESSION_ENGINE = None
+CACHE_LOCAL_TTL = config.getfloat('cache', 'local_ttl', fallback=0)  # Seconds to keep cache entries in process memory
 
 HAS_MEMCACHED = config.has_option('memcached', 'location')
 if HAS_MEMCACHED:
@@ -151,6 +155,8 @@ else:
 
 SESSION_COOKIE_DOMAIN = config.get('pretix', 'cookie_domain', fallback=None)
 
+LOCK_QUOTAS = config.getboolean('locking', 'quotas', fallback=False)
+
 ENTROPY = {
     'order_code': config.getint('entropy', 'order_code', fallback=5),
     'ticket_secret': config.getint('entropy', 'ticket_secret', fallback=32),
@@ -187,6 +193,7 @@ INSTALLED_APPS = [
     'pretix.plugins.statistics',
     'pretix.plugins.reports',
     'pretix.plugins.checkinlists',
+    'pretix.plugins.parquetexport',
     'pretix.plugins.pretixdroid',
     'easy_thumbnails',
     'django_markup',
@@ -243,6 +250,9 @@ if PROFILING_RATE > 0:
         os.mkdir(PROFILE_DIR)
     MIDDLEWARE.insert(0, 'pretix.helpers.profile.middleware.CProfileMiddleware')
 
+if METRICS_REQUEST_SAMPLING > 0:
+    MIDDLEWARE.insert(0, 'pretix.base.middleware.RequestMetricsMiddleware')
+
 
 # Security settings
 X_FRAME_OPTIONS = 'DENY'
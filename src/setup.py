@@ -71,6 +71,7 @@ setup(
         'memcached': ['pylibmc'],
         'mysql': ['mysqlclient'],
         'paypal': ['paypalrestsdk>=1.9,<1.10,<2.0'],
+        'parquet': ['pyarrow'],
         'postgres': ['psycopg2'],
         'redis': ['django-redis>=4.1,<4.2', 'redis>=2.10,<2.11'],
         'stripe': ['stripe>=1.22,<1.23']
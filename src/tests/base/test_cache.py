@@ -1,9 +1,15 @@
 import random
+from io import StringIO
+from unittest import mock
 
 from django.core.cache import cache as django_cache
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 from django.utils.timezone import now
 
+from pretix.base.cache import (
+    InvalidationListener, NamespacedCache, SHA256KeyEncoder, _local,
+)
 from pretix.base.models import Event, Organizer
 
 
@@ -53,3 +59,79 @@ class CacheTest(TestCase):
         }
         self.cache.set_many(inp)
         self.assertEqual(inp, self.cache.get_many(inp.keys()))
+
+    def test_get_single_round_trip(self):
+        self.cache.set(self.testkey, "foo")
+        with mock.patch.object(self.cache.cache, 'get', wraps=self.cache.cache.get) as get, \
+                mock.patch.object(self.cache.cache, 'get_many', wraps=self.cache.cache.get_many) as get_many:
+            self.assertEqual(self.cache.get(self.testkey), "foo")
+            self.assertEqual(get.call_count + get_many.call_count, 1)
+
+    def test_get_after_foreign_clear(self):
+        self.cache.set(self.testkey, "foo")
+        self.assertEqual(self.cache.get(self.testkey), "foo")
+        django_cache.incr(self.cache.prefixkey)
+        _local.clear()
+        self.assertIsNone(self.cache.get(self.testkey))
+
+    def test_many_long_keys(self):
+        inp = {
+            'a' * 300: 'foo',
+            'b' * 300: 'bar',
+        }
+        self.cache.set_many(inp)
+        self.assertEqual(inp, self.cache.get_many(inp.keys()))
+
+    def test_key_encoder(self):
+        cache = NamespacedCache('test', key_encoder=SHA256KeyEncoder())
+        cache.set('a' * 300, 'foo')
+        key = cache._prefix_key('a' * 300)
+        self.assertEqual(len(key), 64)
+        self.assertEqual(django_cache.get(key), 'foo')
+        self.assertEqual(cache._prefix_key('a'), 'test:%d:a' % cache._get_prefix())
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmarkcache', iterations=10, stdout=out)
+        self.assertIn('get_many', out.getvalue())
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'unique-snowflake',
+    }
+}, CACHE_LOCAL_TTL=10)
+class LocalCacheTest(CacheTest):
+    def setUp(self):
+        super().setUp()
+        _local.clear()
+
+    def test_get_single_round_trip(self):
+        self.cache.set(self.testkey, "foo")
+        with mock.patch.object(self.cache.cache, 'get') as get, \
+                mock.patch.object(self.cache.cache, 'get_many') as get_many:
+            self.assertEqual(self.cache.get(self.testkey), "foo")
+            self.assertEqual(self.cache.get_many([self.testkey]), {self.testkey: "foo"})
+            self.assertFalse(get.called)
+            self.assertFalse(get_many.called)
+
+    def test_values_copied(self):
+        self.cache.set(self.testkey, {'foo': ['bar']})
+        value = self.cache.get(self.testkey)
+        value['foo'].append('baz')
+        self.assertEqual(self.cache.get(self.testkey), {'foo': ['bar']})
+        self.assertEqual(self.cache.get_many([self.testkey]), {self.testkey: {'foo': ['bar']}})
+
+    def test_clear_broadcast(self):
+        with mock.patch.object(InvalidationListener, 'publish') as publish:
+            self.cache.clear()
+            publish.assert_called_once_with(self.cache.prefixkey)
+
+    def test_listener_invalidation(self):
+        self.cache.set(self.testkey, "foo")
+        # Another process clears the namespace and notifies us
+        django_cache.incr(self.cache.prefixkey)
+        self.assertEqual(self.cache.get(self.testkey), "foo")
+        _local.delete(self.cache.prefixkey)
+        self.assertIsNone(self.cache.get(self.testkey))
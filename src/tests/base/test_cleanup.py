@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from pretix.base.models import CartPosition, Event, Item, Organizer
+from pretix.base.services import cleanup
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy',
+        date_from=now()
+    )
+    return event
+
+
+@pytest.mark.django_db
+def test_delete_in_chunks(event):
+    ticket = Item.objects.create(event=event, name='Ticket', default_price=23)
+    for i in range(5):
+        CartPosition.objects.create(
+            event=event, cart_id='old%d' % i, item=ticket, price=23, expires=now() - timedelta(days=20)
+        )
+    current = CartPosition.objects.create(
+        event=event, cart_id='current', item=ticket, price=23, expires=now() + timedelta(minutes=10)
+    )
+    with CaptureQueriesContext(connection) as ctx:
+        cleanup.delete_in_chunks(CartPosition.objects.filter(expires__lt=now()), chunk_size=2)
+    assert list(CartPosition.objects.all()) == [current]
+    deletes = [q for q in ctx.captured_queries if q['sql'].startswith('DELETE') and 'cartposition"' in q['sql'].split('WHERE')[0]]
+    assert len(deletes) == 3
+
+
+@pytest.mark.django_db
+def test_clean_cart_positions(event):
+    ticket = Item.objects.create(event=event, name='Ticket', default_price=23)
+    CartPosition.objects.create(
+        event=event, cart_id='old', item=ticket, price=23, expires=now() - timedelta(days=20)
+    )
+    recent = CartPosition.objects.create(
+        event=event, cart_id='recent', item=ticket, price=23, expires=now() - timedelta(days=1)
+    )
+    cleanup.clean_cart_positions(None)
+    assert list(CartPosition.objects.all()) == [recent]
@@ -0,0 +1,141 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from pretix.base.exporter import csv_chunks
+from pretix.base.exporters.json import JSONExporter, NDJSONExporter
+from pretix.base.exporters.orderlist import OrderListExporter
+from pretix.base.models import (
+    CachedFile, Event, Item, Order, OrderPosition, Organizer,
+)
+from pretix.base.services.export import export
+from pretix.helpers.database import chunked_iterator
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy',
+        date_from=now(), plugins='pretix.plugins.banktransfer'
+    )
+    ticket = Item.objects.create(event=event, name='Early-bird ticket',
+                                 category=None, default_price=23,
+                                 admission=True)
+    for i in range(5):
+        o = Order.objects.create(
+            code='FOO%d' % i, event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PAID,
+            datetime=now(), expires=now() + timedelta(days=10),
+            total=23, payment_provider='banktransfer', locale='en'
+        )
+        OrderPosition.objects.create(
+            order=o, item=ticket, variation=None,
+            price=Decimal("23.00"), attendee_name="Peter %d" % i
+        )
+    return event
+
+
+def test_csv_chunks():
+    chunks = list(csv_chunks([['a', 1], ['b', 2], ['c', 3]], chunk_size=2))
+    assert chunks == [b'"a",1\r\n"b",2\r\n', b'"c",3\r\n']
+    assert list(csv_chunks([])) == []
+
+
+@pytest.mark.django_db
+def test_chunked_iterator(env):
+    qs = Order.objects.filter(event=env).prefetch_related('positions').order_by('code')
+    with CaptureQueriesContext(connection) as ctx:
+        orders = list(chunked_iterator(qs, chunk_size=2))
+        assert [o.code for o in orders] == ['FOO0', 'FOO1', 'FOO2', 'FOO3', 'FOO4']
+        assert [p.attendee_name for o in orders for p in o.positions.all()] == ['Peter %d' % i for i in range(5)]
+    # One query for the orders and one prefetch query for each of the three chunks
+    assert len(ctx.captured_queries) == 4
+
+
+@pytest.mark.django_db
+def test_export_streams_to_file(env):
+    cf = CachedFile.objects.create(expires=now() + timedelta(days=1), date=now(), filename='', type='')
+    export(env.pk, str(cf.id), 'orderlistcsv', {'paid_only': True})
+    cf.refresh_from_db()
+    assert cf.filename == 'orders.csv'
+    assert cf.type == 'text/csv'
+    cf.file.open('rb')
+    lines = cf.file.read().decode().strip().split('\r\n')
+    cf.file.close()
+    assert len(lines) == 6
+    assert lines[1].startswith('"FOO0","23.00"')
+
+
+@pytest.mark.django_db
+def test_json_export(env):
+    ex = JSONExporter(env)
+    ex.chunk_size = 2
+    filename, filetype, chunks = ex.stream({})
+    chunks = list(chunks)
+    assert len(chunks) > 3
+    data = json.loads(b''.join(chunks).decode())['event']
+    assert data['slug'] == 'dummy'
+    assert data['items'][0]['name'] == 'Early-bird ticket'
+    assert [o['code'] for o in data['orders']] == ['FOO%d' % i for i in range(5)]
+    assert data['orders'][3]['positions'][0]['attendee_name'] == 'Peter 3'
+
+
+@pytest.mark.django_db
+def test_ndjson_export(env):
+    ex = NDJSONExporter(env)
+    ex.chunk_size = 2
+    filename, filetype, data = ex.render({})
+    lines = [json.loads(line) for line in data.decode().splitlines()]
+    assert [o['code'] for o in lines] == ['FOO%d' % i for i in range(5)]
+    assert lines[0]['event'] == 'dummy'
+    assert lines[0]['positions'][0]['price'] == '23.00'
+
+
+@pytest.mark.django_db
+def test_orderlist_aggregates_scoped(env):
+    other = Event.objects.create(organizer=env.organizer, name='Other', slug='other', date_from=now())
+    item = Item.objects.create(event=other, name='Ticket', default_price=12, tax_rate=7)
+    o = Order.objects.create(
+        code='BAR', event=other, status=Order.STATUS_PAID,
+        datetime=now(), expires=now() + timedelta(days=10), total=12
+    )
+    OrderPosition.objects.create(order=o, item=item, variation=None, price=Decimal("12.00"))
+
+    ex = OrderListExporter(env)
+    with CaptureQueriesContext(connection) as ctx:
+        filename, filetype, data = ex.render({'paid_only': True})
+    for q in ctx.captured_queries:
+        if 'pretixbase_orderposition' in q['sql']:
+            assert 'WHERE' in q['sql']
+
+    lines = data.decode().strip().split('\r\n')
+    assert len(lines) == 6
+    # The tax rate of the other event's position does not show up
+    assert '7.00 % tax' not in lines[0]
+
+
+@pytest.mark.django_db
+def test_orderlist_queries_per_chunk(env):
+    ex = OrderListExporter(env)
+    with CaptureQueriesContext(connection) as ctx:
+        ex.render({'paid_only': True})
+    ex.chunk_size = 2
+    with CaptureQueriesContext(connection) as ctx_chunked:
+        ex.render({'paid_only': True})
+    # One aggregate per chunk of orders
+    assert len(ctx_chunked.captured_queries) == len(ctx.captured_queries) + 2
+
+
+@pytest.mark.django_db
+def test_export_benchmark(env):
+    out = StringIO()
+    call_command('benchmarkexport', 'dummy', 'dummy', iterations=1, stdout=out)
+    assert 'orders.csv: 5 orders' in out.getvalue()
@@ -1,6 +1,12 @@
+import os
+import threading
 import time
+from io import StringIO
 
 import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
 from django.utils.timezone import now
 
 from pretix.base.models import Event, Organizer
@@ -51,3 +57,283 @@ def test_lock_timeout_steal(event):
     locking.lock_event(ev)
     with pytest.raises(LockReleaseException):
         locking.release_event(event)
+
+
+@pytest.mark.django_db
+def test_quota_locking(event):
+    q1 = event.quotas.create(name='Q1', size=10)
+    q2 = event.quotas.create(name='Q2', size=10)
+    with override_settings(LOCK_QUOTAS=True):
+        with event.lock([q1]):
+            ev = Event.objects.get(id=event.id)
+            with ev.lock([q2]):
+                pass
+            with pytest.raises(LockTimeoutException):
+                with ev.lock([q1, q2]):
+                    pass
+            with pytest.raises(LockTimeoutException):
+                with ev.lock():
+                    pass
+        with event.lock():
+            ev = Event.objects.get(id=event.id)
+            with pytest.raises(LockTimeoutException):
+                with ev.lock([q2]):
+                    pass
+        with event.lock([q1, q2]):
+            pass
+
+
+@pytest.mark.django_db
+def test_quota_locking_nested(event):
+    q1 = event.quotas.create(name='Q1', size=10)
+    q2 = event.quotas.create(name='Q2', size=10)
+    with override_settings(LOCK_QUOTAS=True):
+        with event.lock([q1]):
+            with event.lock([q1, q2]):
+                ev = Event.objects.get(id=event.id)
+                with pytest.raises(LockTimeoutException):
+                    with ev.lock([q2]):
+                        pass
+            # Only the lock acquired by the inner block has been released
+            ev = Event.objects.get(id=event.id)
+            with ev.lock([q2]):
+                pass
+            with pytest.raises(LockTimeoutException):
+                with ev.lock([q1]):
+                    pass
+            with event.lock():
+                pass
+            with pytest.raises(LockTimeoutException):
+                with ev.lock([q1]):
+                    pass
+        with ev.lock([q1, q2]):
+            pass
+
+
+@pytest.mark.django_db
+def test_lock_benchmark():
+    out = StringIO()
+    call_command('benchmarklocks', iterations=5, stdout=out)
+    assert out.getvalue().startswith('db: ')
+    assert '0 timeouts' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_slow_lock_log(event, monkeypatch, mocker):
+    monkeypatch.setattr(locking, 'SLOW_LOCK_THRESHOLD', 0)
+    mocked = mocker.patch.object(locking.logger, 'warning')
+    with event.lock():
+        pass
+    assert mocked.call_args[0][0].startswith('Slow lock on event')
+    assert mocked.call_args[0][1:3] == (event.pk, 'tests.base.test_locking.test_slow_lock_log')
+
+
+class BrokenConnection:
+    closed = False
+
+    def __init__(self):
+        self.close_calls = 0
+
+    def cursor(self):
+        raise connection.Database.Error()
+
+    def close(self):
+        self.close_calls += 1
+
+
+def test_pg_release_error(monkeypatch):
+    conn = BrokenConnection()
+    monkeypatch.setattr(locking._pg_local, 'connection', conn, raising=False)
+    monkeypatch.setattr(locking._pg_local, 'pid', os.getpid(), raising=False)
+    monkeypatch.setattr(locking._pg_local, 'held', {'pretix_event_1'}, raising=False)
+    with pytest.raises(LockReleaseException):
+        locking._release_pg('pretix_event_1')
+    # The broken connection is dropped
+    assert conn.close_calls == 1
+    assert locking._pg_local.connection is None
+    # _release_all only logs failed releases
+    monkeypatch.setattr(locking, '_backend', lambda: 'postgresql')
+    locking._pg_local.connection = BrokenConnection()
+    locking._pg_local.held = {'pretix_event_1'}
+    locking._release_all([('event_1', 'pretix_event_1')])
+
+
+def test_pg_connection_lifecycle(monkeypatch):
+    conn = BrokenConnection()
+    monkeypatch.setattr(locking._pg_local, 'connection', conn, raising=False)
+    monkeypatch.setattr(locking._pg_local, 'pid', os.getpid(), raising=False)
+    monkeypatch.setattr(locking._pg_local, 'held', {'pretix_event_1'}, raising=False)
+    locking.close_pg_connection()
+    assert conn.close_calls == 0
+
+    locking._pg_local.held = set()
+    locking.close_pg_connection()
+    assert conn.close_calls == 1
+    assert locking._pg_local.connection is None
+
+    # A connection inherited from the parent process is never closed in the child
+    conn = BrokenConnection()
+    locking._pg_local.connection = conn
+    locking._pg_local.pid = os.getpid() + 1
+    locking.close_pg_connection()
+    assert conn.close_calls == 0
+
+
+class FakeRedis:
+    """
+    Just enough of a Redis client for the lock queue, including blocking pops.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.cond = threading.Condition()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self.cond:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def exists(self, key):
+        with self.cond:
+            return key in self.data
+
+    def delete(self, key):
+        with self.cond:
+            return int(self.data.pop(key, None) is not None)
+
+    def expire(self, key, timeout):
+        return True
+
+    def rpush(self, key, value):
+        with self.cond:
+            self.data.setdefault(key, []).append(value.encode())
+            self.cond.notify_all()
+            return len(self.data[key])
+
+    def lindex(self, key, index):
+        with self.cond:
+            items = self.data.get(key) or []
+            return items[index] if len(items) > index else None
+
+    def lrem(self, key, count, value):
+        with self.cond:
+            items = self.data.get(key) or []
+            if value.encode() in items:
+                items.remove(value.encode())
+                return 1
+            return 0
+
+    def blpop(self, key, timeout=0):
+        with self.cond:
+            self.cond.wait_for(lambda: self.data.get(key), timeout)
+            if self.data.get(key):
+                return key, self.data[key].pop(0)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((getattr(self.redis, name), args, kwargs))
+        return call
+
+    def execute(self):
+        return [func(*args, **kwargs) for func, args, kwargs in self.calls]
+
+
+class FakeLock:
+    def __init__(self, redis, name):
+        self.redis = redis
+        self.name = name
+
+    def acquire(self, blocking=True):
+        return bool(self.redis.set(self.name, '1', nx=True))
+
+    def release(self):
+        self.redis.delete(self.name)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    pytest.importorskip('redis')
+    rc = FakeRedis()
+    monkeypatch.setattr(locking, '_backend', lambda: 'redis')
+    monkeypatch.setattr(locking, '_redis_lock', lambda name: FakeLock(rc, name))
+    return rc
+
+
+def _wait_for(condition):
+    for i in range(100):
+        if condition():
+            return
+        time.sleep(.01)
+    raise AssertionError('Condition not met')
+
+
+def test_redis_fifo_and_wakeup(fake_redis):
+    holder = locking._acquire('quota-1')
+    queue = fake_redis.data.setdefault('pretix_quota-1_queue', [])
+    acquired = []
+
+    def waiter(name):
+        lock = locking._acquire('quota-1')
+        acquired.append((name, time.time()))
+        locking._release(lock)
+
+    threads = []
+    for name in ('a', 'b'):
+        t = threading.Thread(target=waiter, args=(name,))
+        t.start()
+        threads.append(t)
+        _wait_for(lambda: len(queue) == len(threads))
+
+    released = time.time()
+    locking._release(holder)
+    for t in threads:
+        t.join()
+    assert [name for name, t in acquired] == ['a', 'b']
+    # The first waiter is woken up by the release instead of waiting for its timeout
+    assert acquired[0][1] - released < .5
+    assert not queue
+
+
+def test_redis_dead_waiter(fake_redis):
+    # A waiter at the head of the queue without a heartbeat has gone away
+    fake_redis.rpush('pretix_quota-1_queue', 'dead')
+    starttime = time.time()
+    lock = locking._acquire('quota-1')
+    assert time.time() - starttime < .5
+    assert not fake_redis.data['pretix_quota-1_queue']
+    locking._release(lock)
+
+
+def test_redis_timeout(fake_redis, monkeypatch):
+    monkeypatch.setattr(locking, 'LOCK_WAIT_TIMEOUT', 1)
+    holder = locking._acquire('quota-1')
+    with pytest.raises(LockTimeoutException):
+        locking._acquire('quota-1')
+    # The waiter leaves the queue when giving up
+    assert not fake_redis.data['pretix_quota-1_queue']
+    locking._release(holder)
+
+
+def test_redis_timeout_bounds_all_keys(fake_redis, monkeypatch):
+    monkeypatch.setattr(locking, 'LOCK_WAIT_TIMEOUT', 3)
+    holder1 = locking._acquire('quota-1')
+    locking._acquire('quota-2')
+    threading.Timer(1, locking._release, args=(holder1,)).start()
+    starttime = time.time()
+    with pytest.raises(LockTimeoutException):
+        locking._acquire_all(['quota-1', 'quota-2'])
+    # The second key only gets the time left over by the first one
+    assert time.time() - starttime < 3.8
+    # Everything acquired so far has been released again
+    assert not fake_redis.exists('pretix_quota-1')
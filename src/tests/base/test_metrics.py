@@ -1,34 +1,65 @@
 # pytest
 
 import base64
+import time
+from datetime import datetime, timedelta
 
 import pytest
 from django.test import override_settings
 
 from pretix.base import metrics
+from pretix.base.services.async import ProfiledTask
 from pretix.base.views import metrics as metricsview
+from pretix.celery import app
 
 
 class FakeRedis(object):
+    """
+    Stores the fields of the metrics hash directly in storage, as the tests only ever
+    deal with one hash.
+    """
 
     def __init__(self):
         self.storage = {}
+        self.roundtrips = 0
 
-    def incrbyfloat(self, rkey, amount):
+    def hincrbyfloat(self, name, rkey, amount):
         if rkey in self.storage:
             self.storage[rkey] += amount
         else:
-            self.set(rkey, amount)
+            self.storage[rkey] = amount
 
-    def set(self, rkey, value):
-        self.storage[rkey] = value
+    def hmset(self, name, mapping):
+        self.storage.update(mapping)
 
-    def get(self, rkey):
+    def hgetall(self, name):
+        self.roundtrips += 1
         # bytes-conversion here for emulating redis behavior without making incr too hard
-        return bytes(self.storage[rkey], encoding='utf-8')
+        return {
+            bytes(k, encoding='utf-8'): bytes(str(v), encoding='utf-8')
+            for k, v in self.storage.items()
+        }
 
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
 
-@override_settings(HAS_REDIS=True)
+
+class FakePipeline(object):
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, item):
+        return lambda *args: self.commands.append((item, args))
+
+    def execute(self):
+        self.redis.roundtrips += 1
+        for command, args in self.commands:
+            getattr(self.redis, command)(*args)
+
+
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=0)
 def test_counter(monkeypatch):
 
     fake_redis = FakeRedis()
@@ -61,7 +92,7 @@ def test_counter(monkeypatch):
     assert fake_redis.storage[metrics.REDIS_KEY_PREFIX + fullname_dimless] == 20
 
 
-@override_settings(HAS_REDIS=True)
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=0)
 def test_gauge(monkeypatch):
 
     fake_redis = FakeRedis()
@@ -120,7 +151,7 @@ def test_gauge(monkeypatch):
 
 
 @pytest.mark.django_db
-@override_settings(HAS_REDIS=True, METRICS_USER="foo", METRICS_PASSPHRASE="bar")
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=0, METRICS_USER="foo", METRICS_PASSPHRASE="bar")
 def test_metrics_view(monkeypatch, client):
 
     fake_redis = FakeRedis()
@@ -138,3 +169,123 @@ def test_metrics_view(monkeypatch, client):
     # test metrics-view
     basic_auth = {"HTTP_AUTHORIZATION": base64.b64encode(bytes("foo:bar", "utf-8"))}
     assert "{} {}".format(fullname, counter_value) not in client.get("/metrics", headers=basic_auth)
+
+
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=0)
+def test_histogram(monkeypatch):
+
+    fake_redis = FakeRedis()
+
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+
+    test_hist = metrics.Histogram("my_histogram", "this is a helpstring", ["dimension"], buckets=[1, 5])
+
+    def value(suffix, **labels):
+        labelnames = ["dimension", "le"] if "le" in labels else ["dimension"]
+        fullname = test_hist._construct_metric_identifier('my_histogram' + suffix, labels, labelnames)
+        return fake_redis.storage.get(metrics.REDIS_KEY_PREFIX + fullname, 0)
+
+    test_hist.observe(0.5, dimension="one")
+    test_hist.observe(3, dimension="one")
+    test_hist.observe(7, dimension="one")
+    assert value("_bucket", dimension="one", le="1.0") == 1
+    assert value("_bucket", dimension="one", le="5.0") == 2
+    assert value("_bucket", dimension="one", le="+Inf") == 3
+    assert value("_count", dimension="one") == 3
+    assert value("_sum", dimension="one") == 10.5
+    assert value("_count", dimension="two") == 0
+
+    with pytest.raises(ValueError):
+        test_hist.observe(-1, dimension="one")
+
+    with pytest.raises(ValueError):
+        test_hist.observe(1, unknown_label="foo")
+
+    with pytest.raises(ValueError):
+        metrics.Histogram("bad_histogram", "this is a helpstring", buckets=[5, 1])
+
+    with pytest.raises(ValueError):
+        metrics.Histogram("bad_histogram", "this is a helpstring", ["le"])
+
+
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=60)
+def test_buffered_flush(monkeypatch):
+
+    fake_redis = FakeRedis()
+
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+    monkeypatch.setattr(metrics, "buffer", metrics.MetricsBuffer())
+
+    test_counter = metrics.Counter("my_counter", "this is a helpstring", ["dimension"])
+    test_gauge = metrics.Gauge("my_gauge", "this is a helpstring")
+    fullname_one = test_counter._construct_metric_identifier('my_counter', {"dimension": "one"})
+    fullname_two = test_counter._construct_metric_identifier('my_counter', {"dimension": "two"})
+
+    for i in range(10):
+        test_counter.inc(dimension="one")
+    test_counter.inc(3, dimension="two")
+    test_gauge.set(5)
+    test_gauge.inc(2)
+    assert fake_redis.storage == {}
+    assert fake_redis.roundtrips == 0
+
+    values = metrics.metric_values()
+    assert values[fullname_one] == 10
+    assert values[fullname_two] == 3
+    assert values["my_gauge"] == 7
+    assert fake_redis.roundtrips == 2
+
+    test_counter.inc(dimension="one")
+    metrics.buffer.flush()
+    assert fake_redis.storage[metrics.REDIS_KEY_PREFIX + fullname_one] == 11
+    assert fake_redis.roundtrips == 3
+
+
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=0.05)
+def test_flush_when_idle(monkeypatch):
+    fake_redis = FakeRedis()
+
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+    monkeypatch.setattr(metrics, "buffer", metrics.MetricsBuffer())
+
+    test_counter = metrics.Counter("my_counter", "this is a helpstring", ["dimension"])
+    fullname = test_counter._construct_metric_identifier('my_counter', {"dimension": "one"})
+    test_counter.inc(dimension="one")
+
+    # No further updates arrive, the background thread flushes the buffer nevertheless
+    for i in range(100):
+        if fake_redis.storage:
+            break
+        time.sleep(0.05)
+    assert fake_redis.storage[metrics.REDIS_KEY_PREFIX + fullname] == 1
+
+
+@app.task(base=ProfiledTask)
+def failing_task():
+    raise ValueError()
+
+
+@app.task(base=ProfiledTask)
+def passing_task():
+    return 42
+
+
+def test_task_metrics(mocker):
+    duration = mocker.patch.object(metrics.celery_task_duration_seconds, 'observe')
+    queue = mocker.patch.object(metrics.celery_task_queue_seconds, 'observe')
+    failed = mocker.patch.object(metrics.celery_tasks_failed_total, 'inc')
+
+    assert passing_task.apply_async().get() == 42
+    assert duration.call_args[1] == {'task': passing_task.name}
+    assert queue.call_args[0][0] >= 0
+    assert not failed.called
+
+    with pytest.raises(ValueError):
+        failing_task.apply_async().get()
+    failed.assert_called_once_with(task=failing_task.name)
+
+
+def test_task_queue_time_naive_eta(mocker):
+    queue = mocker.patch.object(metrics.celery_task_queue_seconds, 'observe')
+    assert passing_task.apply_async(eta=datetime.utcnow() - timedelta(seconds=60)).get() == 42
+    assert 60 <= queue.call_args[0][0] < 120
@@ -1,7 +1,10 @@
+from unittest import mock
+
 from django.conf import settings
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.utils.timezone import now
 
+from pretix.base import middleware
 from pretix.base.models import Event, Organizer, User
 
 
@@ -106,3 +109,28 @@ class LocaleDeterminationTest(TestCase):
         response = c.get('/dummy/dummy/')
         language = response['Content-Language']
         self.assertEqual(language, 'en')
+
+
+@override_settings(
+    METRICS_REQUEST_SAMPLING=100, SLOW_REQUEST_THRESHOLD=0.000001,
+    MIDDLEWARE=['pretix.base.middleware.RequestMetricsMiddleware'] + settings.MIDDLEWARE
+)
+class RequestMetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        o = Organizer.objects.create(name='Dummy', slug='dummy')
+        cls.event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy',
+            date_from=now(), live=True
+        )
+
+    def test_slow_request_log(self):
+        with mock.patch.object(middleware.logger, 'warning') as warning, \
+                mock.patch.object(middleware.metrics.http_request_db_queries, 'observe') as observe:
+            Client().get('/dummy/dummy/')
+        assert observe.call_args[1] == {'handler': 'presale:event.index'}
+        assert observe.call_args[0][0] > 0
+        args = warning.call_args[0]
+        assert args[1:3] == ('/dummy/dummy/', 'presale:event.index')
+        assert args[6].split('x, ')[0].isdigit()
+        assert "'dummy'" not in args[6]
@@ -1,19 +1,28 @@
+import json
 import sys
 from datetime import timedelta
+from io import StringIO
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 
 from pretix.base.models import (
-    CachedFile, CartPosition, Event, Item, ItemCategory, ItemVariation, Order,
-    OrderPosition, Organizer, Question, Quota, User, Voucher,
+    CachedFile, CartPosition, Event, Item, ItemCategory, ItemVariation,
+    LogEntry, LogEntryArchive, Order, OrderPosition, Organizer, Question,
+    Quota, QuotaCounter, User, Voucher,
 )
+from pretix.base.models.base import buffered_logging
 from pretix.base.services.orders import (
     OrderError, cancel_order, mark_order_paid, perform_order,
 )
+from pretix.base.services.quotas import buffered_counters
 
 
 class UserTestCase(TestCase):
@@ -194,6 +203,37 @@ class QuotaTestCase(BaseQuotaTestCase):
         self.quota.save()
         self.assertEqual(self.item1.check_quotas(), (Quota.AVAILABILITY_OK, None))
 
+    def test_bulk_availability(self):
+        self.quota.items.add(self.item1)
+        self.quota.variations.add(self.var1)
+        self.quota.size = 5
+        self.quota.save()
+        quota2 = Quota.objects.create(event=self.event, name="Test 2", size=2)
+        quota2.variations.add(self.var1)
+        quota3 = Quota.objects.create(event=self.event, name="Test 3", size=None)
+        quota3.items.add(self.item1)
+
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item2, variation=self.var1, price=2)
+        CartPosition.objects.create(event=self.event, item=self.item2, variation=self.var1, price=2,
+                                    expires=now() + timedelta(days=3))
+        Voucher.objects.create(event=self.event, item=self.item1, block_quota=True)
+
+        quotas = [self.quota, quota2, quota3]
+        self.assertEqual(
+            Quota.objects.bulk_availability(quotas),
+            {q.pk: q.availability() for q in quotas}
+        )
+        self.assertEqual(Quota.objects.bulk_availability(quotas)[self.quota.pk], (Quota.AVAILABILITY_OK, 1))
+        self.assertEqual(Quota.objects.bulk_availability(quotas)[quota2.pk], (Quota.AVAILABILITY_RESERVED, 0))
+        self.assertEqual(Quota.objects.bulk_availability(quotas)[quota3.pk], (Quota.AVAILABILITY_OK, None))
+
     def test_voucher_product(self):
         self.quota.items.add(self.item1)
         self.quota.size = 1
@@ -370,6 +410,128 @@ class QuotaTestCase(BaseQuotaTestCase):
             v.clean()
 
 
+class QuotaCounterTestCase(BaseQuotaTestCase):
+    def _counter(self):
+        return QuotaCounter.objects.get(quota=self.quota)
+
+    def test_status_changes(self):
+        self.quota.items.add(self.item1)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        self.assertEqual((self._counter().paid, self._counter().pending), (0, 2))
+
+        order.status = Order.STATUS_PAID
+        order.save()
+        self.assertEqual((self._counter().paid, self._counter().pending), (2, 0))
+
+        order.status = Order.STATUS_REFUNDED
+        order.save()
+        self.assertEqual((self._counter().paid, self._counter().pending), (0, 0))
+
+    def test_position_changes(self):
+        self.quota.variations.add(self.var1)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        op = OrderPosition.objects.create(order=order, item=self.item2, variation=self.var2, price=2)
+        self.assertEqual(self._counter().paid, 0)
+
+        op.variation = self.var1
+        op.save()
+        self.assertEqual(self._counter().paid, 1)
+
+        op.delete()
+        self.assertEqual(self._counter().paid, 0)
+
+    def test_quota_product_changes(self):
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        self.assertEqual(self._counter().paid, 0)
+
+        self.quota.items.add(self.item1)
+        self.assertEqual(self._counter().paid, 1)
+
+        self.item1.quotas.clear()
+        self.assertEqual(self._counter().paid, 0)
+
+    def test_no_status_queries(self):
+        self.quota.items.add(self.item1)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        order = Order.objects.get(pk=order.pk)
+        op = OrderPosition.objects.select_related('order').get(order=order)
+        with CaptureQueriesContext(connection) as ctx:
+            order.total = 5
+            order.save()
+            op.price = 3
+            op.save()
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT')])
+        self.assertEqual(self._counter().pending, 1)
+
+    def test_deferred_status(self):
+        self.quota.items.add(self.item1)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        order = Order.objects.only('pk', 'total').get(pk=order.pk)
+        order.total = 5
+        order.save()
+        self.assertEqual((self._counter().pending, self._counter().paid), (1, 0))
+        order = Order.objects.only('pk', 'total').get(pk=order.pk)
+        order.status = Order.STATUS_PAID
+        order.save()
+        self.assertEqual((self._counter().pending, self._counter().paid), (0, 1))
+
+    def test_buffered_counters(self):
+        self.quota.items.add(self.item1)
+        quota2 = Quota.objects.create(name="Test 2", size=2, event=self.event)
+        quota2.items.add(self.item1)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        with CaptureQueriesContext(connection) as ctx:
+            with buffered_counters():
+                for i in range(3):
+                    OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'pretixbase_quotacounter' in q['sql']]), 2)
+        self.assertEqual(self._counter().paid, 3)
+        self.assertEqual(QuotaCounter.objects.get(quota=quota2).paid, 3)
+
+    def test_recompute_command(self):
+        self.quota.size = 1
+        self.quota.save()
+        self.quota.items.add(self.item1)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        Order.objects.filter(pk=order.pk).update(status=Order.STATUS_PENDING)
+        self.assertEqual(self.item1.check_quotas(), (Quota.AVAILABILITY_GONE, 0))
+
+        out = StringIO()
+        call_command('recomputequotas', stdout=out)
+        self.assertIn('paid drift +1, pending drift -1', out.getvalue())
+        self.assertEqual((self._counter().paid, self._counter().pending), (0, 1))
+        self.assertEqual(self.item1.check_quotas(), (Quota.AVAILABILITY_ORDERED, 0))
+
+    def test_fallback_without_counter(self):
+        self.quota.items.add(self.item1)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        QuotaCounter.objects.filter(quota=self.quota).delete()
+        self.assertEqual(self.item1.check_quotas(), (Quota.AVAILABILITY_OK, 1))
+
+
 class OrderTestCase(BaseQuotaTestCase):
     def setUp(self):
         super().setUp()
@@ -602,6 +764,75 @@ class EventTest(TestCase):
         self.assertIn('presale_end', str(context.exception))
 
 
+class LoggingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        o = Organizer.objects.create(name='Dummy', slug='dummy')
+        cls.event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+        cls.items = [Item.objects.create(event=cls.event, name='Item %d' % i, default_price=23) for i in range(3)]
+
+    def setUp(self):
+        ContentType.objects.get_for_model(Item)  # warm up the content type cache
+
+    def test_buffered_logging(self):
+        with self.assertNumQueries(1):
+            with buffered_logging():
+                with buffered_logging():
+                    self.items[0].log_action('test.action', data={'foo': 'bar'})
+                for i in self.items:
+                    i.log_action('test.other')
+        assert LogEntry.objects.filter(action_type='test.other', event=self.event).count() == 3
+        assert json.loads(LogEntry.objects.get(action_type='test.action').data) == {'foo': 'bar'}
+
+    def test_buffered_logging_exception(self):
+        with self.assertNumQueries(0):
+            with self.assertRaises(ValueError):
+                with buffered_logging():
+                    self.items[0].log_action('test.action')
+                    raise ValueError()
+        with buffered_logging():
+            self.items[1].log_action('test.other')
+        assert list(LogEntry.objects.values_list('action_type', flat=True)) == ['test.other']
+
+    def test_bulk_log_action(self):
+        with self.assertNumQueries(1):
+            Item.bulk_log_action(self.items, 'test.action', user=None)
+        assert list(LogEntry.objects.filter(action_type='test.action').order_by('object_id').values_list(
+            'object_id', flat=True)) == [i.pk for i in self.items]
+
+    def test_page(self):
+        for i in range(5):
+            self.items[0].log_action('test.action', data={'i': i})
+        # Entries with identical timestamps must neither be skipped nor repeated
+        LogEntry.objects.update(datetime=now())
+        qs = self.items[0].all_logentries()
+        seen = []
+        entries, cursor = qs.page(size=2)
+        while True:
+            seen += [json.loads(e.data)['i'] for e in entries]
+            if not cursor:
+                break
+            entries, cursor = qs.page(cursor, size=2)
+        assert seen == [4, 3, 2, 1, 0]
+
+    def test_archive(self):
+        for i in range(5):
+            self.items[i % 3].log_action('test.action', data={'i': i})
+        LogEntry.objects.update(datetime=now() - timedelta(days=100))
+        self.items[0].log_action('test.recent')
+        out = StringIO()
+        call_command('archivelogs', days=30, batch_size=2, stdout=out)
+        assert 'Archived 5 log entries in 3 batches' in out.getvalue()
+        assert list(LogEntry.objects.values_list('action_type', flat=True)) == ['test.recent']
+
+        archived = sorted(
+            (e for a in LogEntryArchive.objects.filter(event=self.event) for e in a.entries()),
+            key=lambda e: e.pk
+        )
+        assert [json.loads(e.data)['i'] for e in archived] == [0, 1, 2, 3, 4]
+        assert archived[1].content_object == self.items[1]
+
+
 class CachedFileTestCase(TestCase):
     def test_file_handling(self):
         cf = CachedFile()
@@ -1,15 +1,22 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
+from unittest import mock
 
 import pytest
-from django.test import TestCase
+from django.core import mail as djmail
+from django.test import TestCase, override_settings
 from django.utils.timezone import make_aware, now
 
 from pretix.base.decimal import round_decimal
-from pretix.base.models import Event, Item, Order, OrderPosition, Organizer
+from pretix.base.models import (
+    Event, Item, LogEntry, Order, OrderPosition, Organizer, Quota,
+    QuotaCounter,
+)
 from pretix.base.payment import FreeOrderProvider
+from pretix.base.services import locking, orders
 from pretix.base.services.orders import (
     OrderChangeManager, OrderError, _create_order, expire_orders,
+    mark_order_paid, send_expiry_warnings,
 )
 
 
@@ -113,6 +120,88 @@ def test_expiring_auto_disabled(event):
     assert o2.status == Order.STATUS_PENDING
 
 
+@pytest.mark.django_db
+def test_expiring_chunked(event, monkeypatch):
+    monkeypatch.setattr(orders, 'EXPIRY_CHUNK_SIZE', 2)
+    quota = Quota.objects.create(event=event, name='Tickets', size=10)
+    ticket = Item.objects.create(event=event, name='Ticket', default_price=23)
+    quota.items.add(ticket)
+    expired = []
+    for i in range(5):
+        o = Order.objects.create(
+            code='FO%d' % i, event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING,
+            datetime=now(), expires=now() - timedelta(days=1) if i else now() + timedelta(days=1),
+            total=23, payment_provider='banktransfer'
+        )
+        OrderPosition.objects.create(order=o, item=ticket, variation=None, price=Decimal('23.00'))
+        if i:
+            expired.append(o.pk)
+    assert QuotaCounter.objects.get(quota=quota).pending == 5
+    expire_orders(None)
+    assert set(Order.objects.filter(status=Order.STATUS_EXPIRED).values_list('pk', flat=True)) == set(expired)
+    assert QuotaCounter.objects.get(quota=quota).pending == 1
+    assert set(LogEntry.objects.filter(action_type='pretix.event.order.expired').values_list('object_id', flat=True)) == set(expired)
+
+
+@pytest.mark.django_db
+def test_expiry_warnings(event):
+    event.settings.set('mail_days_order_expire_warning', 3)
+    soon = Order.objects.create(
+        code='FOO', event=event, email='dummy@dummy.test',
+        status=Order.STATUS_PENDING,
+        datetime=now(), expires=now() + timedelta(days=2),
+        total=0, payment_provider='banktransfer'
+    )
+    later = Order.objects.create(
+        code='FO2', event=event, email='dummy@dummy.test',
+        status=Order.STATUS_PENDING,
+        datetime=now(), expires=now() + timedelta(days=10),
+        total=0, payment_provider='banktransfer'
+    )
+    send_expiry_warnings(None)
+    soon.refresh_from_db()
+    later.refresh_from_db()
+    assert soon.expiry_reminder_sent
+    assert not later.expiry_reminder_sent
+
+
+@pytest.mark.django_db
+def test_mark_paid_after_expiry(event):
+    quota = Quota.objects.create(event=event, name='Tickets', size=10)
+    ticket = Item.objects.create(event=event, name='Ticket', default_price=23)
+    quota.items.add(ticket)
+    o = Order.objects.create(
+        code='FOO', event=event, email='dummy@dummy.test',
+        status=Order.STATUS_PENDING,
+        datetime=now(), expires=now() - timedelta(days=1),
+        total=23, payment_provider='banktransfer'
+    )
+    OrderPosition.objects.create(order=o, item=ticket, variation=None, price=Decimal('23.00'))
+    # The order is expired while another process still holds it as pending
+    expire_orders(None)
+    mark_order_paid(o, send_mail=False)
+    counter = QuotaCounter.objects.get(quota=quota)
+    assert (counter.pending, counter.paid) == (0, 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_expiry_warnings_sent(event):
+    event.settings.set('mail_days_order_expire_warning', 3)
+    djmail.outbox = []
+    o = Order.objects.create(
+        code='FOO', event=event, email='dummy@dummy.test',
+        status=Order.STATUS_PENDING,
+        datetime=now(), expires=now() + timedelta(days=2),
+        total=0, payment_provider='banktransfer'
+    )
+    # The mails are only sent after the chunk has been committed
+    send_expiry_warnings(None)
+    assert len(djmail.outbox) == 1
+    assert djmail.outbox[0].to == ['dummy@dummy.test']
+    assert LogEntry.objects.filter(object_id=o.pk, action_type='pretix.event.order.expire_warning_sent').exists()
+
+
 class OrderChangeManagerTests(TestCase):
     def setUp(self):
         super().setUp()
@@ -289,3 +378,22 @@ class OrderChangeManagerTests(TestCase):
         assert self.order.total == 0
         assert self.order.status == Order.STATUS_PAID
         assert self.order.payment_provider == 'free'
+
+
+@pytest.mark.django_db
+def test_mark_paid_relocks_if_quotas_changed(event):
+    q1 = Quota.objects.create(event=event, name='Q1', size=10)
+    q2 = Quota.objects.create(event=event, name='Q2', size=10)
+    o = Order.objects.create(
+        code='FOO', event=event, email='dummy@dummy.test', status=Order.STATUS_PENDING,
+        datetime=now(), expires=now() + timedelta(days=10), total=0
+    )
+    # A concurrent change moves a position from Q1 to Q2 while we wait for the lock of Q1
+    quotas = iter([{q1.pk}, {q1.pk, q2.pk}, {q1.pk, q2.pk}])
+    with override_settings(LOCK_QUOTAS=True), \
+            mock.patch.object(orders, '_order_quotas', side_effect=lambda order: next(quotas)), \
+            mock.patch.object(locking, 'lock_event', wraps=locking.lock_event) as lock_event:
+        orders.mark_order_paid(o, send_mail=False)
+    assert lock_event.called
+    o.refresh_from_db()
+    assert o.status == Order.STATUS_PAID
@@ -1,9 +1,12 @@
 from datetime import date, datetime, time
 from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
 from django.core.files import File
 from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase
 from django.utils.timezone import now
 
@@ -301,3 +304,52 @@ class SettingsTestCase(TestCase):
             })
         finally:
             settings.DEFAULTS = olddef
+
+    def test_snapshot_reused(self):
+        self.event.settings.set('test', '2016-01-01T10:00:00+00:00')
+        first = self.event.settings.get('test', as_type=datetime)
+        self.assertIs(self.event.settings.get('test', as_type=datetime), first)
+        self.assertEqual(self.event.settings.get('test'), '2016-01-01T10:00:00+00:00')
+
+        self.event.settings.set('test', '2017-01-01T10:00:00+00:00')
+        self.assertEqual(self.event.settings.get('test', as_type=datetime).year, 2017)
+
+    def test_snapshot_invalidated_by_parent(self):
+        self.assertEqual(self.event.settings.test_default, 'def')
+        self.organizer.settings.set('test_default', 'orga')
+        self.assertEqual(self.event.settings.test_default, 'orga')
+        self.assertIsNone(self.event.settings.get('test'))
+        self.organizer.settings._parent.settings.set('test', 'global')
+        self.assertEqual(self.event.settings.get('test'), 'global')
+
+    def test_snapshot_not_shared_for_mutable_values(self):
+        self.event.settings.set('test', {'foo': 'bar'})
+        self.event.settings.get('test', as_type=dict)['foo'] = 'baz'
+        self.assertEqual(self.event.settings.get('test', as_type=dict), {'foo': 'bar'})
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmarksettings', 'dummy', 'dummy', iterations=1, stdout=out)
+        self.assertIn('with snapshot', out.getvalue())
+
+    def test_file_opened_lazily(self):
+        val = SimpleUploadedFile("sample_invalid_image.jpg", b"file_content", content_type="image/jpeg")
+        name = default_storage.save(val.name, val)
+        val.close()
+        self.event.settings.set('test', 'file://' + name)
+        self.event.settings._flush()
+        with mock.patch.object(default_storage, 'open', wraps=default_storage.open) as mocked:
+            f = self.event.settings.get('test', as_type=File)
+            self.assertEqual(f.name, name)
+            self.assertEqual(f.url, default_storage.url(name))
+            self.assertFalse(mocked.called)
+            self.assertEqual(f.read(), 'file_content')
+            self.assertEqual(mocked.call_count, 1)
+        f.close()
+
+    def test_file_missing(self):
+        self.event.settings.set('test', 'file://doesnotexist.jpg')
+        f = self.event.settings.get('test', as_type=File)
+        self.assertEqual(f.name, 'doesnotexist.jpg')
+        with self.assertRaises(OSError):
+            f.read()
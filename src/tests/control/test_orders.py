@@ -3,12 +3,14 @@ from decimal import Decimal
 
 import pytest
 from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from tests.base import SoupTest
 
 from pretix.base.models import (
-    Event, EventPermission, InvoiceAddress, Item, Order, OrderPosition,
-    Organizer, Quota, User,
+    CartPosition, Event, EventPermission, InvoiceAddress, Item, Order,
+    OrderPosition, Organizer, Quota, User,
 )
 from pretix.base.services.invoices import (
     generate_cancellation, generate_invoice,
@@ -84,6 +86,80 @@ def test_order_list(client, env):
     assert 'FOO' in response.rendered_content
 
 
+@pytest.mark.django_db
+def test_order_list_search_index(client, env):
+    client.login(email='dummy@dummy.dummy', password='dummy')
+    response = client.get('/control/event/dummy/dummy/orders/?user=foo')
+    assert 'FOO' in response.rendered_content
+
+    p = env[2].positions.first()
+    p.attendee_name = 'Hans'
+    p.save()
+    response = client.get('/control/event/dummy/dummy/orders/?user=hans')
+    assert 'FOO' in response.rendered_content
+    response = client.get('/control/event/dummy/dummy/orders/?user=peter')
+    assert 'FOO' not in response.rendered_content
+
+    o = Order.objects.get(pk=env[2].pk)
+    o.email = 'other@example.org'
+    o.save()
+    assert Order.objects.get(pk=o.pk).search_index == 'foo\nother@example.org\nhans'
+
+    o.email = 'third@example.org'
+    o.save(update_fields=['email'])
+    assert Order.objects.get(pk=o.pk).search_index == 'foo\nthird@example.org\nhans'
+
+    p = OrderPosition.objects.get(pk=p.pk)
+    p.price = Decimal('12.00')
+    with CaptureQueriesContext(connection) as ctx:
+        p.save()
+    assert not any(q['sql'].startswith('UPDATE') and 'search_index' in q['sql'] for q in ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_order_search_index_built_once_per_order(env):
+    o = Order.objects.create(
+        code='BAR', event=env[0], email='bar@example.org', status=Order.STATUS_PENDING,
+        datetime=now(), expires=now() + timedelta(days=10), total=28
+    )
+    cps = [
+        CartPosition.objects.create(event=env[0], cart_id='abc', item=env[3], price=Decimal('14'),
+                                    attendee_name=name, expires=now() + timedelta(days=1))
+        for name in ('Anna', 'Berta')
+    ]
+    with CaptureQueriesContext(connection) as ctx:
+        OrderPosition.transform_cart_positions(cps, o)
+    assert len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE') and 'search_index' in q['sql']]) == 1
+    assert Order.objects.get(pk=o.pk).search_index == 'bar\nbar@example.org\nanna\nberta'
+
+
+@pytest.mark.django_db
+def test_order_list_keyset_pagination(client, env):
+    for i in range(65):
+        Order.objects.create(
+            code='BAR%02d' % i, event=env[0], status=Order.STATUS_PENDING,
+            datetime=env[2].datetime, expires=now() + timedelta(days=10), total=i
+        )
+    client.login(email='dummy@dummy.dummy', password='dummy')
+
+    for ordering in ('-datetime', 'code', '-email', 'total'):
+        seen = []
+        url = '/control/event/dummy/dummy/orders/?ordering=%s' % ordering
+        while url:
+            response = client.get(url)
+            assert len(response.context['orders']) <= 30
+            seen += [o.pk for o in response.context['orders']]
+            url = response.context.get('next_url')
+            if url:
+                url = '/control/event/dummy/dummy/orders/' + url
+        assert len(seen) == 66
+        assert len(set(seen)) == 66
+
+        response = client.get('/control/event/dummy/dummy/orders/?ordering=%s&before=%d' % (ordering, seen[30]))
+        assert [o.pk for o in response.context['orders']] == seen[:30]
+        assert 'previous_url' not in response.context
+
+
 @pytest.mark.django_db
 def test_order_detail(client, env):
     client.login(email='dummy@dummy.dummy', password='dummy')
@@ -80,9 +80,9 @@ class VoucherFormTest(SoupTest):
     def test_csv(self):
         self.event.vouchers.create(item=self.ticket, code='ABCDEFG')
         doc = self.client.get('/control/event/%s/%s/vouchers/?download=yes' % (self.orga.slug, self.event.slug))
-        assert doc.content.strip() == '"Voucher code","Valid until","Product","Reserve quota","Bypass quota","Price",' \
-                                      '"Tag","Redeemed"\r\n"ABCDEFG","","Early-bird ticket","No","No","","",' \
-                                      '"No"'.encode('utf-8')
+        assert b''.join(doc.streaming_content).strip() == '"Voucher code","Valid until","Product","Reserve quota","Bypass quota","Price",' \
+                                                          '"Tag","Redeemed"\r\n"ABCDEFG","","Early-bird ticket","No","No","","",' \
+                                                          '"No"'.encode('utf-8')
 
     def test_filter_status_valid(self):
         v = self.event.vouchers.create(item=self.ticket)
@@ -1,10 +1,24 @@
 import pytest
 from django.conf import settings
-from django.test.utils import override_settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.urlresolvers import set_urlconf
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils.timezone import now
 
 from pretix.base.models import Event, Organizer
+from pretix.multidomain.middlewares import MultiDomainMiddleware
 from pretix.multidomain.models import KnownDomain
+from pretix.multidomain.routing import _routing_cache, get_route
+from pretix.presale.utils import _detect_event
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'multidomain-routing',
+    }
+}
 
 
 @pytest.fixture
@@ -105,3 +119,80 @@ def test_with_forwarded_host(env, client):
     r = client.get('/2015/', HTTP_X_FORWARDED_HOST='foobar')
     assert r.status_code == 200
     settings.USE_X_FORWARDED_HOST = False
+
+
+def _route_request(host, path):
+    request = RequestFactory().get(path, HTTP_HOST=host)
+    request.user = AnonymousUser()
+    request.session = {}
+    try:
+        MultiDomainMiddleware().process_request(request)
+        response = _detect_event(request)
+    finally:
+        set_urlconf(None)
+    return request, response
+
+
+@pytest.mark.django_db
+@override_settings(CACHES=LOCMEM_CACHES)
+@pytest.mark.parametrize('host,path', [('foobar', '/2015/'), ('example.com', '/dummy/1234/')])
+def test_routing_without_queries(env, host, path):
+    organizer2 = Organizer.objects.create(name='Dummy', slug='dummy')
+    Event.objects.create(organizer=organizer2, name='D1234', slug='1234', date_from=now(), live=True)
+    KnownDomain.objects.create(domainname='foobar', organizer=env[0])
+    _route_request(host, path)
+
+    with CaptureQueriesContext(connection) as ctx:
+        request, response = _route_request(host, path)
+    assert response is None
+    assert request.event.slug == path.strip('/').split('/')[-1]
+    assert request.event.organizer == request.organizer
+    assert len(ctx.captured_queries) == 0
+
+
+@pytest.mark.django_db
+@override_settings(CACHES=LOCMEM_CACHES)
+def test_routing_invalidation(env):
+    assert get_route(domain='foobar') is None
+    KnownDomain.objects.create(domainname='foobar', organizer=env[0])
+    route = get_route(domain='foobar')
+    assert route.organizer == env[0]
+    assert route.domain == 'foobar'
+
+    route.get_event('2015')
+    with pytest.raises(Event.DoesNotExist):
+        route.get_event('2016')
+    Event.objects.create(organizer=env[0], name='MRMCD2016', slug='2016', date_from=now())
+    assert get_route(organizer='mrmcd').get_event('2016').name == 'MRMCD2016'
+
+    # Saving an event only invalidates the route of this event
+    with CaptureQueriesContext(connection) as ctx:
+        assert get_route(domain='foobar').get_event('2015').slug == '2015'
+    assert len(ctx.captured_queries) == 0
+
+    env[1].name = 'MRMCD 2015'
+    env[1].save()
+    assert str(get_route(domain='foobar').get_event('2015').name) == 'MRMCD 2015'
+
+    KnownDomain.objects.get(domainname='foobar').delete()
+    assert get_route(domain='foobar') is None
+    assert get_route(organizer='mrmcd').domain is None
+
+
+@pytest.mark.django_db
+@override_settings(CACHES=LOCMEM_CACHES)
+def test_routing_invalidation_renamed_domain(env):
+    other = Organizer.objects.create(name='CCC', slug='ccc')
+    KnownDomain.objects.create(domainname='foobar', organizer=env[0])
+    assert get_route(domain='foobar').organizer == env[0]
+    assert get_route(organizer='ccc').domain is None
+
+    kd = KnownDomain.objects.get(domainname='foobar')
+    kd.domainname = 'barfoo'
+    kd.organizer = other
+    kd.save()
+    # The entries for the old name and for both organizers are gone
+    assert _routing_cache().get('domain:foobar') is None
+    assert _routing_cache().get('organizer:mrmcd') is None
+    assert get_route(domain='barfoo').organizer == other
+    assert get_route(organizer='ccc').domain == 'barfoo'
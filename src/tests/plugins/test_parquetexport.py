@@ -0,0 +1,57 @@
+import io
+from datetime import timedelta
+from decimal import Decimal
+from zipfile import ZipFile
+
+import pytest
+from django.utils.timezone import now
+
+from pretix.base.models import (
+    Event, InvoiceAddress, Item, Order, OrderPosition, Organizer,
+)
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy',
+        date_from=now(), plugins='pretix.plugins.parquetexport'
+    )
+    ticket = Item.objects.create(event=event, name='Early-bird ticket', default_price=23, admission=True)
+    for i, status in enumerate((Order.STATUS_PAID, Order.STATUS_PAID, Order.STATUS_PENDING)):
+        o = Order.objects.create(
+            code='FOO%d' % i, event=event, email='dummy@dummy.test', status=status,
+            datetime=now(), expires=now() + timedelta(days=10),
+            total=Decimal('23.00'), payment_provider='banktransfer', locale='en'
+        )
+        OrderPosition.objects.create(order=o, item=ticket, variation=None, price=Decimal('23.00'),
+                                     attendee_name='Peter %d' % i)
+    InvoiceAddress.objects.create(order=o, name='Peter', street='Main St', zipcode='12345', city='Berlin',
+                                  country='Germany')
+    return event
+
+
+@pytest.mark.django_db
+def test_parquet_export(env):
+    from pretix.plugins.parquetexport.exporters import ParquetExporter
+
+    ex = ParquetExporter(env)
+    ex.chunk_size = 1
+    filename, filetype, data = ex.render({'paid_only': True})
+    assert filetype == 'application/zip'
+
+    with ZipFile(io.BytesIO(data)) as zipf:
+        assert sorted(zipf.namelist()) == ['answers.parquet', 'invoice_addresses.parquet', 'orders.parquet',
+                                           'positions.parquet']
+        orders = pq.read_table(io.BytesIO(zipf.read('orders.parquet'))).to_pydict()
+        positions = pq.read_table(io.BytesIO(zipf.read('positions.parquet'))).to_pydict()
+        addresses = pq.read_table(io.BytesIO(zipf.read('invoice_addresses.parquet'))).to_pydict()
+
+    assert orders['code'] == ['FOO0', 'FOO1']
+    assert orders['total'] == [Decimal('23.00'), Decimal('23.00')]
+    assert positions['order'] == ['FOO0', 'FOO1']
+    assert positions['attendee_name'] == ['Peter 0', 'Peter 1']
+    assert addresses['order'] == []
@@ -4,13 +4,18 @@ from decimal import Decimal
 
 from bs4 import BeautifulSoup
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 
 from pretix.base.models import (
     CartPosition, Event, Item, ItemCategory, ItemVariation, Organizer,
     Question, QuestionAnswer, Quota, Voucher,
 )
+from pretix.base.services.cart import (
+    CartError, _add_items_to_cart, _remove_items_from_cart,
+)
 
 
 class CartTestMixin:
@@ -400,6 +405,26 @@ class CartTest(CartTestMixin, TestCase):
         self.assertIn('no longer available', doc.select('.alert-danger')[0].text)
         self.assertFalse(CartPosition.objects.filter(id=cp1.id).exists())
 
+    def test_renew_expired_partially(self):
+        self.quota_shirts.size = 0
+        self.quota_shirts.save()
+        cp1 = CartPosition.objects.create(
+            event=self.event, cart_id=self.session_key, item=self.ticket,
+            price=23, expires=now() - timedelta(minutes=10)
+        )
+        cp2 = CartPosition.objects.create(
+            event=self.event, cart_id=self.session_key, item=self.shirt, variation=self.shirt_red,
+            price=14, expires=now() - timedelta(minutes=10)
+        )
+        with self.assertRaises(CartError):
+            _add_items_to_cart(self.event, [
+                {'item': self.ticket.id, 'variation': None, 'count': 1, 'price': '', 'voucher': None}
+            ], self.session_key)
+        # The position that could be renewed is kept, the other one is cleaned up
+        self.assertGreater(CartPosition.objects.get(id=cp1.id).expires, now())
+        self.assertFalse(CartPosition.objects.filter(id=cp2.id).exists())
+        self.assertEqual(CartPosition.objects.filter(cart_id=self.session_key, event=self.event).count(), 2)
+
     def test_remove_simple(self):
         CartPosition.objects.create(
             event=self.event, cart_id=self.session_key, item=self.ticket,
@@ -476,6 +501,33 @@ class CartTest(CartTestMixin, TestCase):
         self.assertIsNone(objs[0].variation)
         self.assertEqual(objs[0].price, 20)
 
+    def test_remove_matching_price_first(self):
+        for price in (23, 20, 25, 20):
+            CartPosition.objects.create(
+                event=self.event, cart_id=self.session_key, item=self.ticket,
+                price=price, expires=now() + timedelta(minutes=10)
+            )
+        _remove_items_from_cart(self.event, [
+            {'item': self.ticket.id, 'variation': None, 'count': 3, 'price': '20,00'}
+        ], self.session_key)
+        # Both positions with the given price are removed, then the most expensive one
+        prices = CartPosition.objects.filter(cart_id=self.session_key, event=self.event).values_list('price', flat=True)
+        self.assertEqual(list(prices), [23])
+
+    def test_remove_more_than_existing(self):
+        CartPosition.objects.create(
+            event=self.event, cart_id=self.session_key, item=self.ticket,
+            price=23, expires=now() + timedelta(minutes=10)
+        )
+        shirt = CartPosition.objects.create(
+            event=self.event, cart_id=self.session_key, item=self.shirt, variation=self.shirt_red,
+            price=14, expires=now() + timedelta(minutes=10)
+        )
+        _remove_items_from_cart(self.event, [
+            {'item': self.ticket.id, 'variation': None, 'count': 5, 'price': ''}
+        ], self.session_key)
+        self.assertEqual(list(CartPosition.objects.filter(cart_id=self.session_key, event=self.event)), [shirt])
+
     def test_voucher(self):
         v = Voucher.objects.create(item=self.ticket, event=self.event)
         self.client.post('/%s/%s/cart/add' % (self.orga.slug, self.event.slug), {
@@ -644,6 +696,26 @@ class CartTest(CartTestMixin, TestCase):
         self.assertIn('already used', doc.select('.alert-danger')[0].text)
         self.assertEqual(1, CartPosition.objects.filter(cart_id=self.session_key, event=self.event).count())
 
+    def test_queries_independent_of_amount(self):
+        v = Voucher.objects.create(item=self.ticket, price=Decimal('12.00'), event=self.event)
+        queries = []
+        for cart_id, amount in (('one', 1), ('five', 5)):
+            with CaptureQueriesContext(connection) as ctx:
+                _add_items_to_cart(self.event, [
+                    {'item': self.ticket.id, 'variation': None, 'count': amount, 'price': '', 'voucher': v.code}
+                ], cart_id)
+            queries.append(len(ctx.captured_queries))
+            self.assertEqual(amount, CartPosition.objects.filter(cart_id=cart_id, voucher=v).count())
+        self.assertEqual(queries[0], queries[1])
+
+    def test_valid_line_kept_on_later_voucher_error(self):
+        with self.assertRaises(CartError):
+            _add_items_to_cart(self.event, [
+                {'item': self.ticket.id, 'variation': None, 'count': 2, 'price': '', 'voucher': None},
+                {'item': self.ticket.id, 'variation': None, 'count': 1, 'price': '', 'voucher': 'ABC'},
+            ], 'mixed')
+        self.assertEqual(CartPosition.objects.filter(cart_id='mixed', event=self.event, voucher__isnull=True).count(), 2)
+
     def test_require_voucher(self):
         v = Voucher.objects.create(quota=self.quota_shirts, event=self.event)
         self.shirt.require_voucher = True
@@ -2,14 +2,17 @@ import datetime
 from decimal import Decimal
 
 from django.core import mail
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from tests.base import SoupTest
 
 from pretix.base.models import (
     Event, EventPermission, Item, ItemCategory, ItemVariation, Order,
-    Organizer, Quota, User,
+    OrderPosition, Organizer, Quota, User,
 )
+from pretix.presale.views.event import get_grouped_items
 
 
 class EventTestMixin:
@@ -165,6 +168,47 @@ class ItemDisplayTest(EventTestMixin, SoupTest):
         self.assertIn("Black", doc.select("section:nth-of-type(1) div.variation")[1].text)
         self.assertIn("12.00", doc.select("section:nth-of-type(1) div.variation")[1].text)
 
+    def test_grouped_items_queries(self):
+        q = Quota.objects.create(event=self.event, name='Quota', size=2)
+
+        def add_items(n):
+            for i in range(n):
+                q.items.add(Item.objects.create(event=self.event, name='Ticket %d' % i, default_price=12))
+
+        add_items(2)
+        get_grouped_items(self.event)  # warm up the settings
+        with CaptureQueriesContext(connection) as ctx:
+            items, display_add_to_cart = get_grouped_items(self.event)
+        add_items(3)
+        with CaptureQueriesContext(connection) as ctx2:
+            items, display_add_to_cart = get_grouped_items(self.event)
+        self.assertEqual(len(items), 5)
+        self.assertEqual(len(ctx.captured_queries), len(ctx2.captured_queries))
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    })
+    def test_availability_cache(self):
+        self.event.settings.set('presale_availability_cache_ttl', 30)
+        q = Quota.objects.create(event=self.event, name='Quota', size=1)
+        item = Item.objects.create(event=self.event, name='Early-bird ticket', default_price=0)
+        q.items.add(item)
+        doc = self.get_doc('/%s/%s/' % (self.orga.slug, self.event.slug))
+        self.assertEqual(len(doc.select(".availability-box.available")), 1)
+
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + datetime.timedelta(days=3), total=0)
+        OrderPosition.objects.create(order=order, item=item, price=0)
+        doc = self.get_doc('/%s/%s/' % (self.orga.slug, self.event.slug))
+        self.assertEqual(len(doc.select(".availability-box.available")), 1)
+
+        self.event.get_cache().delete('item_availability')
+        doc = self.get_doc('/%s/%s/' % (self.orga.slug, self.event.slug))
+        self.assertEqual(len(doc.select(".availability-box.available")), 0)
+
 
 class VoucherRedeemItemDisplayTest(EventTestMixin, SoupTest):
     def setUp(self):